@@ -1,3 +1,141 @@
+import operator
+from functools import reduce
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+from .models import Event, Friendship, Location, Participant, Post, Profile, Tag
+
+
+# Above every other character, '^' searches are ranges up to term + this
+PREFIX_END = chr(0x10ffff)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows, past that an
+    unfiltered table is estimated from its largest id, which deletes make
+    an overestimate, and a filtered one is cut off at the limit
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        queryset = self.object_list.order_by()
+        counted = queryset[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        if not queryset.query.where:
+            return queryset.aggregate(last=Max('pk'))['last']
+        return limit
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelists run a fixed number of queries whatever the size of the
+    table: related objects in list_display are joined by list_select_related,
+    the count is bounded by EstimatedCountPaginator and searches are
+    answered from indexes, see get_search_results. Dates are filtered with
+    DateFieldListFilter on indexed columns, date_hierarchy would truncate
+    the date of every row to list its choices. Relations are edited with
+    raw id widgets instead of selects listing the whole table.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Unlike the default case insensitive substring search, matches the
+        term exactly to '=field' search_fields and as a prefix to '^field'
+        ones, with comparisons an index can answer, and to the id when it
+        is a number
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        conditions = [Q(pk=int(term))] if term.isdigit() else []
+        for field in self.search_fields:
+            if field.startswith('^'):
+                conditions.append(Q(**{field[1:] + '__gte': term, field[1:] + '__lt': term + PREFIX_END}))
+            else:
+                conditions.append(Q(**{field.lstrip('='): term}))
+        return queryset.filter(reduce(operator.or_, conditions)), False
+
+
+class WithDeletedAdmin(ScalableAdmin):
+    """
+    Also lists the rows that are soft deleted until their purge job ran,
+    see events/deletion.py
+    """
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+
+@admin.register(Event)
+class EventAdmin(WithDeletedAdmin):
+    list_display = ('id', 'title', 'starts_at', 'organizer', 'location', 'post_count', 'deleted_time')
+    list_select_related = ('organizer', 'location')
+    raw_id_fields = ('organizer', 'location')
+    readonly_fields = ('starts_at', 'ends_at', 'post_count', 'deleted_time')
+    list_filter = (('starts_at', admin.DateFieldListFilter),)
+    search_fields = ('^title',)
+
+
+@admin.register(Participant)
+class ParticipantAdmin(ScalableAdmin):
+    list_display = ('id', 'event', 'user', 'status', 'timestamp')
+    list_select_related = ('event', 'user')
+    raw_id_fields = ('event', 'user')
+    list_filter = ('status', ('timestamp', admin.DateFieldListFilter))
+    search_fields = ('=user__username',)
+
+
+@admin.register(Location)
+class LocationAdmin(ScalableAdmin):
+    list_display = ('id', 'city', 'country', 'street', 'google_id', 'latitude', 'longitude')
+    readonly_fields = ('lat_rad', 'lng_rad', 'sin_lat', 'cos_lat', 'sin_lng', 'cos_lng')
+    search_fields = ('=google_id',)
+
+
+@admin.register(Profile)
+class ProfileAdmin(WithDeletedAdmin):
+    list_display = ('id', 'user', 'first_name', 'last_name', 'location', 'deleted_time')
+    list_select_related = ('user', 'location')
+    raw_id_fields = ('user', 'location', 'friends')
+    readonly_fields = ('deleted_time',)
+    search_fields = ('=user__username',)
+
+
+@admin.register(Tag)
+class TagAdmin(ScalableAdmin):
+    list_display = ('id', 'text')
+    raw_id_fields = ('events',)
+    search_fields = ('^text',)
+
+
+@admin.register(Post)
+class PostAdmin(ScalableAdmin):
+    list_display = ('id', 'title', 'event', 'user', 'created_time')
+    list_select_related = ('event', 'user')
+    raw_id_fields = ('event', 'user')
+    list_filter = (('timestamp', admin.DateFieldListFilter),)
+    search_fields = ('=user__username',)
+
 
-# Register your models here.
+@admin.register(Friendship)
+class FriendshipAdmin(ScalableAdmin):
+    list_display = ('id', 'requested_by', 'status', 'timestamp')
+    list_select_related = ('requested_by',)
+    raw_id_fields = ('requested_by', 'profiles')
+    list_filter = ('status', ('timestamp', admin.DateFieldListFilter))
+    search_fields = ('=requested_by__username',)
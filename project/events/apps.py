@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class EventsConfig(AppConfig):
     name = 'events'
+
+    def ready(self):
+        from .models import VERSIONED_MODELS, count_deletion
+        for label in VERSIONED_MODELS:
+            post_delete.connect(count_deletion, sender=label, dispatch_uid='count_deletion:' + label)
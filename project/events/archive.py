@@ -0,0 +1,111 @@
+"""
+Events that ended more than ARCHIVE_AFTER_DAYS ago are moved with their
+participants, posts, tags and snapshots from the primary to the archive
+database, a batch at a time. Nearly every query asks for upcoming events,
+so the tables and indexes on the hot path stay the size of the active data.
+
+Archived rows keep their primary keys. Lookups by id fall back to the
+archive through get() and ObjectCache.get(archived=True), and relations of
+an archived instance are read from the archive by project/routers.py,
+except users and locations, which only live in the primary.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import VERSIONED_MODELS, Event, Participant, ParticipantSnapshot, Post, Recommendation, Tag, Watermark, deletions_key
+
+
+# Rows moved along with their event, all point to it through event_id
+CHILDREN = (Participant, Post, ParticipantSnapshot, Tag.events.through)
+
+
+def get(model, pk):
+    """
+    The instance with the given pk from the primary or else the archive,
+    raises DoesNotExist like the manager
+    """
+    try:
+        return model._default_manager.get(pk=pk)
+    except model.DoesNotExist:
+        return model._default_manager.using(settings.ARCHIVE_DATABASE).get(pk=pk)
+
+
+def copy_rows(objs, using):
+    """
+    Insert instances as they are, bulk_create would reset the auto_now
+    timestamps
+    """
+    if not objs:
+        return
+    model = type(objs[0])
+    connection = connections[using]
+    fields = model._meta.concrete_fields
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+            for obj in objs
+        ])
+
+
+def delete_rows(model, using, **filters):
+    # A single DELETE, without loading the rows for the signals
+    return model._base_manager.using(using).filter(**filters)._raw_delete(using)
+
+
+def archive_batch(event_ids):
+    """
+    Move the given events and their children to the archive. The archive
+    commits first, a failure before the primary commits leaves copies that
+    the next run replaces.
+    """
+    archive = settings.ARCHIVE_DATABASE
+    with transaction.atomic():
+        events = list(Event.objects.filter(pk__in=event_ids))
+        event_ids = [event.pk for event in events]
+        children = [(model, list(model._base_manager.filter(event_id__in=event_ids))) for model in CHILDREN]
+        tag_ids = {link.tag_id for link in children[-1][1]}
+
+        with transaction.atomic(using=archive):
+            delete_rows(Event, archive, pk__in=event_ids)
+            for model in CHILDREN:
+                delete_rows(model, archive, event_id__in=event_ids)
+            archived_tags = set(Tag.objects.using(archive).filter(pk__in=tag_ids).values_list('pk', flat=True))
+            copy_rows(list(Tag.objects.filter(pk__in=tag_ids - archived_tags)), archive)
+            copy_rows(events, archive)
+            for model, objs in children:
+                copy_rows(objs, archive)
+
+        # Recommendations are only for upcoming events
+        delete_rows(Recommendation, 'default', event_id__in=event_ids)
+        for model, objs in children:
+            delete_rows(model, 'default', event_id__in=event_ids)
+            if objs and model._meta.label in VERSIONED_MODELS:
+                Watermark.increment(deletions_key(model))
+        # Through the collector for the signals, which invalidate the
+        # cached events and count the deletions
+        Event.objects.filter(pk__in=event_ids).delete()
+    return len(event_ids)
+
+
+def archive_events(before=None, batch_size=None):
+    """
+    Archive the events that ended before `before`, ARCHIVE_AFTER_DAYS ago
+    by default. Returns the number of events archived.
+    """
+    if before is None:
+        before = timezone.now() - datetime.timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    archived = 0
+    while True:
+        event_ids = list(Event.objects.filter(ends_at__lt=before).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not event_ids:
+            return archived
+        archived += archive_batch(event_ids)
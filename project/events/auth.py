@@ -0,0 +1,112 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from graphql_jwt.exceptions import GraphQLJWTError
+from graphql_jwt.utils import get_authorization_header, get_payload
+
+from .cache import TTLCache
+from .models import Profile
+
+
+# Verified payloads by token, kept until the token expires
+claims_cache = TTLCache(maxsize=10000)
+# Users with their profile by pk, and the pk of each username
+users_cache = TTLCache(maxsize=10000)
+user_ids_cache = TTLCache(maxsize=10000)
+
+
+def get_claims(token):
+    payload = claims_cache.get(token)
+    if payload is None:
+        payload = get_payload(token)
+        ttl = settings.AUTH_CLAIMS_CACHE_SECONDS
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        claims_cache.set(token, payload, ttl)
+    return payload
+
+
+def load_user(username):
+    User = get_user_model()
+    try:
+        return User._default_manager.select_related('profile').get(**{User.USERNAME_FIELD: username})
+    except User.DoesNotExist:
+        return None
+
+
+def get_user(payload):
+    """
+    The user of a verified payload with the profile loaded. Every request gets
+    its own copy, a cached instance is never shared between requests.
+    """
+    username = payload.get(get_user_model().USERNAME_FIELD)
+    if not username:
+        raise GraphQLJWTError('Invalid payload')
+
+    ttl = settings.AUTH_USER_CACHE_SECONDS
+    pk = user_ids_cache.get(username)
+    user = users_cache.get(pk) if pk is not None else None
+
+    if user is None or user.get_username() != username:
+        user = load_user(username)
+        if user is None:
+            return None
+        users_cache.set(user.pk, user, ttl)
+        user_ids_cache.set(username, user.pk, ttl)
+
+    if not user.is_active:
+        raise GraphQLJWTError('User is disabled')
+    return copy.deepcopy(user)
+
+
+class CachedJSONWebTokenMiddleware(MiddlewareMixin):
+    """
+    Same contract as graphql_jwt's JSONWebTokenMiddleware, but a known token
+    reaches the resolvers without any authentication queries
+    """
+
+    def process_request(self, request):
+        token = get_authorization_header(request)
+        if token is None:
+            return
+        if hasattr(request, 'user') and not request.user.is_anonymous:
+            return
+
+        try:
+            user = get_user(get_claims(token))
+        except GraphQLJWTError as err:
+            return JsonResponse({
+                'errors': [{'message': str(err)}],
+            }, status=401)
+
+        if user is not None:
+            request.user = request._cached_user = user
+
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+def clear():
+    claims_cache.clear()
+    users_cache.clear()
+    user_ids_cache.clear()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    users_cache.delete(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    users_cache.delete(instance.user_id)
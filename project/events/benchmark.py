@@ -0,0 +1,188 @@
+import datetime
+import math
+import platform
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Event, Location, Profile
+
+
+# Every operation runs with the same variables on every run, the dynamic
+# parts (a user, a location) are picked deterministically from the data
+OPERATIONS = [
+    {
+        'name': 'events_all',
+        'query': 'query { events(filterType: "ALL", first: 50) { id title startDate location { city } } }',
+    },
+    {
+        'name': 'events_nearby',
+        'query': '''query ($lat: Float, $lng: Float) {
+            events(filterType: "NEARBY", latitude: $lat, longitude: $lng, proximity: 10, first: 50) {
+                id title location { city } } }''',
+        'variables': lambda ctx: {'lat': ctx['latitude'], 'lng': ctx['longitude']},
+    },
+    {
+        'name': 'events_going',
+        'query': 'query { events(filterType: "GOING", first: 50) { id title } }',
+        'auth': True,
+    },
+    {
+        'name': 'discover_events',
+        'query': '''query ($lat: Float!, $lng: Float!) {
+            discoverEvents(lat: $lat, lng: $lng, radiusKm: 10, tags: ["music", "food"], first: 50) {
+                id title distance } }''',
+        'variables': lambda ctx: {'lat': ctx['latitude'], 'lng': ctx['longitude']},
+    },
+    {
+        'name': 'profiles_search',
+        'query': 'query { profiles(search: "anna stockholm", first: 50) { id firstName lastName } }',
+    },
+    {
+        'name': 'tags_autocomplete',
+        'query': 'query { tags(search: "o", first: 10) { id text } }',
+    },
+    {
+        'name': 'my_friends',
+        'query': 'query { myFriends { id status } }',
+        'auth': True,
+    },
+    {
+        'name': 'create_event',
+        'query': '''mutation ($event: EventInput!, $location: LocationInput!) {
+            createEvent(eventData: $event, locationData: $location) { event { id } } }''',
+        'variables': lambda ctx: {
+            'event': {
+                'title': 'Benchmark',
+                'description': 'Created by the benchmark',
+                'startDate': ctx['tomorrow'].isoformat(),
+                'startTime': '18:00:00',
+                'minParticipants': 1,
+                'maxParticipants': 10,
+            },
+            'location': {'city': 'Stockholm', 'country': 'Sweden', 'street': 'Drottninggatan 1'},
+        },
+        'auth': True,
+        'rollback': True,
+    },
+]
+
+
+def stub_geocoder(country, city, street):
+    return (59.3293, 18.0686, 'benchmark-place', '{}, {}, {}'.format(street, city, country))
+
+
+@contextmanager
+def stubbed_geocoder():
+    with mock.patch('events.utilities.get_google_geo_info', stub_geocoder):
+        yield
+
+
+def benchmark_context():
+    """
+    Pick the user and coordinates the catalogue runs with
+    """
+    profile = Profile.objects.select_related('user', 'location').order_by('pk').first()
+    location = Location.objects.order_by('pk').first()
+    if profile is None or location is None:
+        raise ValueError('No data to benchmark against, run seed_synthetic first')
+
+    return {
+        'user': profile.user,
+        'latitude': float(location.latitude),
+        'longitude': float(location.longitude),
+        'tomorrow': (timezone.now() + datetime.timedelta(days=1)).date(),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(math.ceil(fraction * len(ordered))) - 1, len(ordered) - 1)
+    return ordered[max(index, 0)]
+
+
+def execute_operation(schema, operation, ctx):
+    request = RequestFactory().post('/graphql/')
+    request.user = ctx['user'] if operation.get('auth') else AnonymousUser()
+    variables = operation['variables'](ctx) if 'variables' in operation else None
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        if operation.get('rollback'):
+            with transaction.atomic():
+                result = schema.execute(operation['query'], variable_values=variables, context_value=request)
+                transaction.set_rollback(True)
+        else:
+            result = schema.execute(operation['query'], variable_values=variables, context_value=request)
+        elapsed = time.perf_counter() - start
+
+    if result.errors:
+        raise RuntimeError('{} failed: {}'.format(operation['name'], result.errors))
+    return elapsed, len(queries)
+
+
+def run_catalogue(schema, iterations=50, warmup=5, only=None):
+    """
+    Execute every operation in the catalogue and return a JSON serializable
+    report with latency percentiles in milliseconds and query counts
+    """
+    ctx = benchmark_context()
+    results = {}
+
+    with stubbed_geocoder():
+        for operation in OPERATIONS:
+            if only and operation['name'] not in only:
+                continue
+
+            for _ in range(warmup):
+                execute_operation(schema, operation, ctx)
+
+            timings, query_counts = [], []
+            for _ in range(iterations):
+                elapsed, queries = execute_operation(schema, operation, ctx)
+                timings.append(elapsed * 1000)
+                query_counts.append(queries)
+
+            results[operation['name']] = {
+                'iterations': iterations,
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p90_ms': round(percentile(timings, 0.90), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': max(query_counts),
+            }
+
+    return {
+        'created': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'rows': {
+            'users': get_user_model().objects.count(),
+            'events': Event.objects.count(),
+            'locations': Location.objects.count(),
+        },
+        'operations': results,
+    }
+
+
+def compare(baseline, current):
+    """
+    Return (name, baseline p50, current p50, ratio, baseline queries, current queries)
+    for the operations present in both reports
+    """
+    rows = []
+    for name, result in current['operations'].items():
+        before = baseline['operations'].get(name)
+        if not before:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        rows.append((name, before['p50_ms'], result['p50_ms'], ratio, before['queries'], result['queries']))
+    return rows
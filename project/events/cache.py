@@ -0,0 +1,213 @@
+import collections
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import archive, pubsub
+from .models import Event, Location, Post, Profile
+
+
+class TTLCache:
+    """
+    Thread safe LRU mapping whose entries also expire after ttl seconds.
+    Keeps hit and miss counters for the stats.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ObjectCache:
+    """
+    Read through cache of model instances by primary key. Lookups go to the
+    identity map of the request first, then to a process wide TTLCache and
+    last to the database. Saves and deletes in this process invalidate the
+    entry, other processes see changes once the entry expires, or at once
+    when they are published with publish_invalidation.
+    """
+
+    def __init__(self, model, maxsize=None, ttl=None):
+        self.model = model
+        self.label = model._meta.label_lower
+        self.entries = TTLCache(
+            maxsize=maxsize or settings.OBJECT_CACHE_SIZE,
+            ttl=settings.OBJECT_CACHE_SECONDS if ttl is None else ttl)
+        self.request_hits = 0
+
+    def identity_map(self, request):
+        if request is None:
+            return {}
+        if not hasattr(request, '_object_cache'):
+            request._object_cache = {}
+        return request._object_cache
+
+    def get(self, pk, request=None, archived=False):
+        """
+        The instance with the given pk, raises DoesNotExist like the manager.
+        Instances are copies, one per request, so they can be changed freely.
+        With archived, instances moved to the archive database are found too.
+        """
+        pk = int(pk)
+        identity_map = self.identity_map(request)
+        instance = identity_map.get((self.label, pk))
+        if instance is not None:
+            self.request_hits += 1
+        else:
+            # Requests with an ETag read the database, see project/etags.py
+            bypass = getattr(request, '_bypass_object_cache', False)
+            cached = None if bypass else self.entries.get(pk)
+            if cached is None:
+                cached = archive.get(self.model, pk) if archived else self.model._default_manager.get(pk=pk)
+                self.entries.set(pk, copy.deepcopy(cached))
+                instance = cached
+            else:
+                instance = copy.deepcopy(cached)
+            identity_map[(self.label, pk)] = instance
+
+        if not archived and instance._state.db == settings.ARCHIVE_DATABASE:
+            raise self.model.DoesNotExist('{} matching query does not exist.'.format(self.model._meta.object_name))
+        return instance
+
+    def invalidate(self, pk):
+        self.entries.delete(pk)
+        # Another thread can read the old row again until the write commits
+        transaction.on_commit(lambda: self.entries.delete(pk))
+
+    def clear(self):
+        self.entries.clear()
+        self.request_hits = 0
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats['request_hits'] = self.request_hits
+        lookups = stats['hits'] + stats['misses'] + self.request_hits
+        stats['hit_ratio'] = (stats['hits'] + self.request_hits) / lookups if lookups else 0.0
+        return stats
+
+
+event_cache = ObjectCache(Event)
+profile_cache = ObjectCache(Profile)
+location_cache = ObjectCache(Location)
+
+object_caches = {cache.label: cache for cache in (event_cache, profile_cache, location_cache)}
+
+
+def clear():
+    for cache in object_caches.values():
+        cache.clear()
+
+
+INVALIDATIONS_TOPIC = 'object-cache'
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def publish_invalidation(cache, pks):
+    """
+    Invalidate entries in this process now and in the processes listening
+    to the pub/sub broker once the transaction commits
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    for pk in pks:
+        cache.invalidate(pk)
+    transaction.on_commit(lambda: pubsub.broker().publish(INVALIDATIONS_TOPIC, cache.label, pks))
+
+
+def listen_for_invalidations():
+    """
+    Apply the published invalidations in a thread of this process, started
+    once per server process after the fork
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            subscription = pubsub.broker().subscribe(INVALIDATIONS_TOPIC)
+            _listener = threading.Thread(
+                target=apply_invalidations, args=(subscription,), name='object-cache-invalidations', daemon=True)
+            _listener.start()
+
+
+def apply_invalidations(subscription):
+    while True:
+        message = subscription.get(timeout=1)
+        if message is not None:
+            for pk in message.data:
+                object_caches[message.kind].entries.delete(pk)
+        elif subscription.closed:
+            return
+
+
+# Only for the cached models, a receiver for every sender would turn off
+# the fast deletes of all the others
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def object_changed(sender, instance, **kwargs):
+    object_caches[sender._meta.label_lower].invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    # post_count is updated with a queryset update, which sends no signal
+    event_cache.invalidate(instance.event_id)
@@ -0,0 +1,130 @@
+"""
+Deleting an event or an account in a request only marks it deleted, which
+hides it from every query through the default managers. The purge jobs
+then delete the dependent rows a batch per transaction, so no single
+transaction holds the database long enough to stall the other writers.
+Batches are deleted without signals, so purges leave no RSVP history and
+count their deletes once per batch.
+"""
+import collections
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import event_cache, profile_cache, publish_invalidation
+from .jobs import enqueue
+from .models import (
+    VERSIONED_MODELS, Event, Friendship, Participant, ParticipantSnapshot, Post, Profile, Recommendation, Tag,
+    Watermark, deletions_key,
+)
+
+
+def soft_delete_event(event):
+    event.deleted_time = timezone.now()
+    event.save(update_fields=['deleted_time', 'timestamp'])
+    publish_invalidation(event_cache, [event.pk])
+    enqueue('purge_event', key='purge-event-{}'.format(event.pk), event_id=event.pk)
+
+
+def soft_delete_account(user):
+    """
+    Disable the user and hide their profile, organized events,
+    participations and posts
+    """
+    now = timezone.now()
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    profile_ids = []
+    for profile in Profile.objects.filter(user=user):
+        profile.deleted_time = now
+        profile.save(update_fields=['deleted_time', 'timestamp'])
+        profile_ids.append(profile.pk)
+    events = Event.objects.filter(organizer=user)
+    event_ids = list(events.values_list('pk', flat=True))
+    events.update(deleted_time=now, timestamp=now)
+    # Other processes only hear of the changes through the broker, and a
+    # queryset update doesn't send the signals the cache listens to
+    publish_invalidation(profile_cache, profile_ids)
+    publish_invalidation(event_cache, event_ids)
+    enqueue('purge_account', key='purge-account-{}'.format(user.pk), user_id=user.pk)
+
+
+def hide_deleted_users(queryset):
+    """
+    Leave out the rows of accounts deleted but not purged yet. Users only
+    live in the primary, archived rows are filtered by id.
+    """
+    if queryset.db != settings.ARCHIVE_DATABASE:
+        return queryset.filter(user__is_active=True)
+    user_ids = set(queryset.values_list('user_id', flat=True))
+    inactive = get_user_model().objects.filter(pk__in=user_ids, is_active=False).values_list('pk', flat=True)
+    return queryset.exclude(user_id__in=list(inactive))
+
+
+def delete_in_batches(queryset, batch_size=None, on_batch=None):
+    """
+    Delete the rows of queryset batch_size at a time, each batch in its own
+    transaction with a single DELETE. on_batch is called with the ids of
+    every batch before it is deleted. Returns the number of rows deleted.
+    """
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            if on_batch is not None:
+                on_batch(ids)
+            batch = model._base_manager.filter(pk__in=ids)
+            batch._raw_delete(batch.db)
+            if model._meta.label in VERSIONED_MODELS:
+                Watermark.increment(deletions_key(model))
+        deleted += len(ids)
+
+
+def uncount_posts(post_ids):
+    # What post_deleted does for every post, which raw deletes skip
+    removed = collections.Counter(Post.objects.filter(pk__in=post_ids).values_list('event_id', flat=True))
+    for event_id, count in removed.items():
+        Event.all_objects.filter(pk=event_id, post_count__gte=count)\
+            .update(post_count=F('post_count') - count, timestamp=timezone.now())
+        event_cache.invalidate(event_id)
+
+
+def unlink_friendships(friendship_ids):
+    Friendship.profiles.through.objects.filter(friendship_id__in=friendship_ids).delete()
+
+
+def purge_event(event_id):
+    event = Event.all_objects.filter(pk=event_id, deleted_time__isnull=False).first()
+    if event is None:
+        return
+    delete_in_batches(Participant.objects.filter(event_id=event_id))
+    delete_in_batches(Post.objects.filter(event_id=event_id))
+    delete_in_batches(Tag.events.through.objects.filter(event_id=event_id))
+    delete_in_batches(Recommendation.objects.filter(event_id=event_id))
+    delete_in_batches(ParticipantSnapshot.objects.filter(event_id=event_id))
+    # Only the row itself is left for the collector
+    event.delete()
+
+
+def purge_account(user_id):
+    user = get_user_model()._base_manager.filter(pk=user_id, is_active=False).first()
+    if user is None:
+        return
+
+    for event_id in Event.all_objects.filter(organizer_id=user_id).values_list('pk', flat=True):
+        purge_event(event_id)
+    delete_in_batches(Participant.objects.filter(user_id=user_id))
+    delete_in_batches(Post.objects.filter(user_id=user_id), on_batch=uncount_posts)
+    delete_in_batches(Recommendation.objects.filter(user_id=user_id))
+    delete_in_batches(
+        Friendship.objects.filter(Q(requested_by_id=user_id) | Q(profiles__user_id=user_id)).distinct(),
+        on_batch=unlink_friendships)
+    Profile.all_objects.filter(user_id=user_id).delete()
+    user.delete()
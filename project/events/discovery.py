@@ -0,0 +1,93 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Event, Location, Tag, within_distance, bounding_box_filter, ends_after
+
+
+# Counting stops here, past this point a predicate is not selective anyway
+ESTIMATE_CAP = 10000
+
+
+class DiscoveryPlanner:
+    """
+    Plans a combined radius, time window and tag search over events.
+
+    Every predicate is backed by an index (location latitude, event
+    starts_at/ends_at and the tag link table). The planner estimates how
+    many events each one matches with capped counts and drives the query
+    from the most selective one, the remaining predicates are then only
+    checked for the rows it produced.
+    """
+
+    def __init__(self, latitude, longitude, radius_km, start=None, end=None, tags=None, only_future=True):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.start = start
+        self.end = end
+        self.tags = tags or []
+        self.only_future = only_future
+
+    def tag_ids(self):
+        if not self.tags:
+            return None
+        q = Q()
+        for text in self.tags:
+            q |= Q(text__iexact=text)
+        return list(Tag.objects.filter(q).values_list('id', flat=True))
+
+    def predicates(self):
+        """
+        Return a list of (name, Q) with one entry per index backed predicate
+        """
+        location_ids = Location.objects.nearby_ids(self.latitude, self.longitude, self.radius_km)
+        if location_ids is not None:
+            predicates = [('geo', Q(location_id__in=location_ids))]
+        else:
+            predicates = [('geo', bounding_box_filter(
+                self.latitude, self.longitude, self.radius_km, prefix='location__'))]
+
+        time = Q()
+        if self.only_future:
+            time &= Q(ends_at__gte=timezone.now())
+        if self.end:
+            time &= Q(starts_at__lt=self.end)
+        if self.start:
+            time &= ends_after(self.start)
+        if time:
+            predicates.append(('time', time))
+
+        tag_ids = self.tag_ids()
+        if tag_ids is not None:
+            links = Tag.events.through.objects.filter(tag_id__in=tag_ids)
+            predicates.append(('tags', Q(id__in=links.values('event_id'))))
+
+        return predicates
+
+    @staticmethod
+    def estimate(q):
+        return Event.objects.filter(q).values('id')[:ESTIMATE_CAP].count()
+
+    def plan(self):
+        """
+        Return the predicates ordered from most to least selective
+        """
+        predicates = self.predicates()
+        if len(predicates) == 1:
+            return predicates
+        return sorted(predicates, key=lambda predicate: self.estimate(predicate[1]))
+
+    def queryset(self, sort='DISTANCE'):
+        plan = self.plan()
+        (_, driver), rest = plan[0], plan[1:]
+
+        # Only the driver is evaluated as a set, the others are checked per row
+        qs = Event.objects.filter(id__in=Event.objects.filter(driver).values('id'))
+        for _, q in rest:
+            qs = qs.filter(q)
+
+        qs = within_distance(qs, self.latitude, self.longitude, self.radius_km, prefix='location__')
+
+        if sort == 'START':
+            return qs.order_by('starts_at', 'distance')
+        return qs.order_by('distance', 'starts_at')
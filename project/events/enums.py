@@ -17,4 +17,9 @@ class Gender(graphene.Enum):
 class FriendStatus(graphene.Enum):
     PENDING = "PENDING"
     FRIENDS = "FRIENDS"
-    BLOCKED = "BLOCKED"
\ No newline at end of file
+    BLOCKED = "BLOCKED"
+
+
+class DiscoverSort(graphene.Enum):
+    DISTANCE = "DISTANCE"
+    START = "START"
@@ -0,0 +1,235 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat, lng, lats, lngs):
+    """
+    Vectorized great circle distance in kilometers, all angles in radians
+    """
+    sin_lat = np.sin((lats - lat) * 0.5)
+    sin_lng = np.sin((lngs - lng) * 0.5)
+    a = sin_lat * sin_lat + math.cos(lat) * np.cos(lats) * sin_lng * sin_lng
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """
+    In process index of location coordinates kept in NumPy arrays.
+
+    The bulk of the points live in arrays sorted by latitude so a radius
+    query only evaluates the latitude band that can contain matches. Saved
+    and deleted locations go to a small unsorted delta and a tombstone mask,
+    both are merged back into the sorted arrays once they grow past
+    rebuild_threshold.
+    """
+
+    def __init__(self, rebuild_threshold=4096):
+        self.rebuild_threshold = rebuild_threshold
+        self.loaded = False
+        self.watermark = None
+        self._lock = threading.RLock()
+        self._set_base(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        self._delta = {}
+        self._delta_arrays = None
+
+    def _set_base(self, ids, lats, lngs):
+        order = np.argsort(lats, kind='mergesort')
+        self._ids = ids[order]
+        self._lats = lats[order]
+        self._lngs = lngs[order]
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._dead = 0
+        self._positions = {int(pk): i for i, pk in enumerate(self._ids)}
+
+    def __len__(self):
+        return len(self._ids) - self._dead + len(self._delta)
+
+    def load(self, ids, lats, lngs):
+        """
+        Replace the whole index, coordinates in radians
+        """
+        with self._lock:
+            self._set_base(
+                np.asarray(ids, dtype=np.int64),
+                np.asarray(lats, dtype=np.float64),
+                np.asarray(lngs, dtype=np.float64))
+            self._delta = {}
+            self._delta_arrays = None
+            self.loaded = True
+
+    def upsert(self, pk, lat, lng):
+        with self._lock:
+            self._kill(pk)
+            self._delta[pk] = (lat, lng)
+            self._delta_arrays = None
+            self._maybe_rebuild()
+
+    def remove(self, pk):
+        with self._lock:
+            self._kill(pk)
+            if self._delta.pop(pk, None) is not None:
+                self._delta_arrays = None
+            self._maybe_rebuild()
+
+    def _kill(self, pk):
+        position = self._positions.pop(pk, None)
+        if position is not None:
+            self._alive[position] = False
+            self._dead += 1
+
+    def _maybe_rebuild(self):
+        if len(self._delta) + self._dead < self.rebuild_threshold:
+            return
+        ids, lats, lngs = self._delta_view()
+        self._set_base(
+            np.concatenate([self._ids[self._alive], ids]),
+            np.concatenate([self._lats[self._alive], lats]),
+            np.concatenate([self._lngs[self._alive], lngs]))
+        self._delta = {}
+        self._delta_arrays = None
+
+    def _delta_view(self):
+        if self._delta_arrays is None:
+            ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+            coordinates = np.array(list(self._delta.values()), dtype=np.float64).reshape(-1, 2)
+            self._delta_arrays = (ids, coordinates[:, 0], coordinates[:, 1])
+        return self._delta_arrays
+
+    def radius(self, lat, lng, km):
+        """
+        Return (ids, distances) of every point within km kilometers of the
+        given coordinates in radians, sorted by distance
+        """
+        angle = km / EARTH_RADIUS_KM
+        with self._lock:
+            start, end = np.searchsorted(self._lats, (lat - angle, lat + angle))
+            alive = self._alive[start:end]
+            band_ids = self._ids[start:end][alive]
+            band_distances = haversine(lat, lng, self._lats[start:end][alive], self._lngs[start:end][alive])
+
+            delta_ids, delta_lats, delta_lngs = self._delta_view()
+            delta_distances = haversine(lat, lng, delta_lats, delta_lngs)
+
+        ids = np.concatenate([band_ids, delta_ids])
+        distances = np.concatenate([band_distances, delta_distances])
+        inside = distances <= km
+        ids, distances = ids[inside], distances[inside]
+        order = np.argsort(distances, kind='mergesort')
+        return ids[order], distances[order]
+
+    def nearest(self, lat, lng, k, initial_km=None):
+        """
+        Return (ids, distances) of the k points closest to the given
+        coordinates in radians. The radius grows until k points are inside
+        it, the k nearest are then guaranteed to be among them.
+        """
+        km = initial_km
+        if km is None:
+            # Radius of a cap holding k points if they were spread evenly
+            km = 2 * EARTH_RADIUS_KM * math.sqrt(k / max(len(self), 1))
+        while True:
+            ids, distances = self.radius(lat, lng, km)
+            if len(ids) >= k or km >= math.pi * EARTH_RADIUS_KM:
+                return ids[:k], distances[:k]
+            km *= 4
+
+
+_index = GeoIndex()
+_index_lock = threading.Lock()
+_last_sync = 0.0
+_last_load = 0.0
+
+
+def geo_index():
+    """
+    Return the process wide index, loading it on first use and catching up
+    with rows saved by other processes every GEO_ENGINE_SYNC_INTERVAL seconds.
+    Queryset updates, raw deletes and deletes in other processes leave the
+    timestamp alone, the index is reloaded every GEO_ENGINE_RELOAD_INTERVAL
+    seconds to pick those up.
+    """
+    global _last_sync, _last_load
+
+    now = time.monotonic()
+    if _index.loaded and now - _last_sync < settings.GEO_ENGINE_SYNC_INTERVAL:
+        return _index
+
+    with _index_lock:
+        if not _index.loaded or now - _last_load >= settings.GEO_ENGINE_RELOAD_INTERVAL:
+            load(_index)
+            _last_load = now
+        elif now - _last_sync >= settings.GEO_ENGINE_SYNC_INTERVAL:
+            sync(_index)
+        _last_sync = now
+    return _index
+
+
+def reset():
+    """
+    Drop the process wide index, it is reloaded on next use
+    """
+    global _index
+    with _index_lock:
+        _index = GeoIndex()
+
+
+def location_rows(qs):
+    return qs.exclude(lat_rad=None).values_list('id', 'lat_rad', 'lng_rad', 'timestamp')
+
+
+def load(index):
+    from .models import Location
+
+    ids, lats, lngs = [], [], []
+    watermark = None
+    for pk, lat, lng, timestamp in location_rows(Location.objects.all()).iterator():
+        ids.append(pk)
+        lats.append(lat)
+        lngs.append(lng)
+        if watermark is None or timestamp > watermark:
+            watermark = timestamp
+    index.load(ids, lats, lngs)
+    index.watermark = watermark
+    logger.info('Loaded %d locations into the geo index', len(ids))
+
+
+def sync(index):
+    """
+    Pick up locations written by other processes since the last load/sync.
+    Deletions elsewhere are only seen on the next load, callers re-read
+    matches from the database anyway.
+    """
+    from .models import Location
+
+    qs = Location.objects.all()
+    if index.watermark is not None:
+        qs = qs.filter(timestamp__gte=index.watermark)
+    for pk, lat, lng, timestamp in location_rows(qs).iterator():
+        index.upsert(pk, lat, lng)
+        if index.watermark is None or timestamp > index.watermark:
+            index.watermark = timestamp
+
+
+def location_saved(location):
+    if not _index.loaded:
+        return
+    if location.lat_rad is None:
+        _index.remove(location.pk)
+    else:
+        _index.upsert(location.pk, location.lat_rad, location.lng_rad)
+
+
+def location_deleted(pk):
+    if _index.loaded:
+        _index.remove(pk)
@@ -0,0 +1,179 @@
+import datetime
+import json
+import logging
+import random
+import time
+import traceback
+from importlib import import_module
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name=None, max_attempts=5, on_failure=None):
+    """
+    Register a function as a job, it is called with the enqueued payload as
+    keyword arguments. Jobs can run more than once, they must be safe to retry.
+    on_failure is called with the payload too once the job failed for good,
+    to clean up after it.
+    """
+    def register(func):
+        func.job_name = name or func.__name__
+        func.max_attempts = max_attempts
+        func.on_failure = on_failure
+        registry[func.job_name] = func
+        return func
+    return register
+
+
+def load_jobs():
+    for module in settings.JOB_MODULES:
+        import_module(module)
+
+
+def enqueue(name, key=None, delay=0, **payload):
+    """
+    Queue a job in the current transaction, it only becomes visible to the
+    worker when the transaction commits. With a key, queueing a job whose
+    key is already taken returns the existing job.
+    """
+    load_jobs()
+    func = registry[name]
+    fields = dict(
+        name=name,
+        payload=json.dumps(payload, cls=DjangoJSONEncoder),
+        max_attempts=func.max_attempts,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+    if key is None:
+        return Job.objects.create(**fields)
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(key=key, **fields)
+    except IntegrityError:
+        return Job.objects.get(key=key)
+
+
+def schedule(name, interval, **payload):
+    """
+    Queue the next run of a periodic job at the start of the next interval.
+    Runs are keyed by their time slot, so scheduling from several places
+    still gives one run per interval.
+    """
+    slot = int(time.time() // interval) + 1
+    return enqueue(
+        name,
+        key='{}-{}'.format(name.replace('_', '-'), slot),
+        delay=slot * interval - time.time(),
+        **payload)
+
+
+def backoff(attempts):
+    """
+    Seconds until retry number `attempts`, doubling each time with jitter
+    """
+    delay = min(settings.JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(limit):
+    """
+    Lock up to limit due jobs for this worker. Running jobs whose lease
+    expired belonged to a worker that died and are taken over, or failed
+    when they have no attempts left.
+    """
+    now = timezone.now()
+    expired = Q(status=Job.RUNNING, locked_until__lt=now)
+    for job in Job.objects.filter(expired, attempts__gte=F('max_attempts')):
+        # Only one worker can win the conditional update
+        if Job.objects.filter(expired, pk=job.pk).update(
+                status=Job.FAILED, locked_until=None, last_error='Lease expired on the last attempt'):
+            logger.error('Job %s #%s failed for good: lease expired on the last attempt', job.name, job.pk)
+            fail(job)
+
+    due = (
+        Q(status=Job.PENDING, run_after__lte=now) |
+        expired & Q(attempts__lt=F('max_attempts'))
+    )
+    lease = now + datetime.timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+    claimed = []
+    for candidate in Job.objects.filter(due).order_by('run_after').values('id', 'status', 'attempts')[:limit]:
+        # Only one worker can win the conditional update
+        updated = Job.objects.filter(
+            pk=candidate['id'],
+            status=candidate['status'],
+            attempts=candidate['attempts'],
+        ).update(status=Job.RUNNING, locked_until=lease, attempts=F('attempts') + 1)
+        if updated:
+            claimed.append(Job.objects.get(pk=candidate['id']))
+    return claimed
+
+
+def run(job):
+    load_jobs()
+    try:
+        func = registry[job.name]
+        func(**json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s #%s failed for good:\n%s', job.name, job.pk, error)
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, locked_until=None, last_error=error)
+            fail(job)
+        else:
+            logger.warning('Job %s #%s failed, retrying:\n%s', job.name, job.pk, error)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING,
+                locked_until=None,
+                last_error=error,
+                run_after=timezone.now() + datetime.timedelta(seconds=backoff(job.attempts)))
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_until=None)
+    return True
+
+
+def fail(job):
+    func = registry.get(job.name)
+    if func is None or func.on_failure is None:
+        return
+    try:
+        func.on_failure(**json.loads(job.payload))
+    except Exception:
+        logger.exception('Cleaning up after job %s #%s failed', job.name, job.pk)
+
+
+def run_pending(limit=None, batch=10):
+    """
+    Run due jobs until there are none left, or limit jobs ran. Returns how
+    many ran.
+    """
+    count = 0
+    while limit is None or count < limit:
+        size = batch if limit is None else min(batch, limit - count)
+        jobs = claim(size)
+        if not jobs:
+            break
+        for job in jobs:
+            run(job)
+            count += 1
+    return count
+
+
+def purge(older_than):
+    """
+    Delete finished jobs, failed ones are kept to be looked at
+    """
+    return Job.objects.filter(status=Job.DONE, timestamp__lt=older_than).delete()[0]
@@ -0,0 +1,110 @@
+"""
+Merging of duplicate locations, rows with the same google_id. Events and
+profiles are moved to the kept location a batch per transaction, in the
+archive database too, then the duplicates nothing points to any more are
+deleted, until none is left. Takes the app registry so migration 0011 can
+run it on the historical models.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+
+def archive_has_events(apps):
+    archive = settings.ARCHIVE_DATABASE
+    if archive not in connections.databases:
+        return False
+    Event = apps.get_model('events', 'Event')
+    return Event._meta.db_table in connections[archive].introspection.table_names()
+
+
+def merge_locations(keep_id, duplicate_ids, batch_size=None, apps=global_apps, using='default'):
+    """
+    Point the events and profiles at duplicate_ids to keep_id, then delete
+    the duplicates. Rows pointed to a duplicate in the meantime are moved
+    by another pass. Returns the number of rows moved.
+    """
+    batch_size = batch_size or settings.LOCATION_MERGE_BATCH_SIZE
+    referencing = [(apps.get_model('events', 'Event'), using), (apps.get_model('events', 'Profile'), using)]
+    if using == 'default' and archive_has_events(apps):
+        # Archived events point to locations in the primary
+        referencing.append((apps.get_model('events', 'Event'), settings.ARCHIVE_DATABASE))
+
+    moved = 0
+    remaining = list(duplicate_ids)
+    while remaining:
+        for model, alias in referencing:
+            moved += repoint(model, alias, remaining, keep_id, batch_size, apps)
+        deleted = delete_unreferenced(remaining, apps, using)
+        remaining = [pk for pk in remaining if pk not in deleted]
+    return moved
+
+
+def repoint(model, alias, location_ids, keep_id, batch_size, apps):
+    rows = model._base_manager.using(alias).filter(location_id__in=location_ids)
+    moved = 0
+    while True:
+        ids = list(rows.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return moved
+        with transaction.atomic(using=alias):
+            model._base_manager.using(alias).filter(pk__in=ids).update(location_id=keep_id, timestamp=timezone.now())
+        moved += len(ids)
+        if apps is global_apps and alias == 'default':
+            # Updates send no signals
+            from .cache import object_caches
+            for pk in ids:
+                object_caches[model._meta.label_lower].invalidate(pk)
+
+
+def delete_unreferenced(location_ids, apps, using):
+    """
+    Delete the locations nothing points to any more, returns their ids.
+    Events and profiles cascade with their location, so the test and the
+    delete are a single statement.
+    """
+    Location = apps.get_model('events', 'Location')
+    locations = Location._base_manager.using(using).filter(pk__in=location_ids)
+    with transaction.atomic(using=using):
+        unreferenced = locations
+        for name in ('Event', 'Profile'):
+            model = apps.get_model('events', name)
+            unreferenced = unreferenced.exclude(
+                pk__in=model._base_manager.using(using).filter(location_id__in=location_ids).values('location_id'))
+        unreferenced._raw_delete(using)
+        deleted = set(location_ids) - set(locations.values_list('pk', flat=True))
+
+        if apps is global_apps and deleted:
+            # What the post_delete receivers do, the raw delete sends no signals
+            from .cache import location_cache
+            from .models import Watermark, deletions_key
+            Watermark.increment(deletions_key(Location))
+            for pk in deleted:
+                location_cache.invalidate(pk)
+            if settings.GEO_ENGINE == 'memory':
+                from . import geoindex
+                transaction.on_commit(lambda: [geoindex.location_deleted(pk) for pk in deleted], using=using)
+    return deleted
+
+
+def dedupe_locations(batch_size=None, apps=global_apps, using='default'):
+    """
+    Merge every group of locations sharing a google_id into its oldest
+    geocoded location, or oldest one. Returns the number of locations
+    removed and of rows moved.
+    """
+    Location = apps.get_model('events', 'Location')
+    locations = Location._base_manager.using(using)
+    duplicated = locations.exclude(google_id=None).values('google_id')\
+        .annotate(count=Count('pk')).filter(count__gt=1).values_list('google_id', flat=True)
+
+    removed = moved = 0
+    for google_id in list(duplicated):
+        candidates = list(locations.filter(google_id=google_id).order_by('pk').values_list('pk', 'latitude'))
+        keep_id = next((pk for pk, latitude in candidates if latitude is not None), candidates[0][0])
+        duplicate_ids = [pk for pk, _ in candidates if pk != keep_id]
+        moved += merge_locations(keep_id, duplicate_ids, batch_size, apps, using)
+        removed += len(duplicate_ids)
+    return removed, moved
@@ -0,0 +1,28 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events import archive, tasks
+
+
+class Command(BaseCommand):
+    help = 'Move events that ended a while ago, with their participants and posts, to the archive database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive events that ended this many days ago, ARCHIVE_AFTER_DAYS by default')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--schedule', action='store_true',
+                            help='Queue the periodic archive_events job instead of archiving now')
+
+    def handle(self, days, batch_size, schedule, **options):
+        if schedule:
+            tasks.schedule_archival()
+            self.stdout.write('Scheduled archive_events')
+            return
+
+        before = None if days is None else timezone.now() - datetime.timedelta(days=days)
+        start = time.perf_counter()
+        archived = archive.archive_events(before, batch_size)
+        self.stdout.write('Archived {} events in {:.1f} s'.format(archived, time.perf_counter() - start))
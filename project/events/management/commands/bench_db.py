@@ -0,0 +1,107 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction, OperationalError
+
+from events.models import Event, Tag
+
+
+# Django's defaults before the tuning, reconnecting for every request
+LEGACY = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'timeout': 5.0,
+    'persistent': False,
+}
+
+TUNED = {
+    'pragmas': None,
+    'timeout': None,
+    'persistent': True,
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput of concurrent readers and writers with the legacy and the tuned connection settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--profile', choices=('legacy', 'tuned', 'both'), default='both')
+
+    def handle(self, readers, writers, duration, profile, **options):
+        profiles = [('legacy', LEGACY), ('tuned', TUNED)]
+        if profile != 'both':
+            profiles = [p for p in profiles if p[0] == profile]
+
+        self.stdout.write('{:<8} {:>10} {:>10} {:>8} {:>12}'.format(
+            'profile', 'reads/s', 'writes/s', 'locked', 'read p99 ms'))
+        try:
+            for name, config in profiles:
+                result = self.run(config, readers, writers, duration)
+                self.stdout.write('{:<8} {:>10.0f} {:>10.0f} {:>8} {:>12.2f}'.format(
+                    name, result['reads'] / duration, result['writes'] / duration,
+                    result['locked'], result['read_p99'] * 1000))
+        finally:
+            Tag.objects.filter(text__startswith='bench-').delete()
+
+    def run(self, config, readers, writers, duration):
+        connection.close()
+        database = connections.databases['default']
+        saved = (dict(settings.SQLITE_PRAGMAS), database['OPTIONS'].get('timeout'))
+
+        if config['pragmas'] is not None:
+            settings.SQLITE_PRAGMAS.update(config['pragmas'])
+        if config['timeout'] is not None:
+            database['OPTIONS']['timeout'] = config['timeout']
+
+        stop = time.monotonic() + duration
+        lock = threading.Lock()
+        result = {'reads': 0, 'writes': 0, 'locked': 0, 'read_latencies': []}
+
+        def worker(operation):
+            latencies, count, locked = [], 0, 0
+            try:
+                while time.monotonic() < stop:
+                    start = time.perf_counter()
+                    try:
+                        operation()
+                        count += 1
+                    except OperationalError:
+                        locked += 1
+                    latencies.append(time.perf_counter() - start)
+                    if not config['persistent']:
+                        connection.close()
+            finally:
+                connection.close()
+            with lock:
+                key = 'reads' if operation is read else 'writes'
+                result[key] += count
+                result['locked'] += locked
+                if operation is read:
+                    result['read_latencies'].extend(latencies)
+
+        def read():
+            list(Event.objects.upcoming().select_related('location').order_by('starts_at')[:50])
+
+        def write():
+            with transaction.atomic():
+                tag = Tag.objects.create(text='bench-{}'.format(threading.get_ident() % 10000))
+                Tag.objects.filter(pk=tag.pk).update(text='bench-done')
+
+        threads = [threading.Thread(target=worker, args=(read,)) for _ in range(readers)]
+        threads += [threading.Thread(target=worker, args=(write,)) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        settings.SQLITE_PRAGMAS.clear()
+        settings.SQLITE_PRAGMAS.update(saved[0])
+        database['OPTIONS']['timeout'] = saved[1]
+
+        latencies = sorted(result['read_latencies']) or [0]
+        result['read_p99'] = latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0]
+        return result
@@ -0,0 +1,70 @@
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from events.models import Location, EARTH_RADIUS_KM, haversine_expression, cos_angle_expression
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the per row cost of the raw haversine and the precomputed trig distance filters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--radius', type=float, default=10.0)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(**options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat, radius, seed, **options):
+        rng = random.Random(seed)
+        batch = []
+        for _ in range(rows):
+            location = Location(
+                city='Bench',
+                country='Bench',
+                latitude=round(rng.uniform(55.0, 69.0), 6),
+                longitude=round(rng.uniform(11.0, 24.0), 6),
+            )
+            location.set_trig_columns()
+            batch.append(location)
+        Location.objects.bulk_create(batch, batch_size=500)
+
+        latitude, longitude = 59.3293, 18.0686
+        total = Location.objects.count()
+
+        # No bounding box, every row has to be evaluated
+        haversine = Location.objects\
+            .annotate(distance=haversine_expression(latitude, longitude))\
+            .filter(distance__lte=radius)
+        precomputed = Location.objects\
+            .annotate(cos_angle=cos_angle_expression(latitude, longitude))\
+            .filter(cos_angle__gte=math.cos(radius / EARTH_RADIUS_KM))
+
+        results = {}
+        for name, qs in (('haversine', haversine), ('precomputed', precomputed)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                matches = qs.count()
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results[name] = best
+            self.stdout.write('{:<12} {:>8} matches  {:>9.1f} ms  {:>8.3f} us/row'.format(
+                name, matches, best * 1000, best * 1e6 / total))
+
+        self.stdout.write('speedup      {:.1f}x over {} rows'.format(
+            results['haversine'] / results['precomputed'], total))
@@ -0,0 +1,53 @@
+import math
+import time
+
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from events.geoindex import GeoIndex
+
+
+class Command(BaseCommand):
+    help = 'Time radius and nearest neighbour lookups on the in memory geo index with synthetic points'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--radius', type=float, default=10.0)
+        parser.add_argument('--k', type=int, default=20)
+        parser.add_argument('--updates', type=int, default=2000,
+                            help='Locations upserted after the load, they stay in the delta')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, points, queries, radius, k, updates, seed, **options):
+        rng = np.random.RandomState(seed)
+
+        # Uniform over the sphere, so the density is realistic nowhere and worst nowhere
+        lats = np.arcsin(rng.uniform(-1.0, 1.0, points))
+        lngs = rng.uniform(-math.pi, math.pi, points)
+
+        index = GeoIndex(rebuild_threshold=max(updates + 1, 4096))
+        start = time.perf_counter()
+        index.load(np.arange(points), lats, lngs)
+        self.stdout.write('load       {:>10.1f} ms for {} points'.format(
+            (time.perf_counter() - start) * 1000, points))
+
+        for pk in rng.randint(0, points, updates):
+            index.upsert(int(pk), float(np.arcsin(rng.uniform(-1, 1))), float(rng.uniform(-math.pi, math.pi)))
+
+        centers = rng.randint(0, points, queries)
+        self.report('radius', [
+            lambda i=i: index.radius(lats[i], lngs[i], radius) for i in centers])
+        self.report('nearest', [
+            lambda i=i: index.nearest(lats[i], lngs[i], k) for i in centers])
+
+    def report(self, name, calls):
+        timings = []
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        self.stdout.write('{:<10} p50 {:.3f} ms  p99 {:.3f} ms  max {:.3f} ms'.format(
+            name, np.percentile(timings, 50), np.percentile(timings, 99), timings.max()))
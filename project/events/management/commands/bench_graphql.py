@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.benchmark import OPERATIONS, compare, run_catalogue
+from project.schema import schema
+
+
+class Command(BaseCommand):
+    help = 'Run the fixed GraphQL operation catalogue against the current database and report latencies as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--operation', action='append', dest='operations',
+                            choices=[operation['name'] for operation in OPERATIONS],
+                            help='Only run these operations, may be repeated')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Earlier JSON report to compare against')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_catalogue(
+                schema,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                only=options['operations'])
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(e)
+
+        content = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(content)
+        else:
+            self.stdout.write(content)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stderr.write('{:<20} {:>10} {:>10} {:>7} {:>9}'.format(
+                'operation', 'before ms', 'after ms', 'ratio', 'queries'))
+            for name, before, after, ratio, before_queries, after_queries in compare(baseline, report):
+                self.stderr.write('{:<20} {:>10.3f} {:>10.3f} {:>6.2f}x {:>4} -> {}'.format(
+                    name, before, after, ratio, before_queries, after_queries))
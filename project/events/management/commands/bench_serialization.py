@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from project import middleware, serialization
+from project.schema import schema
+
+
+QUERY = '''query ($first: Int) {
+    events(filterType: "ALL", onlyFuture: false, first: $first) {
+        id title description startDate startTime endDate endTime
+        minParticipants maxParticipants location { city country street latitude longitude }
+    }
+}'''
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+class Command(BaseCommand):
+    help = 'Time the JSON encoders and compression of events payloads of growing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000],
+                            help='Number of events in the payloads')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, sizes, repeat, **options):
+        request = RequestFactory().post('/graphql/')
+        request.user = AnonymousUser()
+        encodings = ['gzip'] + (['br'] if middleware.brotli is not None else [])
+
+        self.stdout.write('Encoders: {}'.format(', '.join(serialization.available())))
+        self.stdout.write('{:>6} {:>11} {:>10} {:>10} {:>8} {:>10}'.format(
+            'events', 'execute ms', 'encoder', 'encode ms', 'share', 'KB'))
+        for size in sizes:
+            execute_ms, result = timed(
+                lambda: schema.execute(QUERY, variable_values={'first': size}, context_value=request), repeat)
+            data = {'data': result.data}
+
+            for name in serialization.available():
+                encode_ms, content = timed(lambda: serialization.ENCODERS[name](data), repeat)
+                self.stdout.write('{:>6} {:>11.2f} {:>10} {:>10.2f} {:>7.0%} {:>10.1f}'.format(
+                    len(result.data['events']), execute_ms, name, encode_ms,
+                    encode_ms / (execute_ms + encode_ms), len(content) / 1024))
+
+            content = content.encode('utf-8')
+            for encoding in encodings:
+                compress_ms, compressed = timed(lambda: middleware.compress(content, encoding), repeat)
+                self.stdout.write('{:>6} {:>11} {:>10} {:>10.2f} {:>8} {:>10.1f}'.format(
+                    '', '', encoding, compress_ms, '', len(compressed) / 1024))
+
+        self.stdout.write('Compression starts at {} bytes'.format(settings.COMPRESSION_MIN_BYTES))
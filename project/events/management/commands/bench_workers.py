@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+
+from events.benchmark import OPERATIONS
+from project import warmup
+from project.views import GatherGraphQLView
+
+
+def memory():
+    """
+    Megabytes of resident, proportional (shared pages split between the
+    processes sharing them) and private memory of this process
+    """
+    fields = {}
+    path = '/proc/self/smaps_rollup'
+    if not os.path.exists(path):
+        path = '/proc/self/smaps'
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = fields.get(parts[0].rstrip(':'), 0) + int(parts[1])
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {
+        'rss': fields.get('Rss', 0) / 1024,
+        'pss': fields.get('Pss', 0) / 1024,
+        'private': private / 1024,
+    }
+
+
+def serve(view, query):
+    request = RequestFactory().post('/graphql/', json.dumps({'query': query}), content_type='application/json')
+    request.user = AnonymousUser()
+    start = time.perf_counter()
+    view(request)
+    return (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Fork workers like the preforking server and report their first request latency and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--no-warmup', action='store_true', help='Fork without warming up first')
+        parser.add_argument('--operation', default='events_all',
+                            choices=[operation['name'] for operation in OPERATIONS])
+
+    def handle(self, workers, no_warmup, operation, **options):
+        query = next(op['query'] for op in OPERATIONS if op['name'] == operation)
+        if no_warmup:
+            connections.close_all()
+        else:
+            timings = warmup.warm_up()
+            self.stdout.write('Warm up {:.0f} ms: {}'.format(sum(timings.values()), ', '.join(
+                '{} {:.0f} ms'.format(name, ms) for name, ms in timings.items())))
+        self.stdout.write('Master RSS {rss:.1f} MB'.format(**memory()))
+
+        children = []
+        for _ in range(workers):
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                view = GatherGraphQLView.as_view()
+                result = {'first': serve(view, query), 'second': serve(view, query)}
+                # Let every worker finish its requests before measuring the
+                # pages they still share
+                time.sleep(0.5)
+                result.update(memory())
+                os.write(write_end, json.dumps(result).encode())
+                os._exit(0)
+            os.close(write_end)
+            children.append((pid, read_end))
+
+        self.stdout.write('{:>6} {:>10} {:>10} {:>8} {:>8} {:>8}'.format(
+            'worker', 'first ms', 'second ms', 'RSS MB', 'PSS MB', 'private'))
+        for pid, read_end in children:
+            with os.fdopen(read_end) as f:
+                result = json.loads(f.read())
+            os.waitpid(pid, 0)
+            self.stdout.write('{:>6} {first:>10.1f} {second:>10.1f} {rss:>8.1f} {pss:>8.1f} {private:>8.1f}'.format(
+                pid, **result))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events import recommendations, tasks
+
+
+class Command(BaseCommand):
+    help = 'Score upcoming events for every user and store the ranked recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-user', type=int, default=50,
+                            help='Recommendations kept per user')
+        parser.add_argument('--schedule', action='store_true',
+                            help='Queue the periodic refresh_recommendations job instead of computing now')
+
+    def handle(self, per_user, schedule, **options):
+        if schedule:
+            tasks.schedule_recommendations()
+            self.stdout.write('Scheduled refresh_recommendations')
+            return
+
+        start = time.perf_counter()
+        users = recommendations.compute_recommendations(per_user=per_user)
+        self.stdout.write('Scored {} users in {:.1f} s'.format(users, time.perf_counter() - start))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events import locations
+
+
+class Command(BaseCommand):
+    help = 'Merge locations sharing a google_id, moving their events and profiles to the kept one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows moved per transaction')
+
+    def handle(self, batch_size, **options):
+        start = time.perf_counter()
+        removed, moved = locations.dedupe_locations(batch_size)
+        self.stdout.write('Removed {} duplicate locations and moved {} events and profiles in {:.1f} s'.format(
+            removed, moved, time.perf_counter() - start))
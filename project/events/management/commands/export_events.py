@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from events import transfer
+
+
+class Command(BaseCommand):
+    help = 'Export events with their location, tags and participants as JSONL, CSV or XLS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(transfer.WRITERS), default='jsonl')
+        parser.add_argument('--output', help='File to write, standard output when left out')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Events read per query')
+
+    def handle(self, format, output, chunk_size, **options):
+        records = transfer.export_records(chunk_size=chunk_size)
+        writer = transfer.WRITERS[format]
+
+        if format == 'xls':
+            if not output:
+                raise CommandError('XLS exports need --output')
+            with open(output, 'wb') as stream:
+                count = writer(records, stream)
+        elif output:
+            with open(output, 'w', newline='', encoding='utf-8') as stream:
+                count = writer(records, stream)
+        else:
+            # The writers end their own lines
+            self.stdout.ending = ''
+            count = writer(records, self.stdout)
+
+        self.stderr.write('Exported {} events'.format(count))
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events import transfer
+
+
+class Command(BaseCommand):
+    help = 'Import events from a JSONL or CSV file written by export_events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(transfer.READERS),
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Events written per transaction')
+        parser.add_argument('--no-geocode', action='store_true',
+                            help="Don't queue geocoding for new locations")
+
+    def handle(self, path, format, batch_size, no_geocode, **options):
+        format = format or os.path.splitext(path)[1].lstrip('.').lower()
+        if format not in transfer.READERS:
+            raise CommandError('Unknown format {!r}, use --format'.format(format))
+
+        importer = transfer.EventImporter(batch_size=batch_size, geocode=not no_geocode)
+        with open(path, newline='', encoding='utf-8') as stream:
+            counts = importer.run(transfer.READERS[format](stream))
+
+        # bulk_create skips the save signals, the memory geo index of the web
+        # processes picks the new locations up on its next timestamp sync
+        self.stdout.write(
+            'Imported {events} events, {locations} new locations, {tags} new tags '
+            'and {participants} participants, skipped {skipped} events without organizer'.format(
+                **{key: counts[key] for key in ('events', 'locations', 'tags', 'participants', 'skipped')}))
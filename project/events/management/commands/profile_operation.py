@@ -0,0 +1,73 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from project.profiling import Profile
+from project.schema import schema
+
+
+def load_operations(path):
+    # A profile written by project/profiling.py or a single operation
+    with open(path) as f:
+        data = json.load(f)
+    operations = data.get('operations', [data])
+    if not all(operation.get('query') for operation in operations):
+        raise CommandError('{} has no query'.format(path))
+    for operation in operations:
+        # Profiles only keep the types of the variables
+        missing = set(operation.get('variable_types', ())) - set(operation.get('variables') or ())
+        if missing:
+            raise CommandError('{} has no value for the variables {}, add them as "variables"'.format(
+                path, ', '.join(sorted(missing))))
+    return operations
+
+
+class Command(BaseCommand):
+    help = 'Replay a saved GraphQL operation against the current database under the profiler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A profile .json, or a JSON object with query, variables and operationName')
+        parser.add_argument('--user', help='Username to run the operation as')
+        parser.add_argument('--repeat', type=int, default=1, help='Runs to profile, more runs give more samples')
+        parser.add_argument('--interval', type=float, help='Seconds between samples')
+        parser.add_argument('--output', help='Directory for the profile, GRAPHQL_PROFILE_DIR by default')
+
+    def handle(self, path, user, repeat, interval, output, **options):
+        operations = load_operations(path)
+        request = RequestFactory().post('/graphql/')
+        if user:
+            try:
+                request.user = get_user_model().objects.get(username=user)
+            except get_user_model().DoesNotExist:
+                raise CommandError('No user {}'.format(user))
+        else:
+            request.user = AnonymousUser()
+
+        profile = Profile(interval).start()
+        try:
+            for _ in range(repeat):
+                for operation in operations:
+                    result = schema.execute(
+                        operation['query'],
+                        variable_values=operation.get('variables'),
+                        operation_name=operation.get('operationName'),
+                        context_value=request,
+                        middleware=[profile])
+                    if result.errors:
+                        self.stderr.write('Errors: {}'.format(result.errors))
+        finally:
+            profile.stop()
+        for operation in operations:
+            profile.add_operation(operation['query'], operation.get('variables'), operation.get('operationName'))
+
+        name = profile.save(output)
+        report = profile.report()
+        self.stdout.write('{:.1f} ms, {} samples, profile {}'.format(report['elapsed_ms'], report['samples'], name))
+        self.stdout.write('{:<50} {:>8} {:>10}'.format('resolver', 'calls', 'ms'))
+        for resolver_path, timing in report['resolvers'].items():
+            depth = resolver_path.count('.')
+            label = '  ' * depth + resolver_path.rsplit('.', 1)[-1]
+            self.stdout.write('{:<50} {count:>8} {ms:>10.2f}'.format(label, **timing))
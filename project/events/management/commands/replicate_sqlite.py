@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from project.replication import replicate_sqlite
+
+
+SQLITE = 'django.db.backends.sqlite3'
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the SQLite replicas, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep replicating with this many seconds between copies')
+
+    def handle(self, interval, **options):
+        primary = settings.DATABASES['default']
+        replicas = [settings.DATABASES[alias] for alias in settings.DATABASE_REPLICAS]
+        if not replicas:
+            raise CommandError('No replicas configured, set DATABASE_REPLICA_URLS')
+        if primary['ENGINE'] != SQLITE or any(r['ENGINE'] != SQLITE for r in replicas):
+            raise CommandError('Only SQLite databases can be replicated this way')
+
+        while True:
+            start = time.perf_counter()
+            for replica in replicas:
+                replicate_sqlite(primary['NAME'], replica['NAME'])
+            self.stdout.write('Replicated to {} replica(s) in {:.0f} ms'.format(
+                len(replicas), (time.perf_counter() - start) * 1000))
+
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,41 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from events import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, keeps polling for new ones unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no jobs are due')
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Jobs claimed at a time')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Finished jobs older than this are deleted')
+
+    def handle(self, once, batch, sleep, keep_days, **options):
+        jobs.load_jobs()
+        last_purge = 0
+
+        while True:
+            close_old_connections()
+            count = jobs.run_pending(batch=batch)
+            if count:
+                self.stdout.write('Ran {} job(s)'.format(count))
+
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                jobs.purge(timezone.now() - datetime.timedelta(days=keep_days))
+
+            if once:
+                return
+            if not count:
+                time.sleep(sleep)
@@ -0,0 +1,215 @@
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from events.models import Event, Friendship, Location, Participant, ParticipantLog, Post, Profile, Tag
+from events.utilities import bulk_create_ids
+
+
+CITIES = (
+    ('Stockholm', 'Sweden', 59.3293, 18.0686),
+    ('Gothenburg', 'Sweden', 57.7089, 11.9746),
+    ('Malmo', 'Sweden', 55.6050, 13.0038),
+    ('Uppsala', 'Sweden', 59.8586, 17.6389),
+    ('Oslo', 'Norway', 59.9139, 10.7522),
+    ('Copenhagen', 'Denmark', 55.6761, 12.5683),
+    ('Helsinki', 'Finland', 60.1699, 24.9384),
+)
+
+TAGS = (
+    'music', 'football', 'running', 'boardgames', 'hiking', 'coding', 'food',
+    'wine', 'beer', 'climbing', 'yoga', 'cinema', 'theatre', 'art', 'books',
+    'party', 'kids', 'dogs', 'photo', 'chess', 'dance', 'jazz', 'rock', 'tennis',
+)
+
+WORDS = (
+    'evening', 'meetup', 'session', 'night', 'club', 'open', 'weekly', 'summer',
+    'winter', 'social', 'casual', 'tournament', 'workshop', 'picnic', 'walk',
+)
+
+FIRST_NAMES = ('Anna', 'Erik', 'Maria', 'Lars', 'Karin', 'Nils', 'Sara', 'Johan', 'Emma', 'Oskar')
+LAST_NAMES = ('Andersson', 'Johansson', 'Karlsson', 'Nilsson', 'Eriksson', 'Larsson', 'Olsson', 'Persson')
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with reproducible synthetic users, events and social graph data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--locations', type=int, default=None,
+                            help='Defaults to half the number of users')
+        parser.add_argument('--events-per-user', type=float, default=2.0)
+        parser.add_argument('--participants-per-event', type=int, default=8)
+        parser.add_argument('--friends-per-user', type=int, default=10)
+        parser.add_argument('--posts-per-event', type=int, default=3)
+        parser.add_argument('--tags-per-event', type=int, default=2)
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplies every count above')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synthetic')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        scale = options['scale']
+
+        users = int(options['users'] * scale)
+        locations = int((options['locations'] or options['users'] / 2) * scale)
+        events = int(users * options['events_per_user'])
+
+        with transaction.atomic():
+            tags = self.create_tags()
+            location_ids = self.create_locations(max(locations, 1))
+            user_ids = self.create_users(users)
+            profile_ids = self.create_profiles(user_ids, location_ids)
+            event_ids = self.create_events(events, user_ids, location_ids)
+            self.create_participants(event_ids, user_ids, options['participants_per_event'])
+            self.create_tag_links(event_ids, tags, options['tags_per_event'])
+            self.create_friendships(user_ids, profile_ids, options['friends_per_user'])
+            self.create_posts(event_ids, user_ids, options['posts_per_event'])
+
+        self.stdout.write('Seeded {} users, {} locations and {} events'.format(
+            len(user_ids), len(location_ids), len(event_ids)))
+
+    def bulk_create(self, model, objects):
+        return bulk_create_ids(model, objects, BATCH_SIZE)
+
+    def create_tags(self):
+        existing = {tag.text: tag.id for tag in Tag.objects.filter(text__in=TAGS)}
+        self.bulk_create(Tag, [Tag(text=text) for text in TAGS if text not in existing])
+        return list(Tag.objects.filter(text__in=TAGS).values_list('pk', flat=True))
+
+    def create_locations(self, count):
+        offset = Location.objects.filter(google_id__startswith=self.prefix + '-').count()
+        objects = []
+        for i in range(offset, offset + count):
+            city, country, latitude, longitude = self.rng.choice(CITIES)
+            location = Location(
+                city=city,
+                country=country,
+                street='{} street {}'.format(self.rng.choice(WORDS).title(), i),
+                google_id='{}-place-{}'.format(self.prefix, i),
+                latitude=round(self.rng.gauss(latitude, 0.08), 6),
+                longitude=round(self.rng.gauss(longitude, 0.15), 6),
+            )
+            location.set_trig_columns()
+            location.set_address_key()
+            objects.append(location)
+        return self.bulk_create(Location, objects)
+
+    def create_users(self, count):
+        password = make_password('synthetic')
+        User = get_user_model()
+        # Continue numbering so the command can be run again to grow the data
+        offset = User.objects.filter(username__startswith=self.prefix + '_').count()
+        return self.bulk_create(User, [
+            User(
+                username='{}_{}'.format(self.prefix, i),
+                email='{}_{}@example.com'.format(self.prefix, i),
+                password=password,
+            ) for i in range(offset, offset + count)])
+
+    def create_profiles(self, user_ids, location_ids):
+        return self.bulk_create(Profile, [
+            Profile(
+                user_id=user_id,
+                location_id=self.rng.choice(location_ids),
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                email='{}_{}@example.com'.format(self.prefix, user_id),
+                gender=self.rng.choice(('MALE', 'FEMALE', 'OTHER', 'NOANSWER')),
+            ) for user_id in user_ids])
+
+    def create_events(self, count, user_ids, location_ids):
+        now = timezone.localtime().replace(tzinfo=None, microsecond=0)
+        objects = []
+        for _ in range(count):
+            # A third in the past, the rest spread over the coming months
+            start = now + datetime.timedelta(
+                days=self.rng.randint(-60, 120),
+                hours=self.rng.randint(0, 23))
+            end = start + datetime.timedelta(hours=self.rng.randint(1, 6))
+            event = Event(
+                title='{} {}'.format(self.rng.choice(WORDS), self.rng.choice(WORDS)).title(),
+                description=' '.join(self.rng.choice(WORDS) for _ in range(20)),
+                start_date=start.date(),
+                start_time=start.time(),
+                end_date=end.date(),
+                end_time=end.time(),
+                organizer_id=self.rng.choice(user_ids),
+                location_id=self.rng.choice(location_ids),
+                min_participants=1,
+                max_participants=self.rng.randint(5, 100),
+                event_type=self.rng.choice(TAGS),
+            )
+            event.set_time_range()
+            objects.append(event)
+        return self.bulk_create(Event, objects)
+
+    def create_participants(self, event_ids, user_ids, per_event):
+        statuses = ('GOING', 'GOING', 'INTERESTED', 'NOTGOING', 'INVITED')
+        objects = []
+        for event_id in event_ids:
+            count = min(self.rng.randint(0, per_event * 2), len(user_ids))
+            for user_id in self.rng.sample(user_ids, count):
+                objects.append(Participant(
+                    event_id=event_id, user_id=user_id, status=self.rng.choice(statuses)))
+        self.bulk_create(Participant, objects)
+        ParticipantLog.bulk_append(objects, BATCH_SIZE)
+
+    def create_tag_links(self, event_ids, tag_ids, per_event):
+        Link = Tag.events.through
+        objects = []
+        for event_id in event_ids:
+            for tag_id in self.rng.sample(tag_ids, min(per_event, len(tag_ids))):
+                objects.append(Link(event_id=event_id, tag_id=tag_id))
+        self.bulk_create(Link, objects)
+
+    def create_friendships(self, user_ids, profile_ids, per_user):
+        pairs = set()
+        for i, profile_id in enumerate(profile_ids):
+            for _ in range(per_user // 2):
+                other = self.rng.randrange(len(profile_ids))
+                if other != i:
+                    pairs.add((min(i, other), max(i, other)))
+        pairs = sorted(pairs)
+
+        friendship_ids = self.bulk_create(Friendship, [
+            Friendship(
+                status=self.rng.choice(('FRIENDS', 'FRIENDS', 'FRIENDS', 'PENDING')),
+                requested_by_id=user_ids[a],
+            ) for a, b in pairs])
+
+        Link = Friendship.profiles.through
+        objects = []
+        for friendship_id, (a, b) in zip(friendship_ids, pairs):
+            for index in (a, b):
+                objects.append(Link(profile_id=profile_ids[index], friendship_id=friendship_id))
+        self.bulk_create(Link, objects)
+
+    def create_posts(self, event_ids, user_ids, per_event):
+        objects = []
+        for event_id in event_ids:
+            for _ in range(self.rng.randint(0, per_event * 2)):
+                objects.append(Post(
+                    event_id=event_id,
+                    user_id=self.rng.choice(user_ids),
+                    title=self.rng.choice(WORDS).title(),
+                    body=' '.join(self.rng.choice(WORDS) for _ in range(30)),
+                ))
+        self.bulk_create(Post, objects)
+
+        # bulk_create skips post_saved, count the posts of the new events in one update
+        if event_ids:
+            counts = Post.objects.filter(event=OuterRef('pk')).order_by().values('event').annotate(count=Count('pk'))
+            Event.all_objects.filter(pk__gte=min(event_ids)).update(
+                post_count=Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), 0))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events import rsvp, tasks
+
+
+class Command(BaseCommand):
+    help = 'Aggregate the participant status log into the hourly snapshots read by rsvpTrend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true',
+                            help='Queue the periodic snapshot_participants job instead of aggregating now')
+
+    def handle(self, schedule, **options):
+        if schedule:
+            tasks.schedule_snapshots()
+            self.stdout.write('Scheduled snapshot_participants')
+            return
+
+        start = time.perf_counter()
+        rows = rsvp.take_snapshots()
+        self.stdout.write('Aggregated {} log rows in {:.1f} s'.format(rows, time.perf_counter() - start))
@@ -0,0 +1,151 @@
+# Generated by Django 2.0.6 on 2026-10-19 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('start_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('min_participants', models.PositiveIntegerField()),
+                ('max_participants', models.PositiveIntegerField()),
+                ('event_type', models.CharField(max_length=100)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('FRIENDS', 'Friends'), ('BLOCKED', 'Blocked')], default='FRIENDS', max_length=20)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('city', models.CharField(max_length=100)),
+                ('country', models.CharField(max_length=100)),
+                ('street', models.CharField(blank=True, max_length=100)),
+                ('google_id', models.CharField(blank=True, max_length=50)),
+                ('google_formatted_address', models.CharField(blank=True, max_length=1000)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Participant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('INTERESTED', 'Interested'), ('GOING', 'Going'), ('NOTGOING', 'Not going'), ('INVITED', 'Invited')], default='INTERESTED', max_length=30)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='events.Event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events_participated', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Post',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('title', models.CharField(max_length=50)),
+                ('body', models.TextField(max_length=1000)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='events.Event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('description', models.TextField(blank=True)),
+                ('email', models.CharField(blank=True, max_length=100)),
+                ('birth_date', models.DateField(blank=True, null=True)),
+                ('gender', models.CharField(choices=[('MALE', 'Male'), ('FEMALE', 'Female'), ('OTHER', 'Other'), ('NOANSWER', '')], default='NOANSWER', max_length=20)),
+                ('profile_picture', models.TextField(blank=True)),
+                ('friends', models.ManyToManyField(blank=True, to='events.Friendship')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profiles', to='events.Location')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('timestamp', models.DateTimeField(auto_now=True)),
+                ('text', models.CharField(max_length=20)),
+                ('events', models.ManyToManyField(related_name='tags', to='events.Event')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='profiles',
+            field=models.ManyToManyField(blank=True, to='events.Profile'),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='events.Location'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='organizer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events_organized', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='participant',
+            unique_together={('user', 'event')},
+        ),
+    ]
@@ -0,0 +1,64 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def combine_date_time(date, time):
+    value = datetime.datetime.combine(date, time)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def backfill_time_range(apps, schema_editor):
+    # As Event.set_time_range, kept here so later changes don't alter it
+    Event = apps.get_model('events', 'Event')
+    for event in Event.objects.all().iterator():
+        starts_at = combine_date_time(event.start_date, event.start_time)
+        if event.end_date and event.end_time:
+            ends_at = combine_date_time(event.end_date, event.end_time)
+        elif event.end_date:
+            ends_at = combine_date_time(event.end_date, datetime.time.max)
+        elif event.end_time:
+            ends_at = combine_date_time(event.start_date, event.end_time)
+            if ends_at < starts_at:
+                ends_at += datetime.timedelta(days=1)
+        else:
+            ends_at = starts_at
+
+        Event.objects.filter(pk=event.pk).update(
+            starts_at=starts_at,
+            ends_at=max(starts_at, ends_at))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='starts_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ends_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_time_range, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='starts_at',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='ends_at',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.6 on 2026-10-19 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0002_event_time_range'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='latitude',
+            field=models.DecimalField(db_index=True, decimal_places=6, max_digits=9),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.0.6 on 2026-10-19 03:06
+
+import math
+
+from django.db import migrations, models
+
+
+def backfill_trig_columns(apps, schema_editor):
+    Location = apps.get_model('events', 'Location')
+    locations = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for location in locations.iterator():
+        lat_rad = math.radians(float(location.latitude))
+        lng_rad = math.radians(float(location.longitude))
+        Location.objects.filter(pk=location.pk).update(
+            lat_rad=lat_rad,
+            lng_rad=lng_rad,
+            sin_lat=math.sin(lat_rad),
+            cos_lat=math.cos(lat_rad),
+            sin_lng=math.sin(lng_rad),
+            cos_lng=math.cos(lng_rad))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_location_latitude_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='cos_lat',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='cos_lng',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='lat_rad',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='lng_rad',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='sin_lat',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='sin_lng',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_trig_columns, migrations.RunPython.noop),
+    ]
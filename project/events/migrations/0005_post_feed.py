@@ -0,0 +1,31 @@
+# Generated by Django 2.0.6 on 2026-10-19 03:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_post_count(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    counts = Event.objects.annotate(posts_total=Count('posts')).filter(posts_total__gt=0)
+    for event in counts.values('id', 'posts_total').iterator():
+        Event.objects.filter(pk=event['id']).update(post_count=event['posts_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_location_trig_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['event', '-created_time', '-id'], name='events_post_feed_idx'),
+        ),
+        migrations.RunPython(backfill_post_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 2.0.6 on 2026-10-19 03:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+CODES = {'INTERESTED': 1, 'GOING': 2, 'NOTGOING': 3, 'INVITED': 4}
+
+
+def backfill_participant_log(apps, schema_editor):
+    """
+    Start the history with the current participants at their creation time
+    """
+    Participant = apps.get_model('events', 'Participant')
+    ParticipantLog = apps.get_model('events', 'ParticipantLog')
+    rows = Participant.objects.order_by('created_time', 'pk')\
+        .values_list('event_id', 'user_id', 'status', 'created_time')
+    batch = []
+    for event_id, user_id, status, created_time in rows.iterator():
+        batch.append(ParticipantLog(event_id=event_id, user_id=user_id, status=CODES.get(status, 0), time=created_time))
+        if len(batch) >= 1000:
+            ParticipantLog.objects.bulk_create(batch)
+            batch = []
+    ParticipantLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipantLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.PositiveIntegerField()),
+                ('user_id', models.PositiveIntegerField()),
+                ('old_status', models.PositiveSmallIntegerField(default=0)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParticipantSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('interested', models.PositiveIntegerField(default=0)),
+                ('going', models.PositiveIntegerField(default=0)),
+                ('not_going', models.PositiveIntegerField(default=0)),
+                ('invited', models.PositiveIntegerField(default=0)),
+                ('changes', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participant_snapshots', to='events.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='participantsnapshot',
+            unique_together={('event', 'hour')},
+        ),
+        migrations.RunPython(backfill_participant_log, migrations.RunPython.noop),
+    ]
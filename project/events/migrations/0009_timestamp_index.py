@@ -0,0 +1,53 @@
+# Generated by Django 2.0.6 on 2026-10-19 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_participant_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
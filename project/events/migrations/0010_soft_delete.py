@@ -0,0 +1,23 @@
+# Generated by Django 2.0.6 on 2026-10-19 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='deleted_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='deleted_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.0.6 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Empty place ids become NULL, which the unique index allows more than
+    once, and locations sharing a place id are merged
+    """
+    from events.locations import dedupe_locations
+    alias = schema_editor.connection.alias
+    Location = apps.get_model('events', 'Location')
+    Location.objects.using(alias).filter(google_id='').update(google_id=None)
+    dedupe_locations(batch_size=1000, apps=apps, using=alias)
+
+
+def empty_place_ids(apps, schema_editor):
+    Location = apps.get_model('events', 'Location')
+    Location.objects.using(schema_editor.connection.alias).filter(google_id=None).update(google_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0010_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='google_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.RunPython(merge_duplicates, empty_place_ids),
+        migrations.AlterField(
+            model_name='location',
+            name='google_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
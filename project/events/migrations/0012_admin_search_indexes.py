@@ -0,0 +1,23 @@
+# Generated by Django 2.0.6 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0011_unique_place'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='title',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='text',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.0.6 on 2026-10-19 04:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PubSubMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=100)),
+                ('kind', models.CharField(max_length=50)),
+                ('data', models.TextField()),
+                ('created_time', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pubsubmessage',
+            index=models.Index(fields=['topic', 'id'], name='events_pubsub_topic_idx'),
+        ),
+    ]
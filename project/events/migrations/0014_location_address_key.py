@@ -0,0 +1,27 @@
+# Generated by Django 2.0.6 on 2026-10-19 04:43
+
+from django.db import migrations, models
+
+
+def set_address_keys(apps, schema_editor):
+    Location = apps.get_model('events', 'Location')
+    locations = Location.objects.using(schema_editor.connection.alias)
+    for pk, street, city, country in locations.values_list('pk', 'street', 'city', 'country'):
+        key = '|'.join(' '.join((value or '').split()).lower() for value in (street, city, country))
+        locations.filter(pk=pk).update(address_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0013_pubsub_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='address_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=310),
+        ),
+        migrations.RunPython(set_address_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.0.6 on 2026-10-19 05:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_location_address_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
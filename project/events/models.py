@@ -1,11 +1,19 @@
 from django.db import models
 from django.conf import settings
-from django.db.models import Value, Func, F
+from django.db.models import Value, Func, F, Q
+from django.db.models.functions import Least
+from django.utils import timezone
+import datetime
+import logging
 import math
 
+from django.db import IntegrityError, transaction
 from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+logger = logging.getLogger(__name__)
+
 
 @receiver(connection_created)
 def extend_sqlite(connection=None, **kwargs):
@@ -20,17 +28,87 @@ def extend_sqlite(connection=None, **kwargs):
         cf('RADIANS', 1, math.radians)
         cf('SIN', 1, math.sin)
 
+        cursor = connection.connection.cursor()
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        if connection.alias == settings.ARCHIVE_DATABASE:
+            # Archived rows point to users and locations in the primary
+            cursor.execute('PRAGMA foreign_keys = OFF')
+        cursor.close()
+
 
 class BaseModel(models.Model):
     created_time = models.DateTimeField(auto_now_add=True)
-    timestamp = models.DateTimeField(auto_now=True)
+    # Indexed for the MAX(timestamp) versions of project/etags.py
+    timestamp = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         abstract = True
 
 
+def combine_date_time(date, time):
+    """
+    Combine a date and a time into an aware datetime in the current timezone
+    """
+    value = datetime.datetime.combine(date, time)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def ends_after(start):
+    """
+    Events still going on at start. Events without an end end when they
+    start, they count as going on at that moment.
+    """
+    return Q(ends_at__gt=start) | Q(ends_at=F('starts_at'), starts_at__gte=start)
+
+
+class EventQuerySet(models.QuerySet):
+    def upcoming(self, now=None):
+        """
+        Return events that have not ended yet
+        """
+        return self.filter(ends_at__gte=now or timezone.now())
+
+    def starting_between(self, start=None, end=None):
+        """
+        Return events starting in the half open interval [start, end)
+        """
+        qs = self
+        if start:
+            qs = qs.filter(starts_at__gte=start)
+        if end:
+            qs = qs.filter(starts_at__lt=end)
+        return qs
+
+    def overlapping(self, start=None, end=None):
+        """
+        Return events happening at some point during [start, end)
+        """
+        qs = self
+        if end:
+            qs = qs.filter(starts_at__lt=end)
+        if start:
+            qs = qs.filter(ends_after(start))
+        return qs
+
+
+class SoftDeleteManager(models.Manager):
+    """
+    Hides rows whose deleted_time is set, they are removed by a background
+    job afterwards, see events/deletion.py
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_time=None)
+
+
 class Event(BaseModel):
-    title = models.CharField(max_length=100, blank=False)
+    objects = SoftDeleteManager.from_queryset(EventQuerySet)()
+    all_objects = EventQuerySet.as_manager()
+
+    # Indexed for the prefix search of the admin
+    title = models.CharField(max_length=100, blank=False, db_index=True)
     description = models.TextField(blank=True)
     start_date = models.DateField()
     start_time = models.TimeField()
@@ -47,6 +125,40 @@ class Event(BaseModel):
     min_participants = models.PositiveIntegerField()
     max_participants = models.PositiveIntegerField()
     event_type = models.CharField(max_length=100)
+    # Denormalized from the date/time columns above so range queries can use an index
+    starts_at = models.DateTimeField(db_index=True, editable=False)
+    ends_at = models.DateTimeField(db_index=True, editable=False)
+    # Kept up to date by the Post signals below
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_time = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def set_time_range(self):
+        """
+        Derive starts_at/ends_at from the separate date and time columns.
+        Events without an end are treated as ending when they start, an end
+        date without an end time is treated as lasting the whole day and an
+        end time without an end date as ending the same night.
+        """
+        self.starts_at = combine_date_time(self.start_date, self.start_time)
+
+        if self.end_date and self.end_time:
+            self.ends_at = combine_date_time(self.end_date, self.end_time)
+        elif self.end_date:
+            self.ends_at = combine_date_time(self.end_date, datetime.time.max)
+        elif self.end_time:
+            self.ends_at = combine_date_time(self.start_date, self.end_time)
+            if self.ends_at < self.starts_at:
+                # Ends after midnight
+                self.ends_at += datetime.timedelta(days=1)
+        else:
+            self.ends_at = self.starts_at
+
+        if self.ends_at < self.starts_at:
+            self.ends_at = self.starts_at
+
+    def save(self, *args, **kwargs):
+        self.set_time_range()
+        super().save(*args, **kwargs)
 
 
 class Participant(BaseModel):
@@ -69,6 +181,26 @@ class Participant(BaseModel):
             ("INVITED", "Invited")),
             default="INTERESTED")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to log status changes only
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+
+@receiver(post_save, sender=Participant)
+def participant_saved(sender, instance, created, **kwargs):
+    old_status = None if created else getattr(instance, '_loaded_status', None)
+    if created or old_status != instance.status:
+        ParticipantLog.append(instance.event_id, instance.user_id, old_status, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Participant)
+def participant_deleted(sender, instance, **kwargs):
+    ParticipantLog.append(instance.event_id, instance.user_id, instance.status, None)
+
 
 class Friendship(BaseModel):
     status = models.CharField(
@@ -84,6 +216,9 @@ class Friendship(BaseModel):
 
 
 class Profile(BaseModel):
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE)
@@ -107,6 +242,7 @@ class Profile(BaseModel):
         default="NOANSWER")
     friends = models.ManyToManyField('Friendship', through=Friendship.profiles.through, blank=True)
     profile_picture = models.TextField(blank=True)
+    deleted_time = models.DateTimeField(null=True, blank=True, editable=False)
 
 
     @property
@@ -114,43 +250,141 @@ class Profile(BaseModel):
         return "{} {}".format(self.first_name, self.last_name)
 
 
-class LocationManager(models.Manager):
-    def nearby(self, latitude, longitude, proximity):
-        """
-        Return all object which distance to specified coordinates
-        is less than proximity given in kilometers
-        """
-        # Great circle distance formula
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_expression(latitude, longitude, prefix=''):
+    """
+    Great circle distance in kilometers computed from the raw degree columns,
+    kept as the reference for bench_distance
+    """
+    earth_radius=Value(EARTH_RADIUS_KM, output_field=models.FloatField())
+
+    f1=Func(F(prefix + 'latitude'), function='RADIANS', output_field=models.FloatField())
+    latitude2=Value(latitude, output_field=models.FloatField())
+    f2=Func(latitude2, function='RADIANS', output_field=models.FloatField())
+
+    longitude2=Value(longitude, output_field=models.FloatField())
+    l2=Func(longitude2, function='RADIANS', output_field=models.FloatField())
+
+    d_lat=Func(F(prefix + 'latitude'), function='RADIANS', output_field=models.FloatField()) - f2
+    d_lng=Func(F(prefix + 'longitude'), function='RADIANS', output_field=models.FloatField()) - l2
+
+    sin_lat = Func(d_lat/2, function='SIN', output_field=models.FloatField())
+    cos_lat1 = Func(f1, function='COS', output_field=models.FloatField())
+    cos_lat2 = Func(f2, function='COS', output_field=models.FloatField())
+    sin_lng = Func(d_lng/2, function='SIN', output_field=models.FloatField())
+
+    a = Func(sin_lat, 2, function='POW', output_field=models.FloatField()) + cos_lat1 * cos_lat2 * Func(sin_lng, 2, function='POW', output_field=models.FloatField())
+    c = 2 * Func(Func(a, function='SQRT', output_field=models.FloatField()), Func(1 - a, function='SQRT', output_field=models.FloatField()), function='ATAN2', output_field=models.FloatField())
+    return earth_radius * c
+
+
+def cos_angle_expression(latitude, longitude, prefix=''):
+    """
+    Cosine of the central angle between the given coordinates and the stored
+    location, spherical law of cosines expanded over the precomputed trig
+    columns so it only needs multiplications and additions per row
+    """
+    phi = math.radians(latitude)
+    lam = math.radians(longitude)
+
+    def const(value):
+        return Value(value, output_field=models.FloatField())
+
+    cos_d_lng = F(prefix + 'cos_lng') * const(math.cos(lam)) + F(prefix + 'sin_lng') * const(math.sin(lam))
+    return F(prefix + 'sin_lat') * const(math.sin(phi)) + F(prefix + 'cos_lat') * const(math.cos(phi)) * cos_d_lng
+
+
+def distance_expression(cos_angle):
+    """
+    Great circle distance in kilometers from a cosine of the central angle
+    """
+    # Rounding can push the cosine slightly above 1 for identical points
+    cos_angle = Least(cos_angle, Value(1.0, output_field=models.FloatField()))
+    angle = Func(cos_angle, function='ACOS', output_field=models.FloatField())
+    return Value(EARTH_RADIUS_KM, output_field=models.FloatField()) * angle
+
+
+def within_distance(qs, latitude, longitude, proximity, prefix=''):
+    """
+    Filter qs to locations within proximity kilometers and annotate them
+    with their distance. The filter compares the cosine of the angle with
+    a constant, ACOS is only evaluated for the matching rows.
+    """
+    max_angle = min(proximity / EARTH_RADIUS_KM, math.pi)
+    return qs\
+        .filter(bounding_box_filter(latitude, longitude, proximity, prefix=prefix))\
+        .annotate(cos_angle=cos_angle_expression(latitude, longitude, prefix=prefix))\
+        .filter(cos_angle__gte=math.cos(max_angle))\
+        .annotate(distance=distance_expression(F('cos_angle')))
 
-        earth_radius=Value(6371.0, output_field=models.FloatField())
 
-        f1=Func(F('latitude'), function='RADIANS', output_field=models.FloatField())
-        latitude2=Value(latitude, output_field=models.FloatField())
-        f2=Func(latitude2, function='RADIANS', output_field=models.FloatField())
+def bounding_box(latitude, longitude, proximity):
+    """
+    Return ((min_lat, max_lat), (min_lng, max_lng)) enclosing every point
+    within proximity kilometers, the longitude range is None when the box
+    wraps a pole or the antimeridian
+    """
+    d_lat = math.degrees(proximity / EARTH_RADIUS_KM)
+    lat_range = (max(latitude - d_lat, -90.0), min(latitude + d_lat, 90.0))
 
-        l1=Func(F('longitude'), function='RADIANS', output_field=models.FloatField())
-        longitude2=Value(longitude, output_field=models.FloatField())
-        l2=Func(longitude2, function='RADIANS', output_field=models.FloatField())
+    if lat_range[0] <= -90.0 or lat_range[1] >= 90.0:
+        return lat_range, None
 
-        d_lat=Func(F('latitude'), function='RADIANS', output_field=models.FloatField()) - f2
-        d_lng=Func(F('longitude'), function='RADIANS', output_field=models.FloatField()) - l2
+    ratio = math.sin(proximity / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1.0:
+        return lat_range, None
 
-        sin_lat = Func(d_lat/2, function='SIN', output_field=models.FloatField())
-        cos_lat1 = Func(f1, function='COS', output_field=models.FloatField())
-        cos_lat2 = Func(f2, function='COS', output_field=models.FloatField())
-        sin_lng = Func(d_lng/2, function='SIN', output_field=models.FloatField())
+    d_lng = math.degrees(math.asin(ratio))
+    if longitude - d_lng < -180.0 or longitude + d_lng > 180.0:
+        return lat_range, None
+    return lat_range, (longitude - d_lng, longitude + d_lng)
 
-        a = Func(sin_lat, 2, function='POW', output_field=models.FloatField()) + cos_lat1 * cos_lat2 * Func(sin_lng, 2, function='POW', output_field=models.FloatField())
-        c = 2 * Func(Func(a, function='SQRT', output_field=models.FloatField()), Func(1 - a, function='SQRT', output_field=models.FloatField()), function='ATAN2', output_field=models.FloatField())
-        d = earth_radius * c
 
+def bounding_box_filter(latitude, longitude, proximity, prefix=''):
+    """
+    Index friendly prefilter for a radius search
+    """
+    lat_range, lng_range = bounding_box(latitude, longitude, proximity)
+    q = models.Q(**{prefix + 'latitude__range': lat_range})
+    if lng_range:
+        q &= models.Q(**{prefix + 'longitude__range': lng_range})
+    return q
+
+
+class LocationManager(models.Manager):
+    def nearby_ids(self, latitude, longitude, proximity):
+        """
+        Return the ids of the locations within proximity kilometers from the
+        in memory geo index, or None when the database has to be asked
+        """
+        if settings.GEO_ENGINE != 'memory':
+            return None
+        try:
+            from . import geoindex
+            ids, _ = geoindex.geo_index().radius(
+                math.radians(latitude), math.radians(longitude), proximity)
+        except Exception:
+            logger.exception('Geo index lookup failed, falling back to SQL')
+            return None
+        if len(ids) > settings.GEO_ENGINE_MAX_IDS:
+            return None
+        return ids.tolist()
+
+    def nearby(self, latitude, longitude, proximity):
+        """
+        Return all object which distance to specified coordinates
+        is less than proximity given in kilometers
+        """
         res = self.get_queryset()\
                     .exclude(latitude=None)\
-                    .exclude(longitude=None)\
-                    .annotate(d=d)\
-                    .filter(d__lte=proximity)\
-                    .order_by('distance')
-        return res
+                    .exclude(longitude=None)
+
+        ids = self.nearby_ids(latitude, longitude, proximity)
+        if ids is not None:
+            res = res.filter(pk__in=ids)
+        return within_distance(res, latitude, longitude, proximity).order_by('distance')
 
 
 
@@ -160,21 +394,302 @@ class Location(BaseModel):
     city = models.CharField(max_length=100, blank=False)
     country = models.CharField(max_length=100, blank=False)
     street = models.CharField(max_length=100, blank=True)
-    google_id = models.CharField(max_length=50, blank=True)
+    # The place id of the geocoder, one location per place
+    google_id = models.CharField(max_length=50, null=True, blank=True, unique=True)
     google_formatted_address = models.CharField(max_length=1000, blank=True)
-    longitude = models.DecimalField(max_digits=9, decimal_places=6)
-    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    # Street, city and country compared case and space insensitively, for
+    # finding the location of an address, see add_or_update_location
+    address_key = models.CharField(max_length=310, blank=True, db_index=True, editable=False)
+    # Empty until the geocode_location job has looked up the address
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, db_index=True)
+    # Precomputed from latitude/longitude for the distance expressions
+    lat_rad = models.FloatField(null=True, editable=False)
+    lng_rad = models.FloatField(null=True, editable=False)
+    sin_lat = models.FloatField(null=True, editable=False)
+    cos_lat = models.FloatField(null=True, editable=False)
+    sin_lng = models.FloatField(null=True, editable=False)
+    cos_lng = models.FloatField(null=True, editable=False)
+
+    def set_trig_columns(self):
+        if self.latitude is None or self.longitude is None:
+            self.lat_rad = self.lng_rad = None
+            self.sin_lat = self.cos_lat = self.sin_lng = self.cos_lng = None
+            return
+
+        self.lat_rad = math.radians(float(self.latitude))
+        self.lng_rad = math.radians(float(self.longitude))
+        self.sin_lat = math.sin(self.lat_rad)
+        self.cos_lat = math.cos(self.lat_rad)
+        self.sin_lng = math.sin(self.lng_rad)
+        self.cos_lng = math.cos(self.lng_rad)
+
+    def set_address_key(self):
+        self.address_key = address_key(self.city, self.country, self.street)
+
+    def save(self, *args, **kwargs):
+        self.set_trig_columns()
+        self.set_address_key()
+        super().save(*args, **kwargs)
+
+
+def address_key(city, country, street):
+    return '|'.join(' '.join((value or '').split()).lower() for value in (street, city, country))
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, **kwargs):
+    if settings.GEO_ENGINE == 'memory':
+        from . import geoindex
+        transaction.on_commit(lambda: geoindex.location_saved(instance))
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    if settings.GEO_ENGINE == 'memory':
+        from . import geoindex
+        pk = instance.pk
+        transaction.on_commit(lambda: geoindex.location_deleted(pk))
 
 
 class Tag(BaseModel):
-    text = models.CharField(max_length=20, blank=False)
+    text = models.CharField(max_length=20, blank=False, db_index=True)
     events = models.ManyToManyField('events.Event', related_name='tags')
 
 
 class Post(BaseModel):
+    class Meta:
+        # The event feed, newest first, see Post.feed
+        indexes = [
+            models.Index(fields=['event', '-created_time', '-id'], name='events_post_feed_idx'),
+        ]
     title = models.CharField(max_length=50)
     body = models.TextField(max_length=1000, blank=False)
     event = models.ForeignKey('events.Event', related_name='posts', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE)
 
+    @classmethod
+    def feed(cls, event_id, after=None):
+        """
+        Posts of an event newest first, continuing after the (created_time, id)
+        position when given. Seeks on the feed index so every page costs the
+        same no matter how deep it is.
+        """
+        qs = cls.objects.filter(event_id=event_id)
+        if after:
+            created_time, id = after
+            qs = qs.filter(
+                Q(created_time__lt=created_time) | Q(created_time=created_time, id__lt=id)
+            )
+        return qs.order_by('-created_time', '-id')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        Event.objects.filter(pk=instance.event_id).update(post_count=F('post_count') + 1, timestamp=timezone.now())
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    Event.objects.filter(pk=instance.event_id, post_count__gt=0).update(post_count=F('post_count') - 1, timestamp=timezone.now())
+
+
+
+class Job(BaseModel):
+    """
+    A unit of work for the run_jobs worker, see events/jobs.py
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='events_job_queue_idx'),
+        ]
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    # Enqueueing twice with the same key creates a single job
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    status = models.CharField(
+        max_length=20,
+        default=PENDING,
+        choices=(
+            (PENDING, "Pending"),
+            (RUNNING, "Running"),
+            (DONE, "Done"),
+            (FAILED, "Failed"),
+        ),
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+
+class StagedFile(models.Model):
+    """
+    An upload waiting for the job that processes it, e.g. a profile picture
+    for process_profile_picture. The job deletes it when done or failed.
+    """
+    data = models.BinaryField()
+    created_time = models.DateTimeField(default=timezone.now)
+
+
+class Recommendation(models.Model):
+    """
+    Ranked upcoming events per user, written by compute_recommendations
+    """
+    class Meta:
+        unique_together = (("user", "event"),)
+        indexes = [
+            models.Index(fields=['user', 'rank'], name='events_recommendation_idx'),
+        ]
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='recommendations',
+        on_delete=models.CASCADE)
+    event = models.ForeignKey(
+        'events.Event',
+        related_name='recommendations',
+        on_delete=models.CASCADE)
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+    computed_time = models.DateTimeField()
+
+
+class ParticipantLog(models.Model):
+    """
+    Append only history of participant statuses, one row per change. Ids
+    are plain integers without foreign keys or indexes so appending stays a
+    single cheap insert and the history outlives deleted events and users.
+    Aggregated into ParticipantSnapshot by events/rsvp.py.
+    """
+    # Small integer codes of Participant.status, NONE is no participation
+    NONE = 0
+    CODES = {
+        "INTERESTED": 1,
+        "GOING": 2,
+        "NOTGOING": 3,
+        "INVITED": 4,
+    }
+
+    event_id = models.PositiveIntegerField()
+    user_id = models.PositiveIntegerField()
+    old_status = models.PositiveSmallIntegerField(default=NONE)
+    status = models.PositiveSmallIntegerField()
+    time = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def append(cls, event_id, user_id, old_status, status):
+        return cls.objects.create(
+            event_id=event_id,
+            user_id=user_id,
+            old_status=cls.CODES.get(old_status, cls.NONE),
+            status=cls.CODES.get(status, cls.NONE),
+        )
+
+    @classmethod
+    def bulk_append(cls, participants, batch_size=500):
+        """
+        Log the creation of participants saved with bulk_create, which
+        skips the post_save receiver
+        """
+        return cls.objects.bulk_create([
+            cls(event_id=p.event_id, user_id=p.user_id, status=cls.CODES.get(p.status, cls.NONE))
+            for p in participants
+        ], batch_size=batch_size)
+
+
+class ParticipantSnapshot(models.Model):
+    """
+    Participant counts of an event at the end of an hour, only hours with
+    changes have a row. The current hour is updated until it is over.
+    """
+    class Meta:
+        unique_together = (("event", "hour"),)
+    event = models.ForeignKey(
+        'events.Event',
+        related_name='participant_snapshots',
+        on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    interested = models.PositiveIntegerField(default=0)
+    going = models.PositiveIntegerField(default=0)
+    not_going = models.PositiveIntegerField(default=0)
+    invited = models.PositiveIntegerField(default=0)
+    # Status changes during the hour
+    changes = models.PositiveIntegerField(default=0)
+
+
+class Watermark(models.Model):
+    """
+    Named counters, e.g. the last ParticipantLog id aggregated into the
+    snapshots or the rows deleted from a table
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def increment(cls, name):
+        """
+        Add one, the row stays locked until the transaction ends
+        """
+        while not cls.objects.filter(name=name).update(value=F('value') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(name=name, value=1)
+                return
+            except IntegrityError:
+                # Created by a concurrent first caller, update that row
+                pass
+
+
+class PubSubMessage(models.Model):
+    """
+    Messages of the DatabaseBroker, see events/pubsub.py. The ids are the
+    message ids, the same in every process.
+    """
+    class Meta:
+        indexes = [
+            models.Index(fields=['topic', 'id'], name='events_pubsub_topic_idx'),
+        ]
+    topic = models.CharField(max_length=100)
+    kind = models.CharField(max_length=50)
+    data = models.TextField()
+    created_time = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+# Models whose versions project/etags.py computes, the deletes of these
+# are counted by count_deletion, connected in EventsConfig.ready
+VERSIONED_MODELS = (
+    'events.Event', 'events.Friendship', 'events.Location', 'events.Participant',
+    'events.Post', 'events.Profile', 'events.Tag',
+)
+
+
+def deletions_key(model):
+    return 'deleted:{}'.format(model._meta.label_lower)
+
+
+def count_deletion(sender, using, **kwargs):
+    """
+    Bump the deletion counter of sender once per transaction deleting its
+    rows, deletes don't move MAX(timestamp), project/etags.py reads this
+    counter. The counter is updated in the transaction of the delete and a
+    marker left in the commit hooks of the connection tells the following
+    rows that it's done, commits and rollbacks drop the hooks.
+    """
+    key = deletions_key(sender)
+    connection = transaction.get_connection(using)
+    if any(getattr(hook[1], 'deletions_key', None) == key for hook in connection.run_on_commit):
+        return
+    Watermark.increment(key)
+
+    def marker():
+        pass
+    marker.deletions_key = key
+    transaction.on_commit(marker, using=using)
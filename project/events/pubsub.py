@@ -0,0 +1,231 @@
+import collections
+import datetime
+import itertools
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, router, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+Message = collections.namedtuple('Message', ['id', 'topic', 'kind', 'data'])
+
+
+def event_topic(event_id):
+    return 'event:{}'.format(event_id)
+
+
+class Broker:
+    """
+    Interface of the pub/sub brokers, PUBSUB_BROKER selects the implementation
+    """
+
+    def publish(self, topic, kind, data):
+        raise NotImplementedError
+
+    def subscribe(self, topic, last_id=None):
+        """
+        Return a Subscription to the topic. With last_id the messages after it
+        that the broker still remembers are delivered first.
+        """
+        raise NotImplementedError
+
+
+class Subscription:
+    """
+    Bounded mailbox of one subscriber, a slow reader loses the oldest messages
+    instead of holding up the publishers
+    """
+
+    def __init__(self, broker, topic, size):
+        self.broker = broker
+        self.topic = topic
+        self.messages = collections.deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, message):
+        with self.condition:
+            self.messages.append(message)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Next message, None when nothing arrived within timeout seconds
+        """
+        with self.condition:
+            if not self.messages:
+                self.condition.wait(timeout)
+            if self.messages:
+                return self.messages.popleft()
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class InProcessBroker(Broker):
+    """
+    Delivers messages to the subscribers of the same process. Every topic
+    keeps its last messages so reconnecting clients can catch up.
+    """
+
+    def __init__(self, queue_size=100, history_size=50, max_topics=10000):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.max_topics = max_topics
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.subscribers = collections.defaultdict(set)
+        self.history = collections.OrderedDict()
+
+    def publish(self, topic, kind, data):
+        with self.lock:
+            message = Message(next(self.ids), topic, kind, data)
+
+            history = self.history.pop(topic, None) or collections.deque(maxlen=self.history_size)
+            history.append(message)
+            self.history[topic] = history
+            if len(self.history) > self.max_topics:
+                self.history.popitem(last=False)
+
+            subscribers = list(self.subscribers.get(topic, ()))
+
+        for subscription in subscribers:
+            subscription.put(message)
+        return message
+
+    def subscribe(self, topic, last_id=None):
+        subscription = Subscription(self, topic, self.queue_size)
+        with self.lock:
+            if last_id is not None:
+                for message in self.history.get(topic, ()):
+                    if message.id > last_id:
+                        subscription.put(message)
+            self.subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.topic]
+
+
+class DatabaseBroker(InProcessBroker):
+    """
+    Shares the messages between processes through the PubSubMessage table,
+    so the ids, and Last-Event-ID, are the same in every process. While a
+    process has subscribers a thread polls the table every
+    PUBSUB_POLL_SECONDS and delivers the new messages to them. The table is
+    the history, trimmed to PUBSUB_HISTORY_SECONDS.
+    """
+
+    def __init__(self, queue_size=100, history_size=50, poll_interval=None):
+        super().__init__(queue_size=queue_size, history_size=history_size)
+        self.poll_interval = poll_interval or settings.PUBSUB_POLL_SECONDS
+        self.poller = None
+        # Last id delivered to the subscribers of this process
+        self.polled = 0
+        self.trimmed = 0
+
+    def messages(self):
+        from .models import PubSubMessage
+        return PubSubMessage.objects.using(router.db_for_write(PubSubMessage))
+
+    def read(self, queryset):
+        return [Message(row.id, row.topic, row.kind, json.loads(row.data)) for row in queryset]
+
+    def publish(self, topic, kind, data):
+        row = self.messages().create(topic=topic, kind=kind, data=json.dumps(data, cls=DjangoJSONEncoder))
+        return Message(row.id, topic, kind, data)
+
+    def subscribe(self, topic, last_id=None):
+        subscription = Subscription(self, topic, self.queue_size)
+        with self.lock:
+            if self.poller is None:
+                self.polled = self.messages().order_by('-pk').values_list('pk', flat=True).first() or 0
+                self.poller = threading.Thread(target=self.poll, name='pubsub-poller', daemon=True)
+                self.poller.start()
+            if last_id is not None:
+                # Up to what the poller delivered, it delivers the rest
+                missed = self.messages().filter(topic=topic, pk__gt=last_id, pk__lte=self.polled)
+                for message in reversed(self.read(missed.order_by('-pk')[:self.history_size])):
+                    subscription.put(message)
+            self.subscribers[topic].add(subscription)
+        return subscription
+
+    def poll(self):
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                with self.lock:
+                    if not self.subscribers:
+                        self.poller = None
+                        return
+                    after = self.polled
+                try:
+                    messages = self.read(self.messages().filter(pk__gt=after).order_by('pk'))
+                    self.trim()
+                except Exception:
+                    logger.exception('Polling the pub/sub messages failed')
+                    connection.close()
+                    continue
+
+                with self.lock:
+                    deliveries = [(message, list(self.subscribers.get(message.topic, ()))) for message in messages]
+                    if messages:
+                        self.polled = messages[-1].id
+                for message, subscribers in deliveries:
+                    for subscription in subscribers:
+                        subscription.put(message)
+        finally:
+            # The thread's own connection
+            connection.close()
+
+    def trim(self):
+        if time.monotonic() - self.trimmed < 60:
+            return
+        self.trimmed = time.monotonic()
+        old = self.messages().filter(
+            created_time__lt=timezone.now() - datetime.timedelta(seconds=settings.PUBSUB_HISTORY_SECONDS))
+        old._raw_delete(old.db)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.PUBSUB_BROKER)()
+    return _broker
+
+
+def reset():
+    global _broker
+    _broker = None
+
+
+def publish_event_update(event_id, kind, data):
+    """
+    Publish to the subscribers of an event once the current transaction
+    commits, so they never see changes that are rolled back
+    """
+    topic = event_topic(event_id)
+    transaction.on_commit(lambda: broker().publish(topic, kind, data))
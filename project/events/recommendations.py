@@ -0,0 +1,228 @@
+"""
+Batch scoring of upcoming events for every user with a profile. Scores
+are computed with NumPy a chunk of users at a time and stored ranked in
+the Recommendation table, recommendedEvents only reads that table.
+
+score = TAG_WEIGHT * tag affinity
+      + FRIEND_WEIGHT * log(1 + friends attending)
+      + DISTANCE_WEIGHT * exp(-km / DISTANCE_SCALE_KM)
+
+Tag affinity is the share of the user's past participations that had the
+tag, summed over the tags of the event.
+"""
+import collections
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    EARTH_RADIUS_KM, Event, Friendship, Participant, Profile, Recommendation, Tag,
+)
+
+
+TAG_WEIGHT = 1.0
+FRIEND_WEIGHT = 0.5
+DISTANCE_WEIGHT = 0.5
+DISTANCE_SCALE_KM = 10.0
+
+ATTENDING = ('GOING', 'INTERESTED')
+
+USER_CHUNK = 256
+# Rows of the event/tag incidence matrix built at a time
+TAG_CHUNK = 64
+
+
+class EventCatalogue:
+    """
+    The upcoming events as arrays, positions in them are the columns of the
+    score matrices
+    """
+
+    def __init__(self, now):
+        rows = list(
+            Event.objects.filter(ends_at__gte=now)
+            .order_by('pk')
+            .values_list('pk', 'location__sin_lat', 'location__cos_lat', 'location__lng_rad'))
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.index = {pk: i for i, pk in enumerate(self.ids.tolist())}
+
+        coordinates = np.array([row[1:] for row in rows], dtype=np.float32).reshape(-1, 3)
+        # Events without coordinates are never near anyone
+        self.located = ~np.isnan(coordinates).any(axis=1)
+        coordinates[~self.located] = 0.0
+        self.sin_lat, self.cos_lat, self.lng = coordinates.T
+
+        # Columns of the events carrying each tag
+        tag_events = collections.defaultdict(list)
+        links = Tag.events.through.objects.filter(event_id__in=Event.objects.filter(ends_at__gte=now))
+        for event_id, tag_id in links.values_list('event_id', 'tag_id'):
+            if event_id in self.index:
+                tag_events[tag_id].append(self.index[event_id])
+        self.tag_ids = sorted(tag_events)
+        self.tag_index = {tag_id: i for i, tag_id in enumerate(self.tag_ids)}
+        self.tag_events = [np.array(tag_events[tag_id], dtype=np.int64) for tag_id in self.tag_ids]
+
+        self.attendance = collections.defaultdict(list)
+        attending = Participant.objects.filter(event__ends_at__gte=now, status__in=ATTENDING)
+        for user_id, event_id in attending.values_list('user_id', 'event_id'):
+            if event_id in self.index:
+                self.attendance[user_id].append(self.index[event_id])
+
+        self.organized = collections.defaultdict(list)
+        for organizer_id, event_id in Event.objects.filter(ends_at__gte=now).values_list('organizer_id', 'pk'):
+            self.organized[organizer_id].append(self.index[event_id])
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def tag_affinity(user_ids, catalogue):
+    """
+    Matrix of users x catalogue tags, the share of each user's past
+    participations that had the tag
+    """
+    affinity = np.zeros((len(user_ids), len(catalogue.tag_ids)))
+    row = {user_id: i for i, user_id in enumerate(user_ids)}
+    history = (
+        Participant.objects.filter(user_id__in=user_ids, status__in=ATTENDING)
+        .values_list('user_id', 'event_id', 'event__tags'))
+
+    totals = np.zeros(len(user_ids))
+    seen = set()
+    for user_id, event_id, tag_id in history:
+        if (user_id, event_id) not in seen:
+            seen.add((user_id, event_id))
+            totals[row[user_id]] += 1
+        if tag_id in catalogue.tag_index:
+            affinity[row[user_id], catalogue.tag_index[tag_id]] += 1
+    return affinity / np.maximum(totals, 1)[:, None]
+
+
+def friends_of(user_ids):
+    Link = Friendship.profiles.through
+    friendships = (
+        Link.objects.filter(profile__user_id__in=user_ids, friendship__status='FRIENDS')
+        .values_list('friendship_id', flat=True))
+
+    members = collections.defaultdict(set)
+    for friendship_id, user_id in Link.objects.filter(friendship_id__in=friendships).values_list(
+            'friendship_id', 'profile__user_id'):
+        members[friendship_id].add(user_id)
+
+    friends = collections.defaultdict(set)
+    for users in members.values():
+        for user_id in users:
+            friends[user_id].update(users - {user_id})
+    return friends
+
+
+def score_chunk(user_ids, locations, catalogue):
+    """
+    Score matrix of users x upcoming events, events the user organizes or
+    attends already are -inf
+    """
+    scores = np.zeros((len(user_ids), len(catalogue)), dtype=np.float32)
+
+    # Tags the chunk has no affinity for add nothing, the rest go through a
+    # matrix product with their rows of the event/tag incidence matrix
+    affinity = tag_affinity(user_ids, catalogue)
+    active = np.flatnonzero(affinity.any(axis=0))
+    for start in range(0, len(active), TAG_CHUNK):
+        tags = active[start:start + TAG_CHUNK]
+        incidence = np.zeros((len(tags), len(catalogue)), dtype=np.float32)
+        for row, tag in enumerate(tags):
+            incidence[row, catalogue.tag_events[tag]] = 1.0
+        scores += TAG_WEIGHT * (affinity[:, tags].astype(np.float32) @ incidence)
+
+    friends = friends_of(user_ids)
+    for row, user_id in enumerate(user_ids):
+        attended = [catalogue.attendance[f] for f in friends.get(user_id, ()) if f in catalogue.attendance]
+        if attended:
+            events, counts = np.unique(np.concatenate(attended), return_counts=True)
+            scores[row, events] += FRIEND_WEIGHT * np.log1p(counts)
+
+    # Great circle distance, computed in place to limit the temporary matrices
+    sin_lat, cos_lat, lng = (np.array(column, dtype=np.float32)[:, None] for column in zip(*locations))
+    located = ~np.isnan(sin_lat[:, 0])
+    nearness = np.cos(lng - catalogue.lng)
+    nearness *= cos_lat
+    nearness *= catalogue.cos_lat
+    nearness += sin_lat * catalogue.sin_lat
+    np.clip(nearness, -1.0, 1.0, out=nearness)
+    np.arccos(nearness, out=nearness)
+    nearness *= -EARTH_RADIUS_KM / DISTANCE_SCALE_KM
+    np.exp(nearness, out=nearness)
+    nearness[~located, :] = 0.0
+    nearness[:, ~catalogue.located] = 0.0
+    nearness *= DISTANCE_WEIGHT
+    scores += nearness
+
+    for row, user_id in enumerate(user_ids):
+        scores[row, catalogue.attendance.get(user_id, [])] = -np.inf
+        scores[row, catalogue.organized.get(user_id, [])] = -np.inf
+    return scores
+
+
+def top_events(scores, count):
+    """
+    Column indices of the count best positive scores per row, best first
+    """
+    count = min(count, scores.shape[1])
+    if count == 0:
+        return [[] for _ in scores]
+    best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    ranked = []
+    for row, columns in zip(scores, best):
+        columns = columns[np.argsort(-row[columns], kind='stable')]
+        ranked.append([column for column in columns if row[column] > 0])
+    return ranked
+
+
+def insert_rows(rows):
+    """
+    Insert (user_id, event_id, rank, score, computed_time) rows, a plain
+    executemany costs a fraction of building model instances for bulk_create
+    """
+    quote = connection.ops.quote_name
+    columns = ('user_id', 'event_id', 'rank', 'score', 'computed_time')
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {} ({}) VALUES (%s, %s, %s, %s, %s)'.format(
+                quote(Recommendation._meta.db_table), ', '.join(quote(column) for column in columns)),
+            rows)
+
+
+def compute_recommendations(per_user=50, now=None):
+    """
+    Replace the recommendations of every user with a profile, returns the
+    number of users scored
+    """
+    now = now or timezone.now()
+    catalogue = EventCatalogue(now)
+
+    profiles = (
+        Profile.objects.order_by('user_id')
+        .values_list('user_id', 'location__sin_lat', 'location__cos_lat', 'location__lng_rad'))
+    users = 0
+    last = 0
+    while True:
+        chunk = list(profiles.filter(user_id__gt=last)[:USER_CHUNK])
+        if not chunk:
+            return users
+        user_ids = [row[0] for row in chunk]
+        locations = [[np.nan if value is None else value for value in row[1:]] for row in chunk]
+
+        scores = score_chunk(user_ids, locations, catalogue)
+        computed_time = connection.ops.adapt_datetimefield_value(now)
+        rows = []
+        for row, (user_id, columns) in enumerate(zip(user_ids, top_events(scores, per_user))):
+            for rank, column in enumerate(columns, 1):
+                rows.append((user_id, int(catalogue.ids[column]), rank, float(scores[row, column]), computed_time))
+
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=user_ids).delete()
+            insert_rows(rows)
+
+        users += len(user_ids)
+        last = user_ids[-1]
@@ -0,0 +1,122 @@
+"""
+RSVP history of events. Participant status changes are appended to
+ParticipantLog on the mutation path, the snapshot_participants job folds
+the new log rows into hourly ParticipantSnapshot counts and rsvpTrend
+reads the snapshots.
+"""
+import collections
+import datetime
+import itertools
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Event, ParticipantLog, ParticipantSnapshot, Watermark
+
+
+WATERMARK = 'participant_snapshot'
+
+# Snapshot columns by status code
+COUNT_FIELDS = {
+    ParticipantLog.CODES['INTERESTED']: 'interested',
+    ParticipantLog.CODES['GOING']: 'going',
+    ParticipantLog.CODES['NOTGOING']: 'not_going',
+    ParticipantLog.CODES['INVITED']: 'invited',
+}
+
+
+def truncate_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def take_snapshots(batch_size=5000):
+    """
+    Aggregate the log rows added since the last run, a batch at a time.
+    Returns the number of log rows read.
+
+    Rows are read in id order and the watermark is the last id read. With
+    concurrent writers (Postgres) a row can commit after one with a higher
+    id, so reading stops at the first row younger than
+    PARTICIPANT_SNAPSHOT_LAG_SECONDS, by then the rows below it committed.
+    """
+    total = 0
+    while True:
+        settled = timezone.now() - datetime.timedelta(seconds=settings.PARTICIPANT_SNAPSHOT_LAG_SECONDS)
+        with transaction.atomic():
+            watermark, _ = Watermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            rows = list(itertools.takewhile(
+                lambda row: row[4] < settled,
+                ParticipantLog.objects.filter(pk__gt=watermark.value)
+                .order_by('pk')
+                .values_list('pk', 'event_id', 'old_status', 'status', 'time')[:batch_size]))
+            if not rows:
+                return total
+            apply_rows(rows)
+            watermark.value = rows[-1][0]
+            watermark.save(update_fields=['value'])
+        total += len(rows)
+
+
+def apply_rows(rows):
+    # Count changes per event and hour
+    deltas = collections.defaultdict(lambda: collections.defaultdict(collections.Counter))
+    for _, event_id, old_status, status, time in rows:
+        delta = deltas[event_id][truncate_hour(time)]
+        delta[old_status] -= 1
+        delta[status] += 1
+        delta['changes'] += 1
+
+    # Events deleted since are dropped, the log keeps their history
+    event_ids = set(Event.objects.filter(pk__in=list(deltas)).values_list('pk', flat=True))
+    latest_hour = (
+        ParticipantSnapshot.objects.filter(event_id=OuterRef('event_id'))
+        .order_by('-hour')
+        .values('hour')[:1])
+    latest = {
+        snapshot.event_id: snapshot
+        for snapshot in ParticipantSnapshot.objects.filter(
+            event_id__in=event_ids, hour=Subquery(latest_hour))
+    }
+
+    new = []
+    for event_id in event_ids:
+        snapshot = latest.get(event_id)
+        for hour, delta in sorted(deltas[event_id].items()):
+            # Counts are running totals, a row timestamped before the latest
+            # snapshot (clock skew between processes) goes into that hour
+            if snapshot is not None and hour <= snapshot.hour:
+                update_counts(snapshot, delta)
+                snapshot.save()
+                continue
+            previous = snapshot
+            snapshot = ParticipantSnapshot(event_id=event_id, hour=hour)
+            if previous is not None:
+                for field in COUNT_FIELDS.values():
+                    setattr(snapshot, field, getattr(previous, field))
+            update_counts(snapshot, delta)
+            new.append(snapshot)
+    ParticipantSnapshot.objects.bulk_create(new)
+
+
+def update_counts(snapshot, delta):
+    for code, field in COUNT_FIELDS.items():
+        # Changes logged before the history started can't go below zero
+        setattr(snapshot, field, max(getattr(snapshot, field) + delta[code], 0))
+    snapshot.changes += delta['changes']
+
+
+def trend(event_id, start=None, end=None):
+    """
+    Snapshots of an event in [start, end). The snapshot before start comes
+    first as the counts at the beginning of the range.
+    """
+    snapshots = ParticipantSnapshot.objects.filter(event_id=event_id).order_by('hour')
+    if end:
+        snapshots = snapshots.filter(hour__lt=end)
+    if not start:
+        return list(snapshots)
+
+    before = snapshots.filter(hour__lt=truncate_hour(start)).order_by('-hour').first()
+    return ([before] if before else []) + list(snapshots.filter(hour__gte=truncate_hour(start)))
@@ -1,14 +1,18 @@
 import graphene
-import datetime
 
 from graphene_django import DjangoObjectType
 from graphql import GraphQLError
 
-from .models import Event, Location, Participant, Profile, Tag, Post
+from .models import Event, Location, Participant, ParticipantSnapshot, Profile, Tag, Post
 from users.schema import UserType
 from django.db.models import Q, Count
-from .utilities import queryset_skip_next, set_tags, add_or_update_location, get_google_geo_info
-from .enums import ParticipantStatus
+from .utilities import queryset_skip_next, set_tags, add_or_update_location, get_google_geo_info, encode_cursor, decode_cursor
+from .enums import ParticipantStatus, DiscoverSort
+from .discovery import DiscoveryPlanner
+from .pubsub import publish_event_update
+from .cache import event_cache, location_cache, object_caches
+from .deletion import hide_deleted_users, soft_delete_event
+from . import archive, rsvp
 
 
 
@@ -28,9 +32,26 @@ class LocationType(DjangoObjectType):
 
 
 class EventType(DjangoObjectType):
+    distance = graphene.Float()
+
     class Meta:
         model = Event
 
+    def resolve_distance(self, info, **kwargs):
+        # Only set when the event was fetched through a distance query
+        return getattr(self, 'distance', None)
+
+    def resolve_location(self, info, **kwargs):
+        if Event.location.is_cached(self):
+            return self.location
+        return location_cache.get(self.location_id, info.context)
+
+    def resolve_participants(self, info, **kwargs):
+        return hide_deleted_users(self.participants.all())
+
+    def resolve_posts(self, info, **kwargs):
+        return hide_deleted_users(self.posts.all())
+
 
 class TagType(DjangoObjectType):
     class Meta:
@@ -42,6 +63,28 @@ class PostType(DjangoObjectType):
         model = Post
 
 
+class ParticipantSnapshotType(DjangoObjectType):
+    class Meta:
+        model = ParticipantSnapshot
+        exclude_fields = ['id', 'event']
+
+
+class CacheStatsType(graphene.ObjectType):
+    name = graphene.String()
+    size = graphene.Int()
+    hits = graphene.Int()
+    misses = graphene.Int()
+    request_hits = graphene.Int()
+    hit_ratio = graphene.Float()
+
+
+class PostFeedType(graphene.ObjectType):
+    posts = graphene.List(PostType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+    total_count = graphene.Int()
+
+
 class TagInput(graphene.InputObjectType):
     id = graphene.Int()
     text = graphene.String(required=True)
@@ -70,6 +113,14 @@ class LocationInput(graphene.InputObjectType):
     street = graphene.String()
 
 
+def publish_participant(participant):
+    publish_event_update(participant.event_id, 'participant', {
+        'id': participant.id,
+        'user_id': participant.user_id,
+        'status': participant.status,
+    })
+
+
 class CreatePost(graphene.Mutation):
     post = graphene.Field(PostType)
 
@@ -83,7 +134,7 @@ class CreatePost(graphene.Mutation):
         if user.is_anonymous:
             raise GraphQLError('User not logged in!')
 
-        event = Event.objects.get(pk=id_event)
+        event = event_cache.get(id_event, info.context)
 
         post = Post(
             user=user,
@@ -92,6 +143,13 @@ class CreatePost(graphene.Mutation):
             body=body
         )
         post.save()
+        publish_event_update(event.id, 'post', {
+            'id': post.id,
+            'title': post.title,
+            'body': post.body,
+            'user_id': user.id,
+            'created_time': post.created_time,
+        })
         return CreatePost(post=post)
 
 
@@ -109,7 +167,7 @@ class InviteParticipant(graphene.Mutation):
             raise GraphQLError('User not logged in!')
 
         invited_user = User.objects.get(pk=id_user)
-        event = Event.Objects.get(pk=id_event)
+        event = event_cache.get(id_event, info.context)
 
         participant = Participant(
             user=invited_user,
@@ -134,7 +192,7 @@ class CreateParticipant(graphene.Mutation):
         if user.is_anonymous:
             raise GraphQLError('User not logged in!')
 
-        event = Event.objects.get(pk=id_event)
+        event = event_cache.get(id_event, info.context)
 
         participant = Participant(
             user=user,
@@ -142,6 +200,7 @@ class CreateParticipant(graphene.Mutation):
             status=status,
         )
         participant.save()
+        publish_participant(participant)
         return CreateParticipant(participant=participant)
 
 
@@ -164,6 +223,7 @@ class UpdateParticipant(graphene.Mutation):
 
         participant.status=status
         participant.save()
+        publish_participant(participant)
         return UpdateParticipant(participant=participant)
 
 
@@ -281,6 +341,14 @@ class UpdateEvent(graphene.Mutation):
         event.organizer=user
         event.location=location
         event.save()
+        publish_event_update(event.id, 'event', {
+            'id': event.id,
+            'title': event.title,
+            'description': event.description,
+            'starts_at': event.starts_at,
+            'ends_at': event.ends_at,
+            'location_id': location.id,
+        })
         return UpdateEvent(event=event)
 
 
@@ -295,12 +363,15 @@ class DeleteEvent(graphene.Mutation):
 
         if user.is_anonymous:
             raise GraphQLError('User not logged in!')
-        event = Event.objects.get(pk=id)
+        event = event_cache.get(id, info.context)
 
-        if user.id != event.organizer.id:
+        if user.id != event.organizer_id:
             raise GraphQLError('You can only delete your own events!')
 
-        event.delete()
+        # Hidden right away, the purge_event job deletes it with its
+        # participants and posts in the background
+        soft_delete_event(event)
+        publish_event_update(event.id, 'deleted', {'id': event.id})
         return DeleteEvent(id=id)
 
 
@@ -349,10 +420,47 @@ class Query(graphene.ObjectType):
         longitude=graphene.Float(),
         only_future=graphene.Boolean(),
         proximity=graphene.Int(),
+        from_=graphene.types.datetime.DateTime(name='from'),
+        to=graphene.types.datetime.DateTime(),
+        first=graphene.Int(),
+        skip=graphene.Int(),
+    )
+
+    discover_events = graphene.List(
+        EventType,
+        lat=graphene.Float(required=True),
+        lng=graphene.Float(required=True),
+        radius_km=graphene.Float(),
+        from_=graphene.types.datetime.DateTime(name='from'),
+        to=graphene.types.datetime.DateTime(),
+        tags=graphene.List(graphene.String),
+        sort=DiscoverSort(),
+        only_future=graphene.Boolean(),
         first=graphene.Int(),
         skip=graphene.Int(),
     )
 
+    recommended_events = graphene.List(
+        EventType,
+        first=graphene.Int(),
+    )
+
+    event_posts = graphene.Field(
+        PostFeedType,
+        id_event=graphene.Int(required=True),
+        first=graphene.Int(),
+        after=graphene.String(),
+    )
+
+    rsvp_trend = graphene.List(
+        ParticipantSnapshotType,
+        id_event=graphene.Int(required=True),
+        from_=graphene.types.datetime.DateTime(name='from'),
+        to=graphene.types.datetime.DateTime(),
+    )
+
+    cache_stats = graphene.List(CacheStatsType)
+
     tags = graphene.List(
         TagType,
         search=graphene.String(),
@@ -388,14 +496,83 @@ class Query(graphene.ObjectType):
         qs = qs.annotate(num_events=Count('events')).order_by('-num_events')
         return queryset_skip_next(qs=qs, first=first, skip=skip)
 
+    def resolve_discover_events(self, info, lat, lng, radius_km=10, from_=None, to=None, tags=None, sort='DISTANCE', only_future=True, first=None, skip=None, **kwargs):
+        planner = DiscoveryPlanner(
+            latitude=lat,
+            longitude=lng,
+            radius_km=radius_km,
+            start=from_,
+            end=to,
+            tags=tags,
+            only_future=only_future,
+        )
+        qs = planner.queryset(sort=sort).select_related('location')
+        return queryset_skip_next(qs=qs, first=first, skip=skip)
+
+    def resolve_recommended_events(self, info, first=20, **kwargs):
+        user = info.context.user or None
+        if user.is_anonymous:
+            raise GraphQLError('User not logged in!')
+
+        qs = Event.objects.filter(recommendations__user=user).upcoming()\
+            .order_by('recommendations__rank')\
+            .select_related('location')
+        return qs[:first]
+
+    def resolve_event_posts(self, info, id_event, first=20, after=None, **kwargs):
+        position = None
+        if after:
+            position = decode_cursor(after)
+            if position is None:
+                raise GraphQLError('Invalid cursor!')
+
+        first = max(1, min(first, 100))
+        event = Event.objects.only('post_count').get(pk=id_event)
+
+        # One extra row tells if there is another page
+        posts = list(hide_deleted_users(Post.feed(id_event, after=position)).select_related('user__profile')[:first + 1])
+        has_next_page = len(posts) > first
+        posts = posts[:first]
+
+        end_cursor = None
+        if posts:
+            end_cursor = encode_cursor(posts[-1].created_time, posts[-1].id)
+
+        return PostFeedType(
+            posts=posts,
+            end_cursor=end_cursor,
+            has_next_page=has_next_page,
+            total_count=event.post_count,
+        )
+
+    def resolve_rsvp_trend(self, info, id_event, from_=None, to=None, **kwargs):
+        user = info.context.user or None
+        if user.is_anonymous:
+            raise GraphQLError('User not logged in!')
+
+        if not Event.objects.filter(pk=id_event, organizer=user).exists():
+            raise GraphQLError('Only the organizer can see the RSVP trend')
+        return rsvp.trend(id_event, start=from_, end=to)
+
     def resolve_event(self, info, id, **kwargs):
-        return Event.objects.get(pk=id)
+        return event_cache.get(id, info.context, archived=True)
+
+    def resolve_cache_stats(self, info, **kwargs):
+        user = info.context.user or None
+        if not user.is_staff:
+            raise GraphQLError('Only staff can see the cache stats')
+
+        return [CacheStatsType(name=name, **cache.stats()) for name, cache in sorted(object_caches.items())]
 
     def resolve_participant(self, info, id, **kwargs):
-        return Participant.objects.get(pk=id)
+        participant = archive.get(Participant, id)
+        if not participant.user.is_active:
+            # Deleted account, not purged yet
+            return None
+        return participant
 
     def resolve_participants(self, info, **kwargs):
-        return Participant.objects.all()
+        return hide_deleted_users(Participant.objects.filter(event__deleted_time=None))
 
     def resolve_locations(self, info, **kwargs):
         user = info.context.user or None
@@ -411,7 +588,7 @@ class Query(graphene.ObjectType):
         if user.is_anonymous:
             raise GraphQLError('User not logged in')
 
-        return user.profile.location
+        return location_cache.get(user.profile.location_id, info.context)
 
     def resolve_my_locations(self, info, **kwargs):
         user = info.context.user or None
@@ -430,13 +607,17 @@ class Query(graphene.ObjectType):
 
         return Event.objects.filter(organizer=user)
 
-    def resolve_events(self, info, filter_type='ALL', latitude=None, longitude=None, proximity=10, only_future=True, first=None, skip=None, **kwargs):
+    def resolve_events(self, info, filter_type='ALL', latitude=None, longitude=None, proximity=10, only_future=True, from_=None, to=None, first=None, skip=None, **kwargs):
         user = info.context.user or None
 
-        qs = Event.objects.all()
+        qs = Event.objects.select_related('location')
 
         if only_future:
-            qs = qs.filter(start_date__gte=datetime.datetime.now())
+            qs = qs.upcoming()
+
+        if from_ or to:
+            # Calendar view, everything happening during the window
+            qs = qs.overlapping(start=from_, end=to).order_by('starts_at')
 
         if filter_type == 'ALL':
             return queryset_skip_next(qs=qs, first=first, skip=skip)
@@ -457,7 +638,6 @@ class Query(graphene.ObjectType):
 
 
             qs = qs.filter(participants__user__id=user.id, participants__status='GOING')
-            print(qs)
             return queryset_skip_next(qs=qs, first=first, skip=skip)
         elif filter_type == 'MINE':
             # TBI
@@ -0,0 +1,81 @@
+import logging
+
+from django.conf import settings
+
+from .jobs import job, schedule
+from .models import Location
+from . import archive, deletion, locations, recommendations, rsvp, utilities
+
+
+logger = logging.getLogger(__name__)
+
+
+@job()
+def geocode_location(location_id):
+    location = Location.objects.filter(pk=location_id).first()
+    if location is None or location.latitude is not None:
+        # Deleted, or geocoded by an earlier run
+        return
+
+    (lat, lng, g_id, formatted_address) = utilities.get_google_geo_info(
+        country=location.country,
+        city=location.city,
+        street=location.street
+    )
+
+    if not g_id:
+        logger.warning('No geocoding result for location #%s', location_id)
+        return
+
+    existing = Location.objects.filter(google_id=g_id).exclude(pk=location_id).first()
+    if existing is not None:
+        # The geocoder found a place we already have
+        locations.merge_locations(existing.pk, [location_id])
+        return
+
+    location.latitude = lat
+    location.longitude = lng
+    location.google_id = g_id
+    location.google_formatted_address = formatted_address
+    location.save()
+
+
+@job()
+def purge_event(event_id):
+    deletion.purge_event(event_id)
+
+
+@job()
+def purge_account(user_id):
+    deletion.purge_account(user_id)
+
+
+@job()
+def refresh_recommendations():
+    # Next run first, so a failing or crashed run doesn't end the schedule
+    schedule_recommendations()
+    recommendations.compute_recommendations()
+
+
+def schedule_recommendations():
+    schedule('refresh_recommendations', settings.RECOMMENDATIONS_INTERVAL_SECONDS)
+
+
+@job()
+def snapshot_participants():
+    schedule_snapshots()
+    rsvp.take_snapshots()
+
+
+def schedule_snapshots():
+    schedule('snapshot_participants', settings.PARTICIPANT_SNAPSHOT_INTERVAL_SECONDS)
+
+
+@job()
+def archive_events():
+    schedule_archival()
+    archive.archive_events()
+
+
+def schedule_archival():
+    schedule('archive_events', settings.ARCHIVE_INTERVAL_SECONDS)
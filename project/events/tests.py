@@ -1,3 +1,1521 @@
-from django.test import TestCase
+import collections
+import datetime
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.deletion import Collector
+from django.db.models.query import QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.utils import timezone
+from graphql import parse
+from graphql_jwt.shortcuts import get_token
+
+from project import admission, documents, profiling, routers, serialization, warmup
+from project.middleware import CompressionMiddleware
+from project.replication import replicate_sqlite
+from project.routers import ReplicaRouter
+from project.schema import schema
+from project.settings import database_config
+from . import archive, auth, benchmark, deletion, geoindex, jobs, locations, pubsub, recommendations, rsvp, transfer
+from . import cache as object_cache
+from .discovery import DiscoveryPlanner
+from .geoindex import GeoIndex
+from .models import (
+    Event, Friendship, Job, Location, Participant, ParticipantLog, Post, Profile, Recommendation, Tag,
+    StagedFile, Watermark, haversine_expression,
+)
+from .utilities import add_or_update_location, bulk_create_ids
+from .views import event_stream
+
+
+class GraphQLTestCase(TestCase):
+
+    def setUp(self):
+        # Ids are reused once a test rolls back
+        object_cache.clear()
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user(
+            username='organizer', password='secret')
+        self.location = Location.objects.create(
+            city='Stockholm', country='Sweden', street='Drottninggatan 1',
+            google_id='place-sthlm', latitude=59.3293, longitude=18.0686)
+
+    def execute(self, query, variables=None, user=None):
+        request = self.factory.post('/graphql/')
+        request.user = user or AnonymousUser()
+        result = schema.execute(query, variable_values=variables, context_value=request)
+        self.assertIsNone(result.errors, result.errors)
+        return result.data
+
+    def create_event(self, start, end=None, **kwargs):
+        fields = dict(
+            title='Event',
+            start_date=start.date(),
+            start_time=start.time(),
+            end_date=end.date() if end else None,
+            end_time=end.time() if end else None,
+            organizer=self.user,
+            location=self.location,
+            min_participants=1,
+            max_participants=10,
+        )
+        fields.update(kwargs)
+        return Event.objects.create(**fields)
+
+
+class EventTimeRangeTests(GraphQLTestCase):
+
+    def test_time_range_is_derived_on_save(self):
+        start = datetime.datetime(2030, 5, 1, 22, 0)
+        event = self.create_event(start, end_time=datetime.time(2, 0))
+
+        self.assertEqual(event.starts_at, timezone.make_aware(start))
+        self.assertEqual(event.ends_at, timezone.make_aware(datetime.datetime(2030, 5, 2, 2, 0)))
+
+    def test_events_without_end_end_when_they_start(self):
+        event = self.create_event(datetime.datetime(2030, 5, 1, 12, 0))
+        self.assertEqual(event.starts_at, event.ends_at)
+
+    def test_overlapping_window(self):
+        before = self.create_event(datetime.datetime(2030, 1, 1, 10), datetime.datetime(2030, 1, 1, 12))
+        spanning = self.create_event(datetime.datetime(2030, 1, 1, 10), datetime.datetime(2030, 1, 3, 12))
+        inside = self.create_event(datetime.datetime(2030, 1, 2, 10), datetime.datetime(2030, 1, 2, 12))
+        # No end, so it ends as it starts
+        at_start = self.create_event(datetime.datetime(2030, 1, 2))
+        self.create_event(datetime.datetime(2030, 1, 3))
+        self.create_event(datetime.datetime(2030, 1, 4, 10))
+
+        window = (
+            timezone.make_aware(datetime.datetime(2030, 1, 2)),
+            timezone.make_aware(datetime.datetime(2030, 1, 3)),
+        )
+        ids = set(Event.objects.overlapping(*window).values_list('id', flat=True))
+
+        self.assertEqual(ids, {spanning.id, inside.id, at_start.id})
+        self.assertNotIn(before.id, ids)
+
+    def test_only_future_includes_running_events(self):
+        now = timezone.localtime().replace(tzinfo=None)
+        running = self.create_event(now - datetime.timedelta(hours=1), now + datetime.timedelta(hours=1))
+        self.create_event(now - datetime.timedelta(days=2), now - datetime.timedelta(days=1))
+
+        data = self.execute('{ events { id } }')
+
+        self.assertEqual([e['id'] for e in data['events']], [str(running.id)])
+
+    def test_events_range_query(self):
+        self.create_event(datetime.datetime(2030, 1, 1, 10), title='Early')
+        self.create_event(datetime.datetime(2030, 2, 1, 10), title='Late')
+
+        data = self.execute(
+            'query ($from: DateTime, $to: DateTime) { events(from: $from, to: $to) { title } }',
+            variables={'from': '2030-01-01T00:00:00+00:00', 'to': '2030-01-31T00:00:00+00:00'})
+
+        self.assertEqual([e['title'] for e in data['events']], ['Early'])
+
+
+class LocationDistanceTests(GraphQLTestCase):
+
+    def test_trig_columns_follow_coordinates(self):
+        self.location.latitude = 0
+        self.location.longitude = 90
+        self.location.save()
+        self.location.refresh_from_db()
+
+        self.assertAlmostEqual(self.location.sin_lat, 0)
+        self.assertAlmostEqual(self.location.cos_lat, 1)
+        self.assertAlmostEqual(self.location.sin_lng, 1)
+        self.assertAlmostEqual(self.location.lng_rad, math.pi / 2)
+
+    def test_precomputed_distance_matches_haversine(self):
+        uppsala = Location.objects.create(
+            city='Uppsala', country='Sweden', latitude=59.8586, longitude=17.6389)
+
+        nearby = Location.objects.nearby(latitude=59.33, longitude=18.07, proximity=100)
+        reference = Location.objects.annotate(d=haversine_expression(59.33, 18.07))
+
+        self.assertEqual([l.id for l in nearby], [self.location.id, uppsala.id])
+        for location in nearby:
+            self.assertAlmostEqual(location.distance, reference.get(pk=location.pk).d, places=6)
+
+
+class GeoIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = GeoIndex(rebuild_threshold=3)
+        self.index.load(
+            [1, 2, 3],
+            [math.radians(59.33), math.radians(59.86), math.radians(57.71)],
+            [math.radians(18.07), math.radians(17.64), math.radians(11.97)])
+
+    def radius(self, latitude, longitude, km):
+        ids, _ = self.index.radius(math.radians(latitude), math.radians(longitude), km)
+        return ids.tolist()
+
+    def test_radius_sorted_by_distance(self):
+        self.assertEqual(self.radius(59.33, 18.07, 100), [1, 2])
+        self.assertEqual(self.radius(59.33, 18.07, 10), [1])
+
+    def test_upsert_and_remove(self):
+        self.index.upsert(3, math.radians(59.34), math.radians(18.08))
+        self.index.upsert(4, math.radians(59.35), math.radians(18.09))
+        self.index.remove(1)
+
+        self.assertEqual(self.radius(59.33, 18.07, 10), [3, 4])
+        self.assertEqual(len(self.index), 3)
+
+    def test_nearest(self):
+        ids, distances = self.index.nearest(math.radians(59.33), math.radians(18.07), 2)
+
+        self.assertEqual(ids.tolist(), [1, 2])
+        self.assertAlmostEqual(distances[1], 64, delta=2)
+
+
+@override_settings(GEO_ENGINE='memory')
+class GeoEngineNearbyTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        geoindex.reset()
+        self.addCleanup(geoindex.reset)
+
+    def test_nearby_uses_index(self):
+        Location.objects.create(city='Uppsala', country='Sweden', latitude=59.8586, longitude=17.6389)
+
+        self.assertEqual(Location.objects.nearby_ids(59.33, 18.07, 10), [self.location.id])
+        self.assertEqual([l.id for l in Location.objects.nearby(59.33, 18.07, 10)], [self.location.id])
+
+    def test_reload_picks_up_queryset_updates(self):
+        # Newer, so the sync starts after the Stockholm location
+        Location.objects.create(city='Uppsala', country='Sweden', latitude=59.8586, longitude=17.6389)
+        self.assertEqual(Location.objects.nearby_ids(59.33, 18.07, 10), [self.location.id])
+        # Moved to Uppsala without a timestamp change
+        Location.objects.filter(pk=self.location.pk).update(lat_rad=math.radians(59.8586), lng_rad=math.radians(17.6389))
+
+        with self.settings(GEO_ENGINE_SYNC_INTERVAL=0, GEO_ENGINE_RELOAD_INTERVAL=0):
+            self.assertEqual(geoindex.geo_index().radius(math.radians(59.33), math.radians(18.07), 10)[0].tolist(), [])
+
+
+class DiscoverEventsTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.uppsala = Location.objects.create(
+            city='Uppsala', country='Sweden', google_id='place-uppsala',
+            latitude=59.8586, longitude=17.6389)
+        self.gothenburg = Location.objects.create(
+            city='Gothenburg', country='Sweden', google_id='place-gbg',
+            latitude=57.7089, longitude=11.9746)
+        self.start = datetime.datetime(2030, 6, 1, 18)
+
+    def test_nearby_filter(self):
+        self.create_event(self.start, title='Stockholm')
+        self.create_event(self.start, title='Gothenburg', location=self.gothenburg)
+
+        data = self.execute('{ events(filterType: "NEARBY", latitude: 59.33, longitude: 18.07, proximity: 10) { title } }')
+
+        self.assertEqual([e['title'] for e in data['events']], ['Stockholm'])
+
+    def test_sorted_by_distance_with_distance_field(self):
+        self.create_event(self.start, title='Uppsala', location=self.uppsala)
+        self.create_event(self.start + datetime.timedelta(days=1), title='Stockholm')
+        self.create_event(self.start, title='Gothenburg', location=self.gothenburg)
+
+        data = self.execute('{ discoverEvents(lat: 59.33, lng: 18.07, radiusKm: 100) { title distance } }')
+
+        self.assertEqual([e['title'] for e in data['discoverEvents']], ['Stockholm', 'Uppsala'])
+        self.assertLess(data['discoverEvents'][0]['distance'], 1)
+        self.assertAlmostEqual(data['discoverEvents'][1]['distance'], 64, delta=2)
+
+    def test_sort_by_start(self):
+        self.create_event(self.start, title='Uppsala', location=self.uppsala)
+        self.create_event(self.start + datetime.timedelta(days=1), title='Stockholm')
+
+        data = self.execute('{ discoverEvents(lat: 59.33, lng: 18.07, radiusKm: 100, sort: START) { title } }')
+
+        self.assertEqual([e['title'] for e in data['discoverEvents']], ['Uppsala', 'Stockholm'])
+
+    def test_time_and_tag_filters(self):
+        tagged = self.create_event(self.start, title='Tagged')
+        later = self.create_event(self.start + datetime.timedelta(days=30), title='Later')
+        self.create_event(self.start, title='Untagged')
+        tag = Tag.objects.create(text='Music')
+        tag.events.add(tagged, later)
+
+        data = self.execute(
+            'query ($from: DateTime, $to: DateTime) { discoverEvents(lat: 59.33, lng: 18.07, radiusKm: 5, from: $from, to: $to, tags: ["music"]) { title } }',
+            variables={'from': '2030-06-01T00:00:00+00:00', 'to': '2030-06-02T00:00:00+00:00'})
+
+        self.assertEqual([e['title'] for e in data['discoverEvents']], ['Tagged'])
+
+    def test_plan_starts_with_most_selective_predicate(self):
+        for _ in range(3):
+            self.create_event(self.start)
+        tagged = self.create_event(self.start)
+        Tag.objects.create(text='Rare').events.add(tagged)
+
+        planner = DiscoveryPlanner(59.33, 18.07, 5, tags=['rare'])
+
+        self.assertEqual([name for name, _ in planner.plan()][0], 'tags')
+
+
+class PostFeedTests(GraphQLTestCase):
+
+    query = '''
+        query ($idEvent: Int!, $first: Int, $after: String) {
+            eventPosts(idEvent: $idEvent, first: $first, after: $after) {
+                posts { id body user { username } }
+                endCursor
+                hasNextPage
+                totalCount
+            }
+        }
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(datetime.datetime(2030, 1, 1, 10))
+        for i in range(5):
+            Post.objects.create(event=self.event, user=self.user, title='Post', body=str(i))
+        # Ties on created_time are broken by id
+        Post.objects.filter(body__in=['1', '2', '3']).update(created_time=timezone.now())
+
+    def test_post_count_follows_posts(self):
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.post_count, 5)
+
+        Post.objects.filter(body='0').get().delete()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.post_count, 4)
+
+    def test_pages_walk_the_feed_newest_first(self):
+        expected = [p.body for p in Post.objects.order_by('-created_time', '-id')]
+        bodies, after = [], None
+        while True:
+            feed = self.execute(self.query, {'idEvent': self.event.id, 'first': 2, 'after': after})['eventPosts']
+            bodies += [post['body'] for post in feed['posts']]
+            self.assertEqual(feed['totalCount'], 5)
+            if not feed['hasNextPage']:
+                break
+            after = feed['endCursor']
+
+        self.assertEqual(bodies, expected)
+
+    def test_page_is_loaded_with_authors(self):
+        # The event count, then the posts joined with their authors
+        with self.assertNumQueries(2):
+            self.execute(self.query, {'idEvent': self.event.id, 'first': 3})
+
+
+class PubSubTests(SimpleTestCase):
+
+    def test_subscribers_receive_their_topic(self):
+        broker = pubsub.InProcessBroker()
+        first = broker.subscribe('event:1')
+        other = broker.subscribe('event:2')
+
+        broker.publish('event:1', 'post', {'id': 1})
+        self.assertEqual(first.get(timeout=0).data, {'id': 1})
+        self.assertIsNone(other.get(timeout=0))
+
+        first.close()
+        other.close()
+        self.assertEqual(dict(broker.subscribers), {})
+
+    def test_slow_subscribers_drop_the_oldest_messages(self):
+        broker = pubsub.InProcessBroker(queue_size=2)
+        subscription = broker.subscribe('event:1')
+        for i in range(3):
+            broker.publish('event:1', 'post', i)
+
+        self.assertEqual([subscription.get(timeout=0).data for _ in range(2)], [1, 2])
+
+    def test_subscribing_with_last_id_replays_history(self):
+        broker = pubsub.InProcessBroker()
+        seen = broker.publish('event:1', 'post', 'seen')
+        broker.publish('event:1', 'post', 'missed')
+
+        subscription = broker.subscribe('event:1', last_id=seen.id)
+        self.assertEqual(subscription.get(timeout=0).data, 'missed')
+        self.assertIsNone(subscription.get(timeout=0))
+
+
+class EventStreamTests(TransactionTestCase):
+
+    def setUp(self):
+        pubsub.reset()
+        self.user = get_user_model().objects.create_user(username='organizer', password='secret')
+        location = Location.objects.create(city='Stockholm', country='Sweden', latitude=59.3, longitude=18.0)
+        self.event = Event.objects.create(
+            title='Event', start_date=datetime.date(2030, 1, 1), start_time=datetime.time(10),
+            organizer=self.user, location=location, min_participants=1, max_participants=10)
+
+    def test_mutations_are_streamed_after_commit(self):
+        request = RequestFactory().post('/graphql/')
+        request.user = self.user
+        result = schema.execute('''
+            mutation ($id: Int!) {
+                createPost(idEvent: $id, title: "Hi", body: "Hello") { post { id } }
+            }
+        ''', variable_values={'id': self.event.id}, context_value=request)
+        self.assertIsNone(result.errors)
+
+        # Reconnecting clients get what they missed
+        request = RequestFactory().get('/events/{}/stream/'.format(self.event.id), HTTP_LAST_EVENT_ID='0')
+        response = event_stream(request, self.event.id)
+        chunks = iter(response.streaming_content)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+        message = next(chunks).decode()
+        self.assertIn('event: post\n', message)
+        self.assertIn('"body": "Hello"', message)
+        response.close()
+        self.assertEqual(dict(pubsub.broker().subscribers), {})
+
+    def test_processes_share_the_database_broker(self):
+        # Two brokers stand for two processes
+        publisher = pubsub.DatabaseBroker(poll_interval=0.01)
+        subscriber = pubsub.DatabaseBroker(poll_interval=0.01)
+        seen = publisher.publish('event:1', 'post', 'seen')
+        subscription = subscriber.subscribe('event:1')
+        missed = publisher.publish('event:1', 'post', 'missed')
+        publisher.publish('event:2', 'post', 'other')
+
+        self.assertEqual(subscription.get(timeout=5), missed)
+        self.assertIsNone(subscription.get(timeout=0.05))
+        # Reconnecting to the other process
+        replay = publisher.subscribe('event:1', last_id=seen.id)
+        self.assertEqual(replay.get(timeout=0), missed)
+        subscription.close()
+        replay.close()
+
+    def test_soft_deletes_invalidate_other_processes(self):
+        other_process = pubsub.DatabaseBroker(poll_interval=0.01).subscribe(object_cache.INVALIDATIONS_TOPIC)
+        deletion.soft_delete_account(self.user)
+        message = other_process.get(timeout=5)
+        self.assertEqual((message.kind, message.data), ('events.event', [self.event.pk]))
+
+        object_cache.event_cache.entries.set(self.event.pk, self.event)
+        other_process.put(message)
+        other_process.close()
+        object_cache.apply_invalidations(other_process)
+        self.assertIsNone(object_cache.event_cache.entries.get(self.event.pk))
+
+    def test_open_streams_are_limited(self):
+        request = RequestFactory().get('/events/{}/stream/'.format(self.event.id))
+        responses = [event_stream(request, self.event.id) for _ in range(settings.PUBSUB_MAX_STREAMS)]
+        refused = event_stream(request, self.event.id)
+        self.assertEqual(refused.status_code, 503)
+        self.assertIn('Retry-After', refused)
+
+        # Closing a stream that never started frees its place
+        responses.pop().close()
+        responses.append(event_stream(request, self.event.id))
+        self.assertEqual(responses[-1].status_code, 200)
+        for response in responses:
+            response.close()
+
+
+class CachedJWTMiddlewareTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        auth.clear()
+        self.profile = Profile.objects.create(
+            user=self.user, location=self.location, first_name='Ada', last_name='Lovelace')
+        self.middleware = auth.CachedJSONWebTokenMiddleware()
+
+    def authenticate(self, token=None):
+        token = token or get_token(self.user)
+        request = self.factory.post('/graphql/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+        request.user = AnonymousUser()
+        return request, self.middleware.process_request(request)
+
+    def test_known_tokens_authenticate_without_queries(self):
+        token = get_token(self.user)
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+
+        with self.assertNumQueries(0):
+            request, response = self.authenticate(token)
+            self.assertIsNone(response)
+            self.assertEqual(request.user.profile.first_name, 'Ada')
+
+    def test_saving_the_profile_refreshes_the_user(self):
+        request, _ = self.authenticate()
+        request.user.profile.first_name = 'Changed in a request'
+
+        self.profile.first_name = 'Grace'
+        self.profile.save()
+
+        with self.assertNumQueries(1):
+            request, _ = self.authenticate()
+        self.assertEqual(request.user.profile.first_name, 'Grace')
+
+    def test_invalid_and_disabled_users_are_rejected(self):
+        _, response = self.authenticate('not-a-token')
+        self.assertEqual(response.status_code, 401)
+
+        self.user.is_active = False
+        self.user.save()
+        _, response = self.authenticate()
+        self.assertEqual(response.status_code, 401)
+
+
+attempts = []
+cleaned_up = []
+
+
+@jobs.job(name='test_flaky', max_attempts=2, on_failure=lambda fail_times: cleaned_up.append(fail_times))
+def flaky_job(fail_times):
+    attempts.append(fail_times)
+    if len(attempts) <= fail_times:
+        raise RuntimeError('Try again')
+
+
+class JobQueueTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        del attempts[:]
+        del cleaned_up[:]
+
+    def make_due(self):
+        Job.objects.update(run_after=timezone.now())
+
+    def test_keys_make_enqueue_idempotent(self):
+        first = jobs.enqueue('test_flaky', key='once', fail_times=0)
+        second = jobs.enqueue('test_flaky', key='once', fail_times=0)
+        self.assertEqual(first.pk, second.pk)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        jobs.enqueue('test_flaky', fail_times=1)
+        with self.assertLogs('events.jobs', 'WARNING'):
+            jobs.run_pending()
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('Try again', job.last_error)
+        self.assertEqual(jobs.run_pending(), 0)
+
+        self.make_due()
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_jobs_fail_after_max_attempts(self):
+        jobs.enqueue('test_flaky', fail_times=5)
+        with self.assertLogs('events.jobs', 'WARNING'):
+            jobs.run_pending()
+            self.make_due()
+            jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertEqual(cleaned_up, [5])
+
+    def test_failed_runs_keep_the_schedule(self):
+        jobs.enqueue('refresh_recommendations')
+        Job.objects.update(max_attempts=1)
+        with mock.patch('events.recommendations.compute_recommendations', side_effect=RuntimeError), \
+                self.assertLogs('events.jobs', 'ERROR'):
+            jobs.run_pending()
+
+        self.assertEqual(Job.objects.get(key=None).status, Job.FAILED)
+        self.assertEqual(Job.objects.get(key__startswith='refresh-recommendations-').status, Job.PENDING)
+
+    def test_profile_pictures_are_uploaded_by_the_worker(self):
+        picture = io.BytesIO()
+        Image.new('RGB', (20, 20)).save(picture, format='png')
+        staged = StagedFile.objects.create(data=picture.getvalue())
+        profile = Profile.objects.create(user=self.user, location=self.location)
+        jobs.enqueue(
+            'process_profile_picture',
+            profile_id=profile.pk,
+            staged_file_id=staged.pk,
+            filename='picture.png',
+            extension='png',
+            crop=[0, 0, 10, 10])
+
+        with mock.patch('users.schema.s3') as s3:
+            self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(s3.Bucket().put_object.call_args[1]['Key'], 'picture.png')
+        self.assertFalse(StagedFile.objects.exists())
+        profile.refresh_from_db()
+        self.assertTrue(profile.profile_picture.endswith('/picture.png'))
+
+    def test_expired_leases_are_taken_over(self):
+        job = jobs.enqueue('test_flaky', fail_times=0)
+        self.assertEqual(len(jobs.claim(10)), 1)
+        self.assertEqual(jobs.claim(10), [])
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(len(jobs.claim(10)), 1)
+
+    def test_expired_leases_on_the_last_attempt_fail(self):
+        job = jobs.enqueue('test_flaky', fail_times=0)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING,
+            attempts=2,
+            locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        with self.assertLogs('events.jobs', 'ERROR'):
+            self.assertEqual(jobs.claim(10), [])
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertEqual(cleaned_up, [0])
+
+    def test_locations_are_geocoded_in_the_background(self):
+        address = SimpleNamespace(city='Uppsala', country='Sweden', street='Storgatan 1')
+        location = add_or_update_location(address)
+        self.assertIsNone(location.latitude)
+        self.assertEqual(add_or_update_location(address).pk, location.pk)
+
+        with benchmark.stubbed_geocoder():
+            self.assertEqual(jobs.run_pending(), 1)
+
+        location.refresh_from_db()
+        self.assertIsNotNone(location.latitude)
+        self.assertIsNotNone(location.cos_lat)
+
+
+class LocationDedupeTests(GraphQLTestCase):
+    multi_db = True
+
+    def test_place_ids_are_unique(self):
+        address = SimpleNamespace(city='Stockholm', country='Sweden', street='Kungsgatan 2', google_id='place-sthlm')
+        self.assertEqual(add_or_update_location(address).pk, self.location.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Location.objects.create(city='Stockholm', country='Sweden', google_id='place-sthlm')
+
+        # Addresses without a place id don't collide
+        for street in ('Storgatan 1', 'Storgatan 2'):
+            add_or_update_location(SimpleNamespace(google_id=None, city='Uppsala', country='Sweden', street=street))
+        self.assertEqual(Location.objects.filter(google_id=None).count(), 2)
+
+    def test_client_place_ids_are_not_trusted(self):
+        ungeocoded = Location.objects.create(city='Uppsala', country='Sweden', street='Storgatan 1', google_id='place-upps')
+        location = add_or_update_location(
+            SimpleNamespace(google_id='place-upps', city='Uppsala', country='Sweden', street='Kungsgatan 3'))
+        self.assertNotEqual(location.pk, ungeocoded.pk)
+        self.assertIsNone(location.google_id)
+
+        # The same address, however it's typed
+        same = add_or_update_location(
+            SimpleNamespace(google_id='made-up', city='uppsala ', country='SWEDEN', street='Kungsgatan  3'))
+        self.assertEqual(same.pk, location.pk)
+        self.assertFalse(Location.objects.filter(google_id='made-up').exists())
+
+    def test_locations_are_locked_per_address(self):
+        for street in ('Storgatan 1', 'Storgatan 2'):
+            add_or_update_location(SimpleNamespace(google_id=None, city='Uppsala', country='Sweden', street=street))
+        self.assertEqual(Watermark.objects.filter(name__startswith='lock:address:').count(), 2)
+
+    def test_first_increments_can_race(self):
+        update = QuerySet.update
+        calls = []
+
+        def concurrent_create(queryset, **kwargs):
+            # Another caller creates the row between our update and create
+            calls.append(kwargs)
+            if len(calls) == 1:
+                Watermark.objects.create(name='counter', value=1)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', concurrent_create):
+            Watermark.increment('counter')
+        self.assertEqual(Watermark.objects.get(name='counter').value, 2)
+
+    def test_geocoding_merges_into_the_known_place(self):
+        first = add_or_update_location(SimpleNamespace(google_id=None, city='Uppsala', country='Sweden', street='Storgatan 1'))
+        second = add_or_update_location(SimpleNamespace(google_id=None, city='Uppsala', country='Sweden', street='Storgatan 1A'))
+        event = self.create_event(datetime.datetime(2030, 1, 1, 20), location=second)
+        with benchmark.stubbed_geocoder():
+            self.assertEqual(jobs.run_pending(), 2)
+
+        self.assertFalse(Location.objects.filter(pk=second.pk).exists())
+        event.refresh_from_db()
+        self.assertEqual(event.location_id, first.pk)
+
+    def test_merge_locations_in_batches(self):
+        duplicate = Location.objects.create(city='Stockholm', country='Sweden', google_id='place-sthlm-2')
+        for day in (1, 2, 3):
+            self.create_event(datetime.datetime(2030, 1, day, 20), location=duplicate)
+        Profile.objects.create(user=self.user, location=duplicate)
+
+        with CaptureQueriesContext(connection) as queries:
+            moved = locations.merge_locations(self.location.pk, [duplicate.pk], batch_size=2)
+        self.assertEqual(moved, 4)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "events_event"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(Event.objects.filter(location=self.location).count(), 3)
+        self.assertEqual(Profile.objects.get().location_id, self.location.pk)
+        self.assertFalse(Location.objects.filter(pk=duplicate.pk).exists())
+
+    def test_locations_still_in_use_are_not_deleted(self):
+        duplicate = Location.objects.create(city='Stockholm', country='Sweden', google_id='place-sthlm-2')
+        unused = Location.objects.create(city='Stockholm', country='Sweden', google_id='place-sthlm-3')
+        # Attached after the events were moved
+        event = self.create_event(datetime.datetime(2030, 1, 1, 20), location=duplicate)
+
+        self.assertEqual(locations.delete_unreferenced([duplicate.pk, unused.pk], global_apps, 'default'), {unused.pk})
+        self.assertTrue(Event.objects.filter(pk=event.pk).exists())
+        self.assertEqual(locations.merge_locations(self.location.pk, [duplicate.pk]), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.location_id, self.location.pk)
+        self.assertFalse(Location.objects.filter(pk=duplicate.pk).exists())
+
+
+class TransferTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.guest = get_user_model().objects.create_user(username='guest', password='secret')
+        for day in range(1, 4):
+            event = self.create_event(datetime.datetime(2030, 1, day, 18), event_type='music')
+            event.tags.add(Tag.objects.get_or_create(text='Jazz {}'.format(day % 2))[0])
+            Participant.objects.create(event=event, user=self.guest, status='GOING')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_bulk_create_ids_in_insertion_order(self):
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            ids = bulk_create_ids(Tag, [Tag(text='Tag {}'.format(i)) for i in range(5)], batch_size=2)
+        self.assertEqual([Tag.objects.get(pk=pk).text for pk in ids], ['Tag {}'.format(i) for i in range(5)])
+        # SQLite returns no ids, the write lock is taken before reading the last one
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('UPDATE "events_watermark"'), statements[0])
+
+    def snapshot(self):
+        records = list(transfer.export_records())
+        for record in records:
+            del record['id']
+        return records
+
+    def round_trip(self, format):
+        path = os.path.join(self.directory, 'events.' + format)
+        call_command('export_events', format=format, output=path, stderr=io.StringIO())
+        before = self.snapshot()
+
+        Event.objects.all().delete()
+        call_command('import_events', path, batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_jsonl_round_trip(self):
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_import_matches_locations_like_the_web(self):
+        existing = Location.objects.create(city='Uppsala', country='Sweden', street='main st')
+        location = dict(city='Uppsala', country='Sweden', street='Main  St', google_id='made-up')
+        records = [
+            dict(title='Import', start_date='2030-01-01', start_time='20:00', organizer='organizer', location=location),
+            dict(title='Import', start_date='2030-01-01', start_time='20:00', organizer='organizer',
+                 location=dict(location, street='Other St')),
+        ]
+        counts = transfer.EventImporter(geocode=False).run(records)
+
+        self.assertEqual(counts['locations'], 1)
+        self.assertEqual(Event.objects.filter(title='Import', location=existing).count(), 1)
+        self.assertFalse(Location.objects.filter(google_id='made-up').exists())
+
+    def test_export_reads_in_chunks(self):
+        # Events, tags and participants per chunk, then the empty chunk
+        with self.assertNumQueries(2 * 3 + 1):
+            self.assertEqual(len(list(transfer.export_records(chunk_size=2))), 3)
+
+    def test_xls_export(self):
+        path = os.path.join(self.directory, 'events.xls')
+        call_command('export_events', format='xls', output=path, stderr=io.StringIO())
+        with open(path, 'rb') as stream:
+            self.assertEqual(stream.read(4), b'\xd0\xcf\x11\xe0')
+
+
+class RecommendationTests(GraphQLTestCase):
+
+    query = '{ recommendedEvents(first: 10) { title } }'
+
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.viewer = User.objects.create_user(username='viewer', password='secret')
+        friend = User.objects.create_user(username='friend', password='secret')
+        viewer_profile = Profile.objects.create(user=self.viewer, location=self.location, first_name='V', last_name='V')
+        friend_profile = Profile.objects.create(user=friend, location=self.location, first_name='F', last_name='F')
+        Friendship.objects.create(requested_by=self.viewer).profiles.add(viewer_profile, friend_profile)
+
+        gothenburg = Location.objects.create(city='Gothenburg', country='Sweden', latitude=57.7089, longitude=11.9746)
+        # About 5 km north of Stockholm
+        solna = Location.objects.create(city='Solna', country='Sweden', latitude=59.3743, longitude=18.0686)
+        jazz = Tag.objects.create(text='jazz')
+
+        past = self.create_event(datetime.datetime(2000, 1, 1, 20), title='Past')
+        past.tags.add(jazz)
+        Participant.objects.create(event=past, user=self.viewer, status='GOING')
+
+        self.create_event(datetime.datetime(2030, 1, 1, 20), title='Jazz far away', location=gothenburg).tags.add(jazz)
+        with_friend = self.create_event(datetime.datetime(2030, 1, 2, 20), title='Friend going')
+        Participant.objects.create(event=with_friend, user=friend, status='GOING')
+        self.create_event(datetime.datetime(2030, 1, 3, 20), title='Close by', location=solna)
+        self.create_event(datetime.datetime(2030, 1, 4, 20), title='Own event', organizer=self.viewer)
+        going = self.create_event(datetime.datetime(2030, 1, 5, 20), title='Already going')
+        Participant.objects.create(event=going, user=self.viewer, status='GOING')
+
+    def test_ranking(self):
+        recommendations.compute_recommendations()
+
+        with self.assertNumQueries(1):
+            data = self.execute(self.query, user=self.viewer)
+        titles = [event['title'] for event in data['recommendedEvents']]
+        self.assertEqual(titles, ['Friend going', 'Jazz far away', 'Close by'])
+
+    def test_recomputing_replaces_the_ranking(self):
+        recommendations.compute_recommendations()
+        Event.objects.filter(title='Friend going').delete()
+        recommendations.compute_recommendations(per_user=1)
+
+        data = self.execute(self.query, user=self.viewer)
+        self.assertEqual(data['recommendedEvents'], [{'title': 'Jazz far away'}])
+
+
+class BatchedGraphQLTests(GraphQLTestCase):
+
+    def post(self, body, **extra):
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json', **extra)
+
+    def test_operations_share_the_request(self):
+        auth.clear()
+        event = self.create_event(datetime.datetime(2030, 1, 1, 20), title='Launch')
+        query = 'query ($id: Int) { event(id: $id) { title } }'
+        token = get_token(self.user)
+        self.post({'query': '{ me { username } }'}, HTTP_AUTHORIZATION='JWT {}'.format(token))
+
+        # The second operation gets the event from the identity map
+        with self.assertNumQueries(1):
+            response = self.post([
+                {'query': '{ me { username } }'},
+                {'query': query, 'variables': {'id': event.pk}, 'id': 'second'},
+                {'query': query, 'variables': {'id': event.pk}},
+            ], HTTP_AUTHORIZATION='JWT {}'.format(token))
+
+        results = response.json()
+        self.assertEqual(results[0]['data'], {'me': {'username': 'organizer'}})
+        self.assertEqual(results[1]['id'], 'second')
+        self.assertEqual(results[1]['data'], results[2]['data'])
+        self.assertEqual(results[2]['data'], {'event': {'title': 'Launch'}})
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        with self.settings(GRAPHQL_MAX_BATCH_SIZE=1):
+            self.assertEqual(self.post([{'query': '{ tags { text } }'}] * 2).status_code, 400)
+
+        response = self.post([{'query': '{ tags { text } }'}, {'query': '{ nope }'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()], [200, 400])
+
+        # Single operations are answered as before
+        self.assertEqual(self.post({'query': '{ tags { text } }'}).json(), {'data': {'tags': []}})
+
+
+@override_settings(
+    GRAPHQL_OPERATION_LIMITS={'search': {'concurrency': 1, 'rate': 0.01, 'burst': 2}},
+    GRAPHQL_ADMISSION_QUEUE_SECONDS=0.05)
+class AdmissionControlTests(GraphQLTestCase):
+
+    search = {'query': '{ profiles(search: "ann") { id } }'}
+
+    def setUp(self):
+        super().setUp()
+        admission.reset()
+        cache.clear()
+
+    def post(self, body, **extra):
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json', **extra)
+
+    def test_classify(self):
+        query = parse('query ($f: String) { events(filterType: $f) { id } tags { text } }')
+        self.assertEqual(admission.classify(query, variables={'f': 'NEARBY'}), ['nearby'])
+        self.assertEqual(admission.classify(query, variables={'f': 'ALL'}), [])
+
+        query = parse('{ ...F } fragment F on Query { profiles(search: "ann") { id } discoverEvents { id } }')
+        self.assertEqual(admission.classify(query), ['nearby', 'search'])
+        self.assertEqual(admission.classify(parse('mutation { profilePicture { ok } }')), ['upload'])
+
+    def test_users_are_rate_limited(self):
+        self.assertEqual(self.post(self.search).status_code, 200)
+        self.assertEqual(self.post(self.search).status_code, 200)
+        response = self.post(self.search)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 1)
+
+        # Only per user and only the expensive operations
+        self.assertEqual(self.post(self.search, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.post({'query': '{ tags { text } }'}).status_code, 200)
+
+    def test_operations_waiting_too_long_are_shed(self):
+        limit = admission.get_limit('search')
+        limit.slots.acquire()
+        try:
+            with self.assertLogs('project.admission', 'WARNING'):
+                response = self.post(self.search)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()['errors'][0]['message'], 'The server is busy, try again later.')
+            self.assertEqual(self.post({'query': '{ tags { text } }'}).status_code, 200)
+        finally:
+            limit.release()
+
+        # Late on arrival, shed before counting
+        late = 't={}'.format(int(time.time() * 1000) - 1000)
+        with self.assertLogs('project.admission', 'WARNING'):
+            self.assertEqual(self.post(self.search, HTTP_X_REQUEST_START=late).status_code, 503)
+
+        # Shed operations don't use up the rate
+        self.assertEqual(self.post(self.search).status_code, 200)
+        self.assertEqual(self.post(self.search).status_code, 200)
+        self.assertEqual(self.post(self.search).status_code, 429)
+
+    def test_arrival_time(self):
+        request = self.factory.get('/graphql/', HTTP_X_REQUEST_START='t={}'.format(int(time.time() * 1000) - 2000))
+        self.assertAlmostEqual(admission.arrival_time(request), time.time() - 2, delta=0.5)
+        self.assertAlmostEqual(admission.arrival_time(self.factory.get('/graphql/')), time.time(), delta=0.5)
+
+
+class ProfilingTests(GraphQLTestCase):
+
+    query = '{ tags { text events { title } } }'
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        tag = Tag.objects.create(text='music')
+        tag.events.add(self.create_event(datetime.datetime(2030, 1, 1, 20), title='Launch'))
+
+    def post(self, **extra):
+        with self.settings(GRAPHQL_PROFILE_DIR=self.directory):
+            return self.client.post('/graphql/', json.dumps({'query': self.query}),
+                                    content_type='application/json', **extra)
+
+    def load(self, name):
+        with open(os.path.join(self.directory, name + '.json')) as f:
+            return json.load(f)
+
+    def test_staff_profile_requests_by_header(self):
+        token = 'JWT {}'.format(get_token(self.user))
+        self.assertNotIn('X-Gather-Profile', self.post(HTTP_AUTHORIZATION=token, HTTP_X_GATHER_PROFILE='1'))
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.post(HTTP_AUTHORIZATION=token, HTTP_X_GATHER_PROFILE='1')
+        self.assertEqual(response.json(), {'data': {'tags': [{'text': 'music', 'events': [{'title': 'Launch'}]}]}})
+
+        name = response['X-Gather-Profile']
+        self.assertTrue(os.path.exists(os.path.join(self.directory, name + '.collapsed')))
+        profile = self.load(name)
+        self.assertEqual(profile['operations'][0]['query'], self.query)
+        self.assertEqual(profile['resolvers']['tags.events.title']['count'], 1)
+        self.assertEqual(sorted(profile['resolvers']), ['tags', 'tags.events', 'tags.events.title', 'tags.text'])
+
+    def test_sample_rate(self):
+        with self.settings(GRAPHQL_PROFILE_SAMPLE_RATE=1):
+            self.assertIn('X-Gather-Profile', self.post())
+        self.assertNotIn('X-Gather-Profile', self.post())
+
+    def test_profiles_keep_no_credentials(self):
+        mutation = 'mutation ($username: String!, $password: String!) { tokenAuth(username: $username, password: $password) { token } }'
+        credentials = {'username': 'organizer', 'password': 'secret'}
+        with self.settings(GRAPHQL_PROFILE_DIR=self.directory, GRAPHQL_PROFILE_SAMPLE_RATE=1):
+            response = self.client.post('/graphql/', json.dumps({'query': mutation, 'variables': credentials}),
+                                        content_type='application/json')
+            self.assertIn('token', response.json()['data']['tokenAuth'])
+            self.assertNotIn('X-Gather-Profile', response)
+
+            response = self.client.post('/graphql/', json.dumps({'query': self.query, 'variables': credentials}),
+                                        content_type='application/json')
+        profile = self.load(response['X-Gather-Profile'])
+        self.assertEqual(profile['operations'][0]['variable_types'], {'username': 'str', 'password': 'str'})
+        self.assertNotIn('secret', json.dumps(profile))
+
+    def test_sampler_collapses_stacks(self):
+        profile = profiling.Profile(interval=0.001).start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        profile.stop()
+        self.assertGreater(profile.elapsed_ms, 40)
+        stack, count = profile.stacks.most_common(1)[0]
+        self.assertTrue(stack.endswith('events.tests.test_sampler_collapses_stacks'), stack)
+
+    def test_profile_operation_replays_a_profile(self):
+        path = os.path.join(self.directory, 'operation.json')
+        with open(path, 'w') as f:
+            json.dump({'query': self.query}, f)
+
+        out = io.StringIO()
+        call_command('profile_operation', path, repeat=3, output=self.directory, stdout=out)
+        name = out.getvalue().split('profile ')[1].split()[0]
+        self.assertEqual(self.load(name)['resolvers']['tags.events.title']['count'], 3)
+        self.assertIn('    title', out.getvalue())
+
+
+class ConditionalGetTests(GraphQLTestCase):
+
+    def get(self, query, **extra):
+        return self.client.get('/graphql/', {'query': query}, HTTP_ACCEPT='application/json', **extra)
+
+    def test_unchanged_results_are_not_modified(self):
+        query = '{ tags { text } }'
+        Tag.objects.create(text='jazz')
+        response = self.get(query)
+        etag = response['ETag']
+        self.assertIn('Authorization', response['Vary'])
+
+        with self.assertNumQueries(1):
+            response = self.get(query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Compression makes the ETag weak
+        self.assertEqual(self.get(query, HTTP_IF_NONE_MATCH='W/' + etag).status_code, 304)
+
+        # Tags are ordered by their event count
+        self.create_event(datetime.datetime(2030, 1, 1, 20))
+        response = self.get(query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        Tag.objects.all().delete()
+        self.assertNotEqual(self.get(query)['ETag'], response['ETag'])
+
+    def test_unversioned_queries(self):
+        self.assertFalse(self.get('{ recommendedEvents { title } }').has_header('ETag'))
+        # Users have no timestamp
+        self.assertFalse(self.get('{ events { organizer { username } } }').has_header('ETag'))
+        self.assertTrue(self.get('{ events { title location { city } } }').has_header('ETag'))
+
+    def test_deletes_are_counted_once(self):
+        event = self.create_event(datetime.datetime(2030, 1, 1, 20))
+        for i in range(20):
+            user = get_user_model().objects.create_user(username='user{}'.format(i))
+            Participant.objects.create(event=event, user=user)
+
+        with CaptureQueriesContext(connection) as queries:
+            Participant.objects.filter(event=event).delete()
+        watermark_updates = [q for q in queries if q['sql'].startswith('UPDATE "events_watermark"')]
+        self.assertEqual(len(watermark_updates), 1)
+        self.assertFalse(Collector('default').can_fast_delete(Tag.objects.all()))
+        # Models neither ETags nor caches read keep their fast deletes
+        self.assertTrue(Collector('default').can_fast_delete(Job.objects.all()))
+        self.assertTrue(Collector('default').can_fast_delete(Recommendation.objects.all()))
+
+    def test_results_are_not_read_from_the_object_cache(self):
+        event = self.create_event(datetime.datetime(2030, 1, 1, 20))
+        object_cache.event_cache.get(event.pk)
+        # As if another process renamed the event
+        Event.objects.filter(pk=event.pk).update(title='Renamed', timestamp=timezone.now())
+
+        query = '{{ event(id: {}) {{ title }} }}'.format(event.pk)
+        response = self.get(query)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(json.loads(response.content.decode())['data']['event']['title'], 'Renamed')
+
+
+class ObjectCacheTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(datetime.datetime(2030, 1, 1, 20))
+        object_cache.clear()
+
+    def test_read_through(self):
+        first_request = self.factory.get('/')
+        with self.assertNumQueries(1):
+            event = object_cache.event_cache.get(self.event.pk, first_request)
+            self.assertIs(object_cache.event_cache.get(self.event.pk, first_request), event)
+
+        # Other requests get their own copy from the process cache
+        with self.assertNumQueries(0):
+            other = object_cache.event_cache.get(self.event.pk, self.factory.get('/'))
+        self.assertIsNot(other, event)
+        self.assertEqual(other.title, event.title)
+
+        stats = object_cache.event_cache.stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['request_hits']), (1, 1, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+
+    def test_writes_invalidate(self):
+        object_cache.event_cache.get(self.event.pk)
+        self.event.title = 'Renamed'
+        self.event.save()
+        self.assertEqual(object_cache.event_cache.get(self.event.pk).title, 'Renamed')
+
+        # post_count changes through a queryset update
+        Post.objects.create(event=self.event, user=self.user, title='Hi', body='Hi')
+        self.assertEqual(object_cache.event_cache.get(self.event.pk).post_count, 1)
+
+        pk = self.event.pk
+        self.event.delete()
+        with self.assertRaises(Event.DoesNotExist):
+            object_cache.event_cache.get(pk)
+
+    def test_event_locations(self):
+        self.create_event(datetime.datetime(2030, 1, 2, 20))
+        query = '{ event(id: %d) { location { city } } }' % self.event.pk
+
+        with self.assertNumQueries(2):
+            self.execute(query)
+        with self.assertNumQueries(0):
+            data = self.execute(query)
+        self.assertEqual(data['event']['location']['city'], 'Stockholm')
+
+        with self.assertNumQueries(1):
+            data = self.execute('{ events { location { city } } }')
+        self.assertEqual(len(data['events']), 2)
+
+
+class RsvpHistoryTests(GraphQLTestCase):
+
+    query = '''
+        query ($id: Int!, $from: DateTime) {
+            rsvpTrend(idEvent: $id, from: $from) { hour going interested changes }
+        }
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(datetime.datetime(2030, 1, 1, 20))
+        self.guest = get_user_model().objects.create_user(username='guest', password='secret')
+
+    def log(self, old_status, status, hour, minute=0):
+        return ParticipantLog.objects.create(
+            event_id=self.event.pk, user_id=self.guest.pk,
+            old_status=ParticipantLog.CODES.get(old_status, 0),
+            status=ParticipantLog.CODES.get(status, 0),
+            time=datetime.datetime(2025, 12, 1, hour, minute, tzinfo=timezone.utc))
+
+    def test_only_status_changes_are_logged(self):
+        participant = Participant.objects.create(event=self.event, user=self.guest, status='INTERESTED')
+        participant = Participant.objects.get(pk=participant.pk)
+        participant.save()
+        participant.status = 'GOING'
+        participant.save()
+        participant.delete()
+
+        log = ParticipantLog.objects.order_by('pk').values_list('old_status', 'status')
+        self.assertEqual(list(log), [(0, 1), (1, 2), (2, 0)])
+
+    def test_snapshots_are_running_totals(self):
+        self.log(None, 'INTERESTED', 10, 5)
+        self.log('INTERESTED', 'GOING', 10, 30)
+        self.log(None, 'GOING', 12)
+        self.assertEqual(rsvp.take_snapshots(), 3)
+
+        # The next run adds to the latest hour
+        self.log('GOING', 'NOTGOING', 12, 40)
+        self.assertEqual(rsvp.take_snapshots(), 1)
+        self.assertEqual(rsvp.take_snapshots(), 0)
+
+        snapshots = self.event.participant_snapshots.order_by('hour')
+        self.assertEqual(
+            [(s.hour.hour, s.interested, s.going, s.not_going, s.changes) for s in snapshots],
+            [(10, 0, 1, 0, 2), (12, 0, 1, 1, 2)])
+
+    def test_snapshots_wait_for_rows_to_commit(self):
+        # The newer row got the lower id, rows after it might not be committed yet
+        recent = self.log(None, 'GOING', 10)
+        ParticipantLog.objects.filter(pk=recent.pk).update(time=timezone.now())
+        self.log(None, 'INTERESTED', 9)
+        self.assertEqual(rsvp.take_snapshots(), 0)
+
+        with self.settings(PARTICIPANT_SNAPSHOT_LAG_SECONDS=0):
+            self.assertEqual(rsvp.take_snapshots(), 2)
+
+    def test_rsvp_trend(self):
+        self.log(None, 'GOING', 9)
+        self.log(None, 'INTERESTED', 10)
+        self.log(None, 'GOING', 11)
+        rsvp.take_snapshots()
+
+        data = self.execute(self.query, {'id': self.event.pk, 'from': '2025-12-01T10:30:00+00:00'}, user=self.user)
+        trend = [(point['going'], point['interested']) for point in data['rsvpTrend']]
+        self.assertEqual(trend, [(1, 0), (1, 1), (2, 1)])
+
+        request = self.factory.post('/graphql/')
+        request.user = self.guest
+        result = schema.execute(self.query, variable_values={'id': self.event.pk}, context_value=request)
+        self.assertEqual(result.errors[0].message, 'Only the organizer can see the RSVP trend')
+
+
+class DeletionTests(GraphQLTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.event = self.create_event(datetime.datetime(2030, 1, 1, 20))
+        self.guest = get_user_model().objects.create_user(username='guest', password='secret')
+        Participant.objects.bulk_create(
+            Participant(event=self.event, user=get_user_model().objects.create_user(username='user{}'.format(i)))
+            for i in range(5))
+        Post.objects.create(event=self.event, user=self.guest, title='Hi', body='Hi')
+
+    def test_deleted_events_are_hidden_then_purged(self):
+        event_cache = object_cache.event_cache
+        event_cache.get(self.event.pk)
+        data = self.execute('mutation ($id: Int!) { deleteEvent(id: $id) { id } }', {'id': self.event.pk}, user=self.user)
+        self.assertEqual(data['deleteEvent']['id'], self.event.pk)
+
+        self.assertFalse(Event.objects.filter(pk=self.event.pk).exists())
+        with self.assertRaises(Event.DoesNotExist):
+            event_cache.get(self.event.pk)
+        self.assertEqual(self.execute('{ participants { id } }'), {'participants': []})
+        self.assertEqual(Participant.objects.count(), 5)
+
+        with self.settings(PURGE_BATCH_SIZE=2):
+            self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(Event.all_objects.filter(pk=self.event.pk).exists())
+        self.assertEqual((Participant.objects.count(), Post.objects.count()), (0, 0))
+
+    def test_delete_in_batches(self):
+        logged = ParticipantLog.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            deleted = deletion.delete_in_batches(Participant.objects.all(), batch_size=2)
+        self.assertEqual(deleted, 5)
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE FROM "events_participant"')]
+        self.assertEqual(len(deletes), 3)
+        watermark_updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "events_watermark"')]
+        self.assertEqual(len(watermark_updates), 3)
+        # Purges aren't RSVP changes
+        self.assertEqual(ParticipantLog.objects.count(), logged)
+
+    def test_delete_account(self):
+        profile = Profile.objects.create(user=self.guest, location=self.location)
+        friend = Profile.objects.create(user=self.user, location=self.location)
+        friendship = Friendship.objects.create(requested_by=self.guest)
+        friendship.profiles.add(profile, friend)
+        self.create_event(datetime.datetime(2030, 2, 1, 20), organizer=self.guest)
+
+        Participant.objects.create(event=self.event, user=self.guest)
+        query = '''
+            query ($id: Int!) {
+                event(id: $id) { participants { user { username } } posts { title } }
+                eventPosts(idEvent: $id) { posts { title } }
+            }
+        '''
+        self.assertEqual(len(self.execute(query, {'id': self.event.pk})['event']['posts']), 1)
+
+        data = self.execute('mutation { deleteAccount { ok } }', user=self.guest)
+        self.assertTrue(data['deleteAccount']['ok'])
+        # Until the purge job runs
+        object_cache.clear()
+        data = self.execute(query, {'id': self.event.pk})
+        self.assertEqual((data['event']['posts'], data['eventPosts']['posts']), ([], []))
+        self.assertEqual(len(data['event']['participants']), 5)
+        data = self.execute('{ participants { user { username } } }')
+        self.assertNotIn('guest', [participant['user']['username'] for participant in data['participants']])
+        self.assertEqual(Event.objects.filter(organizer=self.guest).count(), 0)
+        self.assertFalse(Profile.objects.filter(user=self.guest).exists())
+        self.assertNotIn(str(self.guest.pk), [user['id'] for user in self.execute('{ users { id } }')['users']])
+        self.assertEqual(self.execute('{ friendships { id } }', user=self.user), {'friendships': []})
+
+        jobs.run_pending()
+        self.assertFalse(get_user_model().objects.filter(pk=self.guest.pk).exists())
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(Event.all_objects.filter(organizer_id=self.guest.pk).count(), 0)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.post_count, 0)
+
+
+class ArchiveTests(GraphQLTestCase):
+    multi_db = True
+
+    query = '''
+        query ($id: Int) {
+            event(id: $id) {
+                title organizer { username } location { city }
+                participants { status user { username } }
+                posts { title } tags { text }
+            }
+        }
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.guest = get_user_model().objects.create_user(username='guest', password='secret')
+        self.past = self.create_event(datetime.datetime(2020, 1, 1, 20), title='Past')
+        self.upcoming = self.create_event(datetime.datetime(2030, 1, 1, 20), title='Upcoming')
+        for event in (self.past, self.upcoming):
+            Participant.objects.create(event=event, user=self.guest, status='GOING')
+            Post.objects.create(event=event, user=self.guest, title='Hi', body='Hi')
+            Recommendation.objects.create(user=self.guest, event=event, rank=1, score=1, computed_time=timezone.now())
+        tag = Tag.objects.create(text='music')
+        tag.events.add(self.past, self.upcoming)
+
+    def test_finished_events_are_moved_to_the_archive(self):
+        created_time = self.past.created_time
+        self.assertEqual(archive.archive_events(batch_size=1), 1)
+        self.assertEqual(archive.archive_events(), 0)
+
+        self.assertEqual(list(Event.objects.values_list('title', flat=True)), ['Upcoming'])
+        self.assertEqual(Participant.objects.get().event_id, self.upcoming.pk)
+        self.assertEqual(Post.objects.get().event_id, self.upcoming.pk)
+        self.assertEqual(Recommendation.objects.get().event_id, self.upcoming.pk)
+
+        archived = Event.objects.using('archive').get()
+        self.assertEqual((archived.pk, archived.created_time), (self.past.pk, created_time))
+        self.assertEqual(Participant.objects.using('archive').get().event_id, self.past.pk)
+        self.assertEqual(Tag.objects.using('archive').get().text, 'music')
+
+    def test_lookups_fall_back_to_the_archive(self):
+        participant = self.past.participants.get()
+        archive.archive_events()
+
+        data = self.execute(self.query, {'id': self.past.pk})
+        self.assertEqual(data['event'], {
+            'title': 'Past',
+            'organizer': {'username': 'organizer'},
+            'location': {'city': 'Stockholm'},
+            'participants': [{'status': 'GOING', 'user': {'username': 'guest'}}],
+            'posts': [{'title': 'Hi'}],
+            'tags': [{'text': 'music'}],
+        })
+        self.assertEqual(archive.get(Participant, participant.pk).status, 'GOING')
+
+        # Writes only see live events
+        with self.assertRaises(Event.DoesNotExist):
+            object_cache.event_cache.get(self.past.pk)
+
+
+class AdminTests(GraphQLTestCase):
+
+    changelists = ['event', 'participant', 'location', 'profile', 'tag', 'post', 'friendship']
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'),
+                                backend='django.contrib.auth.backends.ModelBackend')
+
+    def add_rows(self, count):
+        offset = get_user_model().objects.count()
+        for i in range(offset, offset + count):
+            user = get_user_model().objects.create_user(username='user{}'.format(i))
+            location = Location.objects.create(city='Uppsala', country='Sweden', google_id='place-{}'.format(i))
+            profile = Profile.objects.create(user=user, location=location, first_name='A', last_name='B')
+            event = self.create_event(datetime.datetime(2030, 1, 1 + i % 28, 20), title='Event {}'.format(i),
+                                      organizer=user, location=location)
+            Participant.objects.create(event=event, user=user)
+            Post.objects.create(event=event, user=user, title='Hi', body='Hi')
+            Tag.objects.create(text='tag{}'.format(i)).events.add(event)
+            Friendship.objects.create(requested_by=user).profiles.add(profile)
+
+    def changelist_queries(self, name, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/events/{}/'.format(name), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        self.add_rows(2)
+        before = {name: self.changelist_queries(name) for name in self.changelists}
+        self.add_rows(6)
+        after = {name: self.changelist_queries(name) for name in self.changelists}
+        self.assertEqual(before, after)
+
+    def test_counts_are_estimated_past_the_limit(self):
+        self.add_rows(5)
+        last = Event.objects.order_by('pk').last()
+        Event.objects.filter(pk=Event.objects.order_by('pk').first().pk).delete()
+        with self.settings(ADMIN_EXACT_COUNT_LIMIT=3):
+            self.assertEqual(self.client.get('/admin/events/event/').context['cl'].result_count, last.pk)
+            response = self.client.get('/admin/events/event/', {'q': 'Event'})
+            self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertEqual(self.client.get('/admin/events/event/').context['cl'].result_count, 4)
+
+    def test_indexed_search(self):
+        self.add_rows(3)
+        event = Event.objects.get(title='Event 2')
+        response = self.client.get('/admin/events/event/', {'q': 'Event 2'})
+        self.assertEqual(list(response.context['cl'].result_list), [event])
+        response = self.client.get('/admin/events/event/', {'q': str(event.pk)})
+        self.assertEqual(list(response.context['cl'].result_list), [event])
+        # Prefixes only, and case sensitive
+        self.assertEqual(self.client.get('/admin/events/event/', {'q': 'vent'}).context['cl'].result_count, 0)
+
+        response = self.client.get('/admin/events/participant/', {'q': 'user2'})
+        self.assertEqual([participant.user.username for participant in response.context['cl'].result_list], ['user2'])
+
+
+class DatabaseSettingsTests(TestCase):
+
+    def test_sqlite_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_database_url(self):
+        config = database_config('postgres://gather:secret@db:5432/gather', 'unused')
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql_psycopg2')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertIn('connect_timeout', config['OPTIONS'])
+        self.assertGreater(config['CONN_MAX_AGE'], 0)
+
+
+class ResponsePipelineTests(SimpleTestCase):
+
+    def tearDown(self):
+        serialization.reset()
+
+    def respond(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware().process_response(request, response)
+
+    def test_large_responses_are_compressed(self):
+        content = b'{"data":' + b'"event",' * 500 + b'}'
+        response = self.respond(HttpResponse(content))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_responses_left_alone(self):
+        large = b'x' * 2048
+        self.assertFalse(self.respond(HttpResponse(b'{}')).has_header('Content-Encoding'))
+        self.assertFalse(self.respond(HttpResponse(large), 'gzip;q=0').has_header('Content-Encoding'))
+        self.assertFalse(self.respond(StreamingHttpResponse([large])).has_header('Content-Encoding'))
+
+    def test_encoders(self):
+        self.assertEqual(serialization.available()[-1], 'json')
+        with self.settings(JSON_ENCODER='json'):
+            serialization.reset()
+            self.assertEqual(serialization.dumps({'data': {'tags': [], 'ok': True}}), '{"data":{"tags":[],"ok":true}}')
+
+
+class WarmupTests(SimpleTestCase):
+    allow_database_queries = True
+
+    def test_documents_are_parsed_once(self):
+        document, errors = documents.get_document(schema, '{ tags { text } }')
+        self.assertEqual(errors, [])
+        self.assertIs(documents.get_document(schema, '{ tags { text } }')[0], document)
+        self.assertTrue(documents.get_document(schema, '{ nope }')[1])
+
+    def test_warm_up(self):
+        documents.documents.clear()
+        timings = warmup.warm_up()
+
+        self.assertEqual(list(timings)[:3], ['imports', 'schema', 'documents'])
+        self.assertEqual(len(documents.documents), len(warmup.warm_queries()))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(SimpleTestCase):
+    allow_database_queries = True
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.alice = get_user_model()(pk=1, username='alice')
+        self.bob = get_user_model()(pk=2, username='bob')
+        cache.clear()
+
+    def read_db(self):
+        return self.router.db_for_read(Event)
+
+    def test_queries_read_from_replica(self):
+        self.assertEqual(self.read_db(), 'default')
+        with routers.operation('query', self.alice):
+            self.assertEqual(self.read_db(), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Event), 'default')
+        self.assertEqual(self.read_db(), 'default')
+
+    def test_mutations_pin_the_user_to_the_primary(self):
+        with routers.operation('mutation', self.alice):
+            self.assertEqual(self.read_db(), 'default')
+
+        with routers.operation('query', self.alice):
+            self.assertEqual(self.read_db(), 'default')
+        with routers.operation('query', self.bob):
+            self.assertEqual(self.read_db(), 'replica_0')
+
+    def test_transactions_read_from_primary(self):
+        with routers.operation('query', self.bob), transaction.atomic():
+            self.assertEqual(self.read_db(), 'default')
+
+    def test_operations_read_from_one_replica(self):
+        with self.settings(DATABASE_REPLICAS=['replica_0', 'replica_1']):
+            with routers.operation('query', self.bob) as replica:
+                self.assertEqual({self.read_db() for i in range(20)}, {replica})
+            with routers.operation('query', self.bob, replica='replica_1') as replica:
+                self.assertEqual((replica, self.read_db()), ('replica_1', 'replica_1'))
+
+
+class ReplicationTests(SimpleTestCase):
+
+    def test_replicate_sqlite(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary = os.path.join(directory, 'primary.sqlite3')
+        replica = os.path.join(directory, 'replica.sqlite3')
+
+        db = sqlite3.connect(primary)
+        db.execute('CREATE TABLE tag (id INTEGER PRIMARY KEY, text TEXT)')
+        db.execute('CREATE INDEX tag_text ON tag (text)')
+        db.execute("INSERT INTO tag (text) VALUES ('music')")
+        db.commit()
+        replicate_sqlite(primary, replica)
+
+        reader = sqlite3.connect(replica)
+        self.assertEqual(reader.execute('SELECT text FROM tag').fetchall(), [('music',)])
+
+        db.execute("INSERT INTO tag (text) VALUES ('food')")
+        db.commit()
+        db.close()
+        replicate_sqlite(primary, replica)
+
+        self.assertEqual(reader.execute('SELECT count(*) FROM tag').fetchone()[0], 2)
+        indexes = reader.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+        self.assertEqual(indexes, [('tag_text',)])
+        reader.close()
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_and_run_catalogue(self):
+        call_command('seed_synthetic', users=30, stdout=io.StringIO())
+
+        self.assertEqual(get_user_model().objects.count(), 30)
+        self.assertEqual(Event.objects.count(), 60)
+        posts = collections.Counter(Post.objects.values_list('event_id', flat=True))
+        self.assertTrue(posts)
+        self.assertEqual(dict(Event.objects.filter(post_count__gt=0).values_list('pk', 'post_count')), posts)
+
+        report = benchmark.run_catalogue(schema, iterations=2, warmup=0)
+
+        self.assertEqual(set(report['operations']), {o['name'] for o in benchmark.OPERATIONS})
+        self.assertEqual(report['operations']['tags_autocomplete']['queries'], 1)
+        # The createEvent runs are rolled back
+        self.assertEqual(Event.objects.count(), 60)
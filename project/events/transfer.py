@@ -0,0 +1,340 @@
+"""
+Streaming export and import of events with their location, tags and
+participants, used by the export_events and import_events commands.
+Both work a chunk at a time so memory doesn't grow with the number of
+events.
+"""
+import collections
+import csv
+import itertools
+import json
+
+import xlwt
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_date, parse_time
+
+from .models import Event, Location, Participant, ParticipantLog, Tag, address_key
+from .utilities import bulk_create_ids, lock_address
+from . import jobs
+
+
+EVENT_FIELDS = (
+    'title', 'description', 'start_date', 'start_time', 'end_date', 'end_time',
+    'event_type', 'min_participants', 'max_participants',
+)
+
+LOCATION_FIELDS = (
+    'city', 'country', 'street', 'google_id', 'google_formatted_address',
+    'latitude', 'longitude',
+)
+
+COLUMNS = (
+    ('id',) + EVENT_FIELDS + ('organizer',) +
+    tuple('location_' + field for field in LOCATION_FIELDS) +
+    ('tags', 'participants')
+)
+
+# Rows per sheet in the XLS format
+XLS_MAX_ROWS = 65535
+
+
+def export_records(queryset=None, chunk_size=1000):
+    """
+    Yield every event as a dict, reading chunk_size events at a time in id
+    order together with their tags and participants
+    """
+    queryset = queryset if queryset is not None else Event.objects.all()
+    last = 0
+    while True:
+        events = list(
+            queryset.filter(pk__gt=last)
+            .select_related('location', 'organizer')
+            .order_by('pk')[:chunk_size])
+        if not events:
+            return
+        ids = [event.pk for event in events]
+
+        tags = collections.defaultdict(list)
+        links = Tag.events.through.objects.filter(event_id__in=ids).order_by('tag__text')
+        for event_id, text in links.values_list('event_id', 'tag__text'):
+            tags[event_id].append(text)
+
+        participants = collections.defaultdict(list)
+        rows = Participant.objects.filter(event_id__in=ids).order_by('pk')
+        for event_id, username, status in rows.values_list('event_id', 'user__username', 'status'):
+            participants[event_id].append({'user': username, 'status': status})
+
+        for event in events:
+            record = {'id': event.pk}
+            record.update((field, getattr(event, field)) for field in EVENT_FIELDS)
+            record['organizer'] = event.organizer.get_username()
+            record['location'] = {field: getattr(event.location, field) for field in LOCATION_FIELDS}
+            record['tags'] = tags[event.pk]
+            record['participants'] = participants[event.pk]
+            yield record
+
+        last = ids[-1]
+
+
+def flatten(record):
+    """
+    One CSV/XLS row of a record, lists are stored as JSON in their cell
+    """
+    row = dict(record)
+    for field, value in row.pop('location').items():
+        row['location_' + field] = value
+    row['tags'] = json.dumps(row['tags'])
+    row['participants'] = json.dumps(row['participants'])
+    return [cell_value(row.get(column)) for column in COLUMNS]
+
+
+def cell_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (int, float, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def unflatten(row):
+    record = {field: row.get(field) or None for field in ('id',) + EVENT_FIELDS + ('organizer',)}
+    record['location'] = {field: row.get('location_' + field) or None for field in LOCATION_FIELDS}
+    record['tags'] = json.loads(row.get('tags') or '[]')
+    record['participants'] = json.loads(row.get('participants') or '[]')
+    return record
+
+
+def write_jsonl(records, stream):
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, cls=DjangoJSONEncoder))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_csv(records, stream):
+    writer = csv.writer(stream)
+    writer.writerow(COLUMNS)
+    count = 0
+    for record in records:
+        writer.writerow(flatten(record))
+        count += 1
+    return count
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield unflatten(row)
+
+
+def write_xls(records, stream):
+    """
+    XLS sheets are limited to 65535 rows, longer exports continue on new
+    sheets. xlwt builds the whole workbook in memory before saving it.
+    """
+    workbook = xlwt.Workbook(encoding='utf-8')
+    sheet, row_index, count = None, XLS_MAX_ROWS, 0
+    for record in records:
+        if row_index >= XLS_MAX_ROWS:
+            sheet = workbook.add_sheet('events {}'.format(count // (XLS_MAX_ROWS - 1) + 1))
+            for column, name in enumerate(COLUMNS):
+                sheet.write(0, column, name)
+            row_index = 1
+        for column, value in enumerate(flatten(record)):
+            sheet.write(row_index, column, value)
+        row_index += 1
+        count += 1
+    if sheet is None:
+        workbook.add_sheet('events')
+    workbook.save(stream)
+    return count
+
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+    'xls': write_xls,
+}
+
+READERS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class EventImporter:
+    """
+    Creates the events of import records in batches. Locations are reused
+    by geocoded google_id or address, tags by text and users are matched by username.
+    Records whose organizer doesn't exist are skipped. Imported events get
+    new ids.
+    """
+
+    def __init__(self, batch_size=500, geocode=True):
+        self.batch_size = batch_size
+        self.geocode = geocode
+        self.counts = collections.Counter()
+
+    def run(self, records):
+        for batch in chunked(records, self.batch_size):
+            with transaction.atomic():
+                self.import_batch(batch)
+        return self.counts
+
+    def import_batch(self, batch):
+        users = self.user_ids(batch)
+        kept = [record for record in batch if record.get('organizer') in users]
+        self.counts['skipped'] += len(batch) - len(kept)
+        locations = self.location_ids(kept)
+
+        events = []
+        for record in kept:
+            event = Event(
+                title=record['title'],
+                description=record.get('description') or '',
+                start_date=parse_date(str(record['start_date'])),
+                start_time=parse_time(str(record['start_time'])),
+                end_date=parse_date(str(record['end_date'])) if record.get('end_date') else None,
+                end_time=parse_time(str(record['end_time'])) if record.get('end_time') else None,
+                event_type=record.get('event_type') or '',
+                min_participants=int(record.get('min_participants') or 0),
+                max_participants=int(record.get('max_participants') or 0),
+                organizer_id=users[record['organizer']],
+                location_id=locations[location_key(record['location'])],
+            )
+            # bulk_create skips save()
+            event.set_time_range()
+            events.append(event)
+
+        event_ids = bulk_create_ids(Event, events)
+        self.counts['events'] += len(event_ids)
+
+        self.link_tags(kept, event_ids)
+
+        participants = []
+        for record, event_id in zip(kept, event_ids):
+            seen = set()
+            for participant in record.get('participants') or []:
+                user_id = users.get(participant['user'])
+                if user_id is None or user_id in seen:
+                    continue
+                seen.add(user_id)
+                participants.append(Participant(event_id=event_id, user_id=user_id, status=participant['status']))
+        Participant.objects.bulk_create(participants, batch_size=self.batch_size)
+        ParticipantLog.bulk_append(participants, batch_size=self.batch_size)
+        self.counts['participants'] += len(participants)
+
+    def user_ids(self, batch):
+        usernames = set()
+        for record in batch:
+            usernames.add(record.get('organizer'))
+            usernames.update(p['user'] for p in record.get('participants') or [])
+
+        User = get_user_model()
+        users = User.objects.filter(**{User.USERNAME_FIELD + '__in': usernames})
+        return dict(users.values_list(User.USERNAME_FIELD, 'pk'))
+
+    def location_ids(self, batch):
+        """
+        Location ids by location_key, found as add_or_update_location finds
+        them. A place id from the file only matches a geocoded location and
+        is never stored, new locations get theirs from geocode_location.
+        """
+        wanted = {}
+        for record in batch:
+            wanted.setdefault(location_key(record['location']), record['location'])
+
+        google_ids = {google_id for google_id, _ in wanted if google_id}
+        places = dict(
+            Location.objects.filter(google_id__in=google_ids, latitude__isnull=False).values_list('google_id', 'pk'))
+        ids = {key: places[key[0]] for key in wanted if key[0] in places}
+
+        addresses = self.address_ids({address for key, address in wanted if key not in ids}, wanted)
+        for key in wanted:
+            ids.setdefault(key, addresses.get(key[1]))
+        return ids
+
+    def address_ids(self, keys, wanted):
+        existing = Location.objects.filter(address_key__in=keys).order_by('pk')
+        ids = {}
+        for key, location_id in existing.values_list('address_key', 'pk'):
+            ids.setdefault(key, location_id)
+
+        missing = sorted(keys - set(ids))
+        if not missing:
+            return ids
+        # In sorted order, so concurrent imports can't deadlock
+        for key in missing:
+            lock_address(key)
+        for key, location_id in existing.filter(address_key__in=missing).values_list('address_key', 'pk'):
+            ids.setdefault(key, location_id)
+
+        fields = {address: location for (_, address), location in wanted.items()}
+        new = []
+        for key in missing:
+            if key in ids:
+                continue
+            location = Location(
+                city=fields[key].get('city'),
+                country=fields[key].get('country'),
+                street=fields[key].get('street') or '')
+            # bulk_create skips save()
+            location.set_address_key()
+            new.append(location)
+
+        for location, location_id in zip(new, bulk_create_ids(Location, new)):
+            ids[location.address_key] = location_id
+            if self.geocode:
+                jobs.enqueue('geocode_location', key='geocode-location-{}'.format(location_id), location_id=location_id)
+        self.counts['locations'] += len(new)
+        return ids
+
+    def link_tags(self, records, event_ids):
+        texts = {text.lower(): text for record in records for text in record.get('tags') or []}
+        if not texts:
+            return
+
+        tags = {}
+        existing = Tag.objects.annotate(lower_text=Lower('text')).filter(lower_text__in=list(texts))
+        for tag_id, lower_text in existing.order_by('pk').values_list('pk', 'lower_text'):
+            tags.setdefault(lower_text, tag_id)
+
+        missing = [lower for lower in texts if lower not in tags]
+        for lower, tag_id in zip(missing, bulk_create_ids(Tag, [Tag(text=texts[lower]) for lower in missing])):
+            tags[lower] = tag_id
+        self.counts['tags'] += len(missing)
+
+        Link = Tag.events.through
+        links = []
+        for record, event_id in zip(records, event_ids):
+            for tag_id in {tags[text.lower()] for text in record.get('tags') or []}:
+                links.append(Link(event_id=event_id, tag_id=tag_id))
+        Link.objects.bulk_create(links, batch_size=self.batch_size)
+
+
+def location_key(fields):
+    return (
+        fields.get('google_id') or None,
+        address_key(fields.get('city'), fields.get('country'), fields.get('street')),
+    )
@@ -1,4 +1,9 @@
-from .models import Tag, Location
+from .models import Tag, Location, Watermark, address_key
+from . import jobs
+from django.db import connections, router, transaction
+from django.utils.dateparse import parse_datetime
+import base64
+import hashlib
 import requests
 import string
 import random
@@ -13,6 +18,49 @@ def queryset_skip_next(qs, first=None, skip=None):
     return qs
 
 
+def bulk_create_ids(model, objects, batch_size=500):
+    """
+    Insert objects in batches and return their ids in insertion order. Call
+    inside a transaction. Postgres returns the ids of bulk inserts, SQLite
+    doesn't, there the write lock is taken first so no other insert can
+    come between the last existing row and the new ones.
+    """
+    if not objects:
+        return []
+    db = router.db_for_write(model)
+    if connections[db].features.can_return_ids_from_bulk_insert:
+        for start in range(0, len(objects), batch_size):
+            model.objects.using(db).bulk_create(objects[start:start + batch_size])
+        return [obj.pk for obj in objects]
+
+    # A write takes SQLite's lock for the rest of the transaction
+    Watermark.increment('lock:bulk-create')
+    last = model.objects.using(db).order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, len(objects), batch_size):
+        model.objects.using(db).bulk_create(objects[start:start + batch_size])
+    return list(model.objects.using(db).filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+
+
+def encode_cursor(created_time, id):
+    value = '{}|{}'.format(created_time.isoformat(), id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Turn a cursor from encode_cursor back into (created_time, id), None when
+    it is not a valid cursor
+    """
+    try:
+        created_time, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_time = parse_datetime(created_time)
+        if created_time is None:
+            return None
+        return created_time, int(id)
+    except (ValueError, UnicodeError):
+        return None
+
+
 def permission_self_or_superuser(parent_user, field, user, rejection_value=None):
     if user.is_superuser:
         return field
@@ -28,7 +76,6 @@ def set_tags(parent, tags):
         if t.id:
             tag = Tag.objects.get(pk=t.id)
             all_tags.append(tag)
-            print(all_tags)
             continue
         tag = Tag.objects.filter(text__iexact=t.text).first()
         if not tag:
@@ -49,33 +96,46 @@ def set_tags(parent, tags):
         parent.tags.remove(tag)
 
 
-def add_or_update_location(location_data):
-    location = Location()
-
-    (lat, lng, g_id, formatted_address) = get_google_geo_info(
-        country=location_data.country,
-        city=location_data.city,
-        street=location_data.street
-    )
-
-    if not g_id:
-        return None
-
-    location = Location.objects.filter(
-        google_id=g_id).first()
+def lock_address(key):
+    """
+    Lock an address key until the transaction ends, new locations are only
+    created under it
+    """
+    Watermark.increment('lock:address:{}'.format(hashlib.sha1(key.encode()).hexdigest()))
 
-    if not location:
-        location = Location()
 
-    location.city=location_data.city
-    location.country=location_data.country
-    location.street=location_data.street
-
-    location.latitude=lat
-    location.longitude=lng
-    location.google_id = g_id
-    location.google_formatted_address = formatted_address
-    location.save()
+def add_or_update_location(location_data):
+    """
+    Find or create the location of an address without waiting for the
+    geocoder. New locations get their coordinates from the geocode_location
+    job and show up in distance queries once it ran. A place id from the
+    client only finds a location the geocoder gave that id, it is never
+    stored.
+    """
+    google_id = getattr(location_data, 'google_id', None)
+    if google_id:
+        location = Location.objects.filter(google_id=google_id, latitude__isnull=False).first()
+        if location:
+            return location
+
+    street = location_data.street or ''
+    key = address_key(location_data.city, location_data.country, street)
+    location = Location.objects.filter(address_key=key).first()
+    if location:
+        return location
+
+    with transaction.atomic():
+        # The second of two concurrent requests for the same address finds
+        # the location of the first
+        lock_address(key)
+        location = Location.objects.filter(address_key=key).first()
+        if location:
+            return location
+        location = Location.objects.create(city=location_data.city, country=location_data.country, street=street)
+        jobs.enqueue(
+            'geocode_location',
+            key='geocode-location-{}'.format(location.pk),
+            location_id=location.pk)
     return location
 
 def get_google_geo_info(country, city, street):
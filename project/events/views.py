@@ -1,3 +1,77 @@
-from django.shortcuts import render
+import json
+import threading
+import time
 
-# Create your views here.
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from .models import Event
+from . import pubsub
+
+
+def format_message(message):
+    data = json.dumps(message.data, cls=DjangoJSONEncoder)
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(message.id, message.kind, data)
+
+
+# Open streams of this process, each holds a worker thread
+_streams = threading.BoundedSemaphore(settings.PUBSUB_MAX_STREAMS)
+
+
+class EventStream:
+    """
+    The body of an event stream. The response closes it, started or not,
+    which gives back its subscription and its place among the streams.
+    """
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.closed = False
+
+    def __iter__(self):
+        yield 'retry: {}\n\n'.format(settings.PUBSUB_RETRY_MS)
+        deadline = time.monotonic() + settings.PUBSUB_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            message = self.subscription.get(timeout=settings.PUBSUB_KEEPALIVE_SECONDS)
+            if message is None:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+            else:
+                yield format_message(message)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.subscription.close()
+            _streams.release()
+
+
+def event_stream(request, id):
+    """
+    Server-sent events with the posts, participant and detail changes of an
+    event. Streams end after PUBSUB_STREAM_SECONDS, EventSource reconnects
+    with Last-Event-ID and receives what it missed.
+    """
+    get_object_or_404(Event, pk=id)
+
+    try:
+        last_id = int(request.META['HTTP_LAST_EVENT_ID'])
+    except (KeyError, ValueError):
+        last_id = None
+
+    if not _streams.acquire(blocking=False):
+        response = HttpResponse('Too many open streams, try again later.', status=503)
+        response['Retry-After'] = str(settings.PUBSUB_RETRY_MS // 1000)
+        return response
+    try:
+        subscription = pubsub.broker().subscribe(pubsub.event_topic(id), last_id=last_id)
+    except Exception:
+        _streams.release()
+        raise
+
+    response = StreamingHttpResponse(EventStream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
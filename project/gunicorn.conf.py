@@ -0,0 +1,47 @@
+"""
+Production server, run from this directory with
+
+    gunicorn -c gunicorn.conf.py project.wsgi
+
+The application is loaded and warmed up in the master before forking,
+see project/warmup.py.
+"""
+import multiprocessing
+import os
+import random
+
+
+bind = '0.0.0.0:{}'.format(os.getenv('PORT', '8000'))
+
+workers = int(os.getenv('GATHER_WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# The in process broker only reaches the event streams of its own process
+if os.getenv('GATHER_PUBSUB_BROKER', 'events.pubsub.DatabaseBroker') == 'events.pubsub.InProcessBroker':
+    workers = 1
+# An open event stream holds a thread for up to PUBSUB_STREAM_SECONDS. A
+# worker serves at most PUBSUB_MAX_STREAMS streams and answers the others
+# with a 503, so the server as a whole holds workers * PUBSUB_MAX_STREAMS
+# streams. Raise GATHER_PUBSUB_MAX_STREAMS and GATHER_WEB_THREADS together
+# for more viewers.
+worker_class = 'gthread'
+threads = int(os.getenv('GATHER_WEB_THREADS', 8))
+
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+accesslog = '-'
+
+
+def when_ready(server):
+    # Runs in the master once the application is loaded, before any fork
+    from project.warmup import warm_up
+    timings = warm_up()
+    server.log.info('Warmed up in %.0f ms (%s)', sum(timings.values()), ', '.join(
+        '{} {:.0f} ms'.format(name, ms) for name, ms in timings.items()))
+
+
+def post_fork(server, worker):
+    # Job retries use random jitter, don't let every worker draw the same
+    random.seed()
+    # Soft deletes elsewhere reach this worker's object caches at once
+    from events.cache import listen_for_invalidations
+    listen_for_invalidations()
@@ -0,0 +1,209 @@
+"""
+Admission control for the expensive GraphQL operations. An operation whose
+root fields fall in one of the classes of GRAPHQL_OPERATION_LIMITS counts
+against the user's rate for the class, 429 when it is over, then waits for
+one of the class's slots in this process. An operation still
+waiting GRAPHQL_ADMISSION_QUEUE_SECONDS after it reached the server is shed
+with a 503, so a spike of heavy operations can't take every worker thread
+and the cheap ones keep their latency.
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from graphene_django.views import HttpError
+from graphql.language import ast
+from graphql.utils.get_operation_ast import get_operation_ast
+
+
+logger = logging.getLogger(__name__)
+
+# Root field, class and, when only some calls are expensive, the test of
+# the arguments
+EXPENSIVE_FIELDS = [
+    ('events', 'nearby', lambda arguments: arguments.get('filterType') == 'NEARBY'),
+    ('discoverEvents', 'nearby', None),
+    ('profiles', 'search', lambda arguments: bool(arguments.get('search'))),
+    ('profilePicture', 'upload', None),
+]
+
+
+class Rejected(HttpError):
+
+    def __init__(self, status, message, retry_after):
+        response = HttpResponse(status=status)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        super().__init__(response, message)
+
+
+def argument_values(field, variables):
+    values = {}
+    for argument in field.arguments:
+        value = argument.value
+        if isinstance(value, ast.Variable):
+            values[argument.name.value] = (variables or {}).get(value.name.value)
+        elif hasattr(value, 'value'):
+            values[argument.name.value] = value.value
+    return values
+
+
+def root_fields(selection_set, fragments):
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from root_fields(selection.selection_set, fragments)
+        elif isinstance(selection, ast.FragmentSpread) and selection.name.value in fragments:
+            yield from root_fields(fragments.pop(selection.name.value).selection_set, fragments)
+
+
+def classify(document_ast, operation_name=None, variables=None):
+    """
+    The sorted classes of the expensive root fields of the operation
+    """
+    operation_ast = get_operation_ast(document_ast, operation_name)
+    if operation_ast is None:
+        return []
+    fragments = {
+        definition.name.value: definition for definition in document_ast.definitions
+        if isinstance(definition, ast.FragmentDefinition)
+    }
+    classes = set()
+    for field in root_fields(operation_ast.selection_set, fragments):
+        for name, operation_class, test in EXPENSIVE_FIELDS:
+            if field.name.value == name and (test is None or test(argument_values(field, variables))):
+                classes.add(operation_class)
+    return sorted(classes)
+
+
+class OperationLimit:
+    """
+    The slots and rate limit of one class of operations. Slots are per
+    process. A client may start burst operations per window of burst / rate
+    seconds, counted in the cache with add and incr, which are atomic, so
+    the processes share the limit when CACHE_URL points to a shared cache.
+    """
+
+    def __init__(self, name, concurrency, rate, burst):
+        self.name = name
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.rate = rate
+        self.burst = burst
+
+    def take_token(self, client):
+        """
+        Count an operation of the client, returns the key to give the token
+        back with
+        """
+        window = self.burst / self.rate
+        now = time.time()
+        start = now - now % window
+        key = 'admission:{}:{}:{}'.format(self.name, client, int(start // window))
+        cache.add(key, 0, math.ceil(window) + 1)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Expired since the add
+            cache.add(key, 1, math.ceil(window) + 1)
+            count = 1
+        if count > self.burst:
+            raise Rejected(429, 'Too many {} operations, try again later.'.format(self.name),
+                           start + window - now)
+        return key
+
+    def return_token(self, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+    def acquire(self, deadline):
+        if not self.slots.acquire(timeout=max(0, deadline - time.time())):
+            logger.warning('Shed a %s operation', self.name)
+            raise Rejected(503, 'The server is busy, try again later.', settings.GRAPHQL_ADMISSION_QUEUE_SECONDS)
+
+    def release(self):
+        self.slots.release()
+
+
+_limits = {}
+_limits_lock = threading.Lock()
+
+
+def get_limit(name):
+    with _limits_lock:
+        if name not in _limits:
+            _limits[name] = OperationLimit(name, **settings.GRAPHQL_OPERATION_LIMITS[name])
+        return _limits[name]
+
+
+def reset():
+    with _limits_lock:
+        _limits.clear()
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user-{}'.format(user.pk)
+    return 'ip-{}'.format(request.META.get('REMOTE_ADDR'))
+
+
+def arrival_time(request):
+    """
+    When the request reached the server, from the X-Request-Start header of
+    the proxy in front (seconds or milliseconds, with an optional t=), or
+    else now
+    """
+    now = time.time()
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    try:
+        start = float(header.replace('t=', '', 1))
+    except ValueError:
+        return now
+    if start > now * 100:
+        start /= 1000
+    return min(start, now)
+
+
+@contextmanager
+def admit(request, classes):
+    """
+    Hold a slot of each class for the duration, raises Rejected when the
+    user is over their rate or no slot frees up in time
+    """
+    client = client_key(request)
+    limits = [get_limit(name) for name in classes]
+    deadline = arrival_time(request) + settings.GRAPHQL_ADMISSION_QUEUE_SECONDS
+    if limits and time.time() >= deadline:
+        # Waited in the proxy already, shed without using up the client's rate
+        logger.warning('Shed a %s operation', limits[0].name)
+        raise Rejected(503, 'The server is busy, try again later.', settings.GRAPHQL_ADMISSION_QUEUE_SECONDS)
+
+    tokens = []
+    acquired = []
+    try:
+        for limit in limits:
+            tokens.append((limit, limit.take_token(client)))
+        # Always in the same order, so two operations can't wait on each other
+        for limit in limits:
+            limit.acquire(deadline)
+            acquired.append(limit)
+    except Rejected:
+        # Shed or over the rate of another class, the operation didn't run
+        for limit, key in tokens:
+            limit.return_token(key)
+        for limit in reversed(acquired):
+            limit.release()
+        raise
+
+    try:
+        yield
+    finally:
+        for limit in reversed(acquired):
+            limit.release()
@@ -0,0 +1,26 @@
+"""
+Parsed and validated GraphQL documents by query text. Clients send the
+same few queries over and over, parsing and validating them is a fixed
+cost the cache saves on every request. Filled before forking by
+project/warmup.py so the workers share it.
+"""
+from django.conf import settings
+from graphql import parse, validate, Source
+
+from events.cache import TTLCache
+
+
+documents = TTLCache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE, ttl=float('inf'))
+
+
+def get_document(schema, query):
+    """
+    (document, validation errors) of a query, raises the syntax error of
+    a query that doesn't parse
+    """
+    cached = documents.get(query)
+    if cached is None:
+        document = parse(Source(query, name='GraphQL request'))
+        cached = (document, validate(schema, document))
+        documents.set(query, cached)
+    return cached
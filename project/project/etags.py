@@ -0,0 +1,138 @@
+"""
+Version tokens for conditional GET of GraphQL queries. The token of a query
+is computed from MAX(timestamp) and the deletion counter of every model it
+reads, one indexed query for all of them, so an insert, update or delete
+anywhere in those tables changes it and nothing else does.
+"""
+import hashlib
+import json
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, router
+from graphql.language.visitor import TypeInfoVisitor, Visitor, visit
+from graphql.type import get_named_type
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql.utils.type_info import TypeInfo
+
+from events.models import VERSIONED_MODELS, Watermark, deletions_key
+from . import documents, routers
+
+
+# Models a root field filters or orders on besides the types it returns
+FIELD_DEPENDENCIES = {
+    'events': ('events.Participant',),
+    'tags': ('events.Event',),
+    'myLocations': ('events.Event',),
+}
+
+# Root fields reading tables without a timestamp or process state
+UNCACHEABLE_FIELDS = {'recommendedEvents', 'rsvpTrend', 'cacheStats'}
+
+
+class ModelCollector(Visitor):
+
+    def __init__(self, type_info, query_type):
+        self.type_info = type_info
+        self.query_type = query_type
+        self.models = set()
+        self.cacheable = True
+
+    def enter_Field(self, node, *args):
+        name = node.name.value
+        if self.type_info.get_parent_type() is self.query_type:
+            if name in UNCACHEABLE_FIELDS:
+                self.cacheable = False
+            self.models.update(apps.get_model(label) for label in FIELD_DEPENDENCIES.get(name, ()))
+
+        graphene_type = getattr(get_named_type(self.type_info.get_type()), 'graphene_type', None)
+        model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+        if model is not None:
+            self.models.add(model)
+
+
+def operation_models(schema, document, operation_name=None):
+    """
+    The models whose rows a query operation returns or depends on, None
+    when it can't be versioned
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != 'query':
+        return None
+
+    type_info = TypeInfo(schema)
+    collector = ModelCollector(type_info, schema.get_query_type())
+    visit(document, TypeInfoVisitor(type_info, collector))
+    if not collector.cacheable:
+        return None
+    # Only these have a timestamp and count their deletes
+    if not all(model._meta.label in VERSIONED_MODELS for model in collector.models):
+        return None
+    return collector.models
+
+
+def versions(models):
+    """
+    (label, max timestamp, deletions) of every model, in one query per
+    database. COUNT(*) would catch deletes too but scans the whole table.
+    """
+    by_db = {}
+    for model in sorted(models, key=lambda model: model._meta.label):
+        by_db.setdefault(router.db_for_read(model), []).append(model)
+
+    rows = []
+    for db, db_models in sorted(by_db.items()):
+        connection = connections[db]
+        quote = connection.ops.quote_name
+        deletions = '(SELECT {} FROM {} WHERE {} = %s)'.format(
+            quote('value'), quote(Watermark._meta.db_table), quote('name'))
+        sql = ' UNION ALL '.join(
+            'SELECT %s, MAX({}), {} FROM {}'.format(quote('timestamp'), deletions, quote(model._meta.db_table))
+            for model in db_models)
+        params = []
+        for model in db_models:
+            params.extend([model._meta.label, deletions_key(model)])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows.extend(cursor.fetchall())
+    return rows
+
+
+def query_etag(schema, request):
+    """
+    ETag of the result of a GET query, None when the query can't be
+    versioned. Covers the user, since results can depend on them, and a
+    time window so results computed against the current time, like upcoming
+    events, are recomputed every GRAPHQL_ETAG_WINDOW_SECONDS.
+    """
+    query = request.GET.get('query')
+    if not query:
+        return None
+    try:
+        document, errors = documents.get_document(schema, query)
+    except Exception:
+        return None
+    if errors:
+        return None
+
+    operation_name = request.GET.get('operationName') or None
+    models = operation_models(schema, document, operation_name)
+    if models is None:
+        return None
+
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    with routers.operation('query', user) as replica:
+        rows = versions(models)
+    # The result has to be as new as the versions: it is read from the same
+    # database and not from the object caches, which can be older
+    request._replica = replica
+    request._bypass_object_cache = True
+
+    window = int(time.time() // settings.GRAPHQL_ETAG_WINDOW_SECONDS)
+    key = json.dumps([
+        query, request.GET.get('variables'), operation_name, user_id, window,
+        [[label, str(latest), deleted] for label, latest, deleted in rows],
+    ])
+    return '"{}"'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
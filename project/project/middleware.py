@@ -0,0 +1,62 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepts(request, encoding):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip().lower() == encoding:
+            # An explicit q=0 refuses the encoding
+            return not re.match(r'\s*q\s*=\s*0(\.0*)?\s*$', params)
+    return False
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses responses of at least COMPRESSION_MIN_BYTES with brotli when
+    the client accepts it and the module is installed, otherwise with gzip.
+    Streaming responses are left alone so server sent events aren't buffered.
+    """
+
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+
+        if brotli is not None and accepts(request, 'br'):
+            encoding = 'br'
+        elif accepts(request, 'gzip'):
+            encoding = 'gzip'
+        else:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body isn't byte for byte the same as the original
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
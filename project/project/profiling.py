@@ -0,0 +1,153 @@
+"""
+On demand profiling of GraphQL requests. A profiled request is sampled by
+a background thread, which records the stack of the request thread every
+GRAPHQL_PROFILE_INTERVAL_SECONDS, and its resolvers are timed by a graphene
+middleware. Both are written to GRAPHQL_PROFILE_DIR:
+
+    <name>.collapsed  one "frame;frame;frame count" line per stack, the
+                      input of flamegraph.pl and speedscope
+    <name>.json       the operations, so profile_operation can replay
+                      them, and the resolver timings by path
+
+Staff users profile a request with the X-Gather-Profile header, the name
+comes back in the same header, and GRAPHQL_PROFILE_SAMPLE_RATE of all
+requests are profiled anyway, except mutations. Variables carry passwords
+and tokens, profiles only keep their names and types.
+"""
+import collections
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.utils import timezone
+from promise import is_thenable
+
+
+HEADER = 'HTTP_X_GATHER_PROFILE'
+
+
+def start(request):
+    """
+    The started profile of the request, None when it isn't profiled
+    """
+    if request.META.get(HEADER):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return Profile().start()
+        return None
+    if random.random() < settings.GRAPHQL_PROFILE_SAMPLE_RATE:
+        return Profile(sampled=True).start()
+    return None
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append('{}.{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profile:
+    """
+    Samples the stacks of the thread that starts it until stopped. Also a
+    graphene middleware, which adds up the time spent in every resolver by
+    path, the items of lists adding up.
+    """
+
+    def __init__(self, interval=None, sampled=False):
+        self.interval = interval or settings.GRAPHQL_PROFILE_INTERVAL_SECONDS
+        # Not asked for by the user, see start()
+        self.sampled = sampled
+        self.thread_id = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.resolvers = collections.defaultdict(lambda: {'count': 0, 'ms': 0.0})
+        self.operations = []
+        self.elapsed_ms = 0.0
+        # Values returned by resolvers, by id, with their path. Resolvers
+        # don't get the path of their field in this graphql-core, it is the
+        # path of the value they're called on and their field name. The
+        # values are kept so their ids can't be reused.
+        self.paths = {}
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self.sample, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        self.elapsed_ms = (time.perf_counter() - self._start) * 1000
+        return self
+
+    def sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def resolve(self, next, root, info, **args):
+        parent = self.paths.get(id(root))
+        path = info.field_name if parent is None else '{}.{}'.format(parent[0], info.field_name)
+        start = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+            if is_thenable(result):
+                return result.then(lambda value: self.remember(path, value))
+            return self.remember(path, result)
+        finally:
+            timing = self.resolvers[path]
+            timing['count'] += 1
+            timing['ms'] += (time.perf_counter() - start) * 1000
+
+    def remember(self, path, value):
+        if value is None:
+            return value
+        # Evaluates querysets, which the executor then iterates from their
+        # result cache, so their queries count for the field returning them
+        items = value if isinstance(value, (list, tuple, QuerySet)) else [value]
+        for item in items:
+            self.paths[id(item)] = (path, item)
+        return value
+
+    def add_operation(self, query, variables, operation_name):
+        self.operations.append({
+            'query': query,
+            'variable_types': {name: type(value).__name__ for name, value in (variables or {}).items()},
+            'operationName': operation_name,
+        })
+
+    def report(self):
+        return {
+            'operations': self.operations,
+            'elapsed_ms': self.elapsed_ms,
+            'interval': self.interval,
+            'samples': sum(self.stacks.values()),
+            'resolvers': collections.OrderedDict(sorted(self.resolvers.items())),
+        }
+
+    def save(self, directory=None):
+        """
+        Write the profile, returns its name
+        """
+        directory = directory or settings.GRAPHQL_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        operation_name = next((op['operationName'] for op in self.operations if op['operationName']), 'operation')
+        name = '{}-{}-{}'.format(timezone.now().strftime('%Y%m%d-%H%M%S'), operation_name, uuid.uuid4().hex[:6])
+
+        with open(os.path.join(directory, name + '.collapsed'), 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+        with open(os.path.join(directory, name + '.json'), 'w') as f:
+            json.dump(self.report(), f, indent=2, cls=DjangoJSONEncoder)
+        return name
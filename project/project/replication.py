@@ -0,0 +1,53 @@
+import sqlite3
+
+
+def schema_objects(connection, schema):
+    return {
+        name: (kind, sql)
+        for kind, name, sql in connection.execute(
+            "SELECT type, name, sql FROM {}.sqlite_master "
+            "WHERE type IN ('table', 'index') AND sql IS NOT NULL "
+            "AND name NOT LIKE 'sqlite_%'".format(schema))
+    }
+
+
+def qualify(sql, kind):
+    # CREATE TABLE "x" -> CREATE TABLE replica."x", same for indexes
+    keyword = 'CREATE TABLE ' if kind == 'table' else 'INDEX '
+    return sql.replace(keyword, keyword + 'replica.', 1)
+
+
+def replicate_sqlite(primary, replica):
+    """
+    Copy every table of the primary SQLite file into the replica file in a
+    single transaction. It stands in for real replication when running
+    with SQLite replicas locally: replica readers keep seeing the previous
+    snapshot until the copy commits, and connections that stay open pick up
+    the new data because the replica file is updated in place.
+    """
+    connection = sqlite3.connect(primary, timeout=30, isolation_level=None)
+    try:
+        connection.execute('ATTACH DATABASE ? AS replica', (replica,))
+        connection.execute('BEGIN IMMEDIATE')
+
+        source = schema_objects(connection, 'main')
+        target = schema_objects(connection, 'replica')
+
+        if source != target:
+            # Schema changed (or first run), rebuild it from the primary
+            for name, (kind, sql) in target.items():
+                if kind == 'table':
+                    connection.execute('DROP TABLE IF EXISTS replica."{}"'.format(name))
+            for kind in ('table', 'index'):
+                for name, (object_kind, sql) in source.items():
+                    if object_kind == kind:
+                        connection.execute(qualify(sql, kind))
+
+        for name, (kind, sql) in source.items():
+            if kind == 'table':
+                connection.execute('DELETE FROM replica."{}"'.format(name))
+                connection.execute('INSERT INTO replica."{0}" SELECT * FROM main."{0}"'.format(name))
+
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
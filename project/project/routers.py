@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+_local = threading.local()
+
+# Moved to the archive database by events/archive.py
+ARCHIVED_MODELS = {
+    'events.event', 'events.participant', 'events.post', 'events.participantsnapshot',
+    'events.tag', 'events.tag_events',
+}
+
+
+def pin_key(user):
+    return 'replica-pin:{}'.format(user.pk)
+
+
+def is_pinned(user):
+    """
+    True while the user has written recently and has to read their own writes
+    """
+    if user is None or not user.is_authenticated:
+        return False
+    return (cache.get(pin_key(user)) or 0) > time.time()
+
+
+def pin(user):
+    if user is None or not user.is_authenticated:
+        return
+    cache.set(pin_key(user), time.time() + settings.REPLICA_PIN_SECONDS, settings.REPLICA_PIN_SECONDS)
+
+
+@contextmanager
+def operation(kind, user=None, replica=None):
+    """
+    Route the reads of one GraphQL operation. Queries read from a replica
+    unless the user ran a mutation in the last REPLICA_PIN_SECONDS, anything
+    else, and everything outside an operation, stays on the primary. All
+    the reads of an operation go to one replica, `replica` when given, the
+    one the context manager returns.
+    """
+    if kind == 'mutation':
+        pin(user)
+
+    previous = getattr(_local, 'replica', None)
+    if kind == 'query' and settings.DATABASE_REPLICAS and not is_pinned(user):
+        _local.replica = replica or random.choice(settings.DATABASE_REPLICAS)
+    else:
+        _local.replica = None
+    try:
+        yield _local.replica
+    finally:
+        _local.replica = previous
+        if kind == 'mutation':
+            # The window starts when the writes are visible
+            pin(user)
+
+
+def current_replica():
+    """
+    The replica of the current operation, None when reading from the primary
+    """
+    # Reads inside a transaction must see its writes
+    if connections['default'].in_atomic_block:
+        return None
+    return getattr(_local, 'replica', None)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to DATABASE_REPLICAS during query operations and every
+    write to the primary. Relations of archived instances are read from
+    the archive, unless they point to a model that isn't archived.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            archived = instance._state.db == settings.ARCHIVE_DATABASE
+            if not archived or model._meta.label_lower in ARCHIVED_MODELS:
+                # Follow relations on the database the instance came from
+                return instance._state.db
+
+        return current_replica() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replicated = {'default', settings.ARCHIVE_DATABASE} | set(settings.DATABASE_REPLICAS)
+        if obj1._state.db in replicated and obj2._state.db in replicated:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            # Replicas receive the schema from the primary
+            return False
+        return None
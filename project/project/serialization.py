@@ -0,0 +1,71 @@
+"""
+JSON encoding of GraphQL responses. orjson and ujson are used when
+installed, they encode the large events and profiles lists several times
+faster than the json module, which is the fallback.
+"""
+import json
+
+from django.conf import settings
+
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def encode_ujson(data):
+    import ujson
+    return ujson.dumps(data, escape_forward_slashes=False)
+
+
+def encode_orjson(data):
+    import orjson
+    return orjson.dumps(data).decode('utf-8')
+
+
+ENCODERS = {
+    'orjson': encode_orjson,
+    'ujson': encode_ujson,
+    'json': encode_json,
+}
+
+# Tried in this order by 'auto'
+PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def available():
+    """
+    Names of the encoders whose module can be imported
+    """
+    names = []
+    for name in PREFERENCE:
+        try:
+            ENCODERS[name]({})
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+_encoder = None
+
+
+def encoder():
+    global _encoder
+    if _encoder is None:
+        name = settings.JSON_ENCODER
+        if name == 'auto':
+            name = available()[0]
+        _encoder = ENCODERS[name]
+    return _encoder
+
+
+def dumps(data):
+    """
+    Compact JSON text of a response
+    """
+    return encoder()(data)
+
+
+def reset():
+    global _encoder
+    _encoder = None
@@ -16,10 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
-from graphene_file_upload import ModifiedGraphQLView
+from events.views import event_stream
+from project.views import GatherGraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(ModifiedGraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(GatherGraphQLView.as_view(graphiql=True))),
+    path('events/<int:id>/stream/', event_stream),
 ]
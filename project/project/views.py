@@ -0,0 +1,156 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from graphene_django.views import HttpError
+from graphene_file_upload import ModifiedGraphQLView
+from graphql.execution import ExecutionResult
+from graphql.utils.get_operation_ast import get_operation_ast
+
+from . import admission, documents, etags, profiling, routers, serialization
+
+
+class GatherGraphQLView(ModifiedGraphQLView):
+    """
+    Also accepts a JSON array of operations in one POST. They run in order
+    with the same request as context, so authentication happens once and the
+    per request caches are shared, the response is an array of results.
+
+    GET queries get an ETag, a matching If-None-Match is answered with 304
+    without running the resolvers.
+
+    Expensive operations go through the admission control of
+    project/admission.py, a rejected one fails the whole request.
+
+    Requests can be profiled, see project/profiling.py.
+    """
+    profile = None
+
+    def dispatch(self, request, *args, **kwargs):
+        self.profile = profiling.start(request)
+
+        try:
+            etag = None
+            if request.method == 'GET' and not self.request_wants_html(request):
+                etag = etags.query_etag(self.schema, request)
+
+            if etag and etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+            else:
+                response = super().dispatch(request, *args, **kwargs)
+                if etag and response.status_code == 200:
+                    response['ETag'] = etag
+        finally:
+            if self.profile:
+                self.profile.stop()
+
+        if self.profile:
+            response['X-Gather-Profile'] = self.profile.save()
+        if request.method == 'GET':
+            # Results depend on the user of the token
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def parse_body(self, request):
+        if self.get_content_type(request) != 'application/json':
+            return super().parse_body(request)
+
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except (TypeError, ValueError):
+            raise HttpError(HttpResponseBadRequest('POST body sent invalid JSON.'))
+
+        if isinstance(data, list):
+            if not data:
+                raise HttpError(HttpResponseBadRequest('Received an empty list in the batch request.'))
+            if len(data) > settings.GRAPHQL_MAX_BATCH_SIZE:
+                raise HttpError(HttpResponseBadRequest(
+                    'Batches are limited to {} operations.'.format(settings.GRAPHQL_MAX_BATCH_SIZE)))
+            if not all(isinstance(entry, dict) for entry in data):
+                raise HttpError(HttpResponseBadRequest('The received data is not a valid JSON query.'))
+            # The view is instantiated for every request
+            self.batch = True
+        elif not isinstance(data, dict):
+            raise HttpError(HttpResponseBadRequest('The received data is not a valid JSON query.'))
+        return data
+
+    def json_encode(self, request, d, pretty=False):
+        if self.pretty or pretty or request.GET.get('pretty'):
+            return super().json_encode(request, d, pretty=True)
+        return serialization.dumps(d)
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if self.profile:
+            middleware = list(middleware or []) + [self.profile]
+        return middleware
+
+    def can_display_graphiql(self, request, data):
+        return not self.batch and super().can_display_graphiql(request, data)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # Same as GraphQLView's, with parsing and validation cached
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+        if self.profile:
+            self.profile.add_operation(query, variables, operation_name)
+
+        try:
+            document_ast, validation_errors = documents.get_document(self.schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        if validation_errors:
+            return ExecutionResult(errors=validation_errors, invalid=True)
+
+        if self.profile and self.profile.sampled:
+            operation_ast = get_operation_ast(document_ast, operation_name)
+            if operation_ast is None or operation_ast.operation != 'query':
+                # Mutations carry credentials in the query too
+                self.profile.stop()
+                self.profile = None
+
+        if request.method.lower() == 'get':
+            operation_ast = get_operation_ast(document_ast, operation_name)
+            if operation_ast and operation_ast.operation != 'query':
+                if show_graphiql:
+                    return None
+                raise HttpError(HttpResponseNotAllowed(
+                    ['POST'], 'Can only perform a {} operation from a POST request.'.format(operation_ast.operation)))
+
+        classes = admission.classify(document_ast, operation_name, variables)
+        try:
+            with admission.admit(request, classes):
+                return self.execute(
+                    document_ast,
+                    root_value=self.get_root_value(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    context_value=self.get_context(request),
+                    middleware=self.get_middleware(request),
+                    executor=self.executor,
+                )
+        except admission.Rejected:
+            raise
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+    def execute(self, document_ast, *args, **kwargs):
+        operation_ast = get_operation_ast(document_ast, kwargs.get('operation_name'))
+        kind = operation_ast.operation if operation_ast else None
+        context = kwargs.get('context_value')
+        user = getattr(context, 'user', None)
+
+        # The replica the ETag was computed on, see project/etags.py
+        with routers.operation(kind, user, replica=getattr(context, '_replica', None)):
+            return super().execute(document_ast, *args, **kwargs)
+
+
+def etag_matches(etag, if_none_match):
+    # Weak comparison, compression turns the ETag weak
+    tags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+    return etag in tags or '*' in tags
@@ -0,0 +1,68 @@
+"""
+Loads everything a worker needs before a preforking server forks, so the
+first request of every worker is as fast as the rest and the loaded pages
+stay shared between the workers. Called from gunicorn.conf.py.
+"""
+import collections
+import gc
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from graphql.utils.introspection_query import introspection_query
+
+
+@contextmanager
+def timed(timings, name):
+    start = time.perf_counter()
+    yield
+    timings[name] = (time.perf_counter() - start) * 1000
+
+
+def warm_queries():
+    from events.benchmark import OPERATIONS
+    return [introspection_query] + [operation['query'] for operation in OPERATIONS]
+
+
+def warm_up():
+    """
+    Import, build and cache what requests need, then release the database
+    connections and freeze the heap. Returns the milliseconds per step.
+    """
+    timings = collections.OrderedDict()
+
+    with timed(timings, 'imports'):
+        import boto3
+        import numpy
+        from PIL import Image
+        from events import jobs
+        from project.schema import schema
+        jobs.load_jobs()
+        get_resolver().url_patterns
+
+    with timed(timings, 'schema'):
+        schema.introspect()
+
+    with timed(timings, 'documents'):
+        from . import documents, serialization
+        for query in warm_queries():
+            documents.get_document(schema, query)
+        serialization.encoder()
+
+    if settings.GEO_ENGINE == 'memory':
+        with timed(timings, 'geo_index'):
+            from events import geoindex
+            geoindex.geo_index()
+
+    # Connections can't be shared with the children
+    connections.close_all()
+
+    with timed(timings, 'gc'):
+        gc.collect()
+        # Python 3.7+, keeps the collector from touching, and so copying,
+        # the pages of everything loaded so far
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+    return timings
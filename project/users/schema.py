@@ -3,17 +3,18 @@ from django.db import transaction
 from django.db.models import Q, Count
 from functools import reduce
 import boto3
-import io
 import graphene
 
-from PIL import Image
 from graphql import GraphQLError
 from graphene_file_upload import Upload
 from graphene_django import DjangoObjectType
-from events.models import Profile, Location, Friendship
+from events.models import Profile, Location, Friendship, StagedFile
 from events.enums import Gender, FriendStatus
+from events.cache import location_cache, profile_cache
+from events.deletion import soft_delete_account
+from events.jobs import enqueue
 from events.utilities import permission_self_or_superuser, add_or_update_location, id_generator, queryset_skip_next
-from project.settings import S3_ACCESS_KEY, S3_SECRET_ACCESS_KEY, S3_PROFILE_PICTURE_BUCKET
+from project.settings import S3_ACCESS_KEY, S3_SECRET_ACCESS_KEY
 
 
 session = boto3.Session(
@@ -37,6 +38,11 @@ class ProfileType(DjangoObjectType):
     class Meta:
         model = Profile
 
+    def resolve_location(self, info, **kwargs):
+        if Profile.location.is_cached(self):
+            return self.location
+        return location_cache.get(self.location_id, info.context)
+
 
 class ProfileInput(graphene.InputObjectType):
     id = graphene.ID()
@@ -138,14 +144,10 @@ class ProfilePicture(graphene.Mutation):
     profile = graphene.Field(ProfileType)
 
     def mutate(self, info, profile_id, file, crop, **kwargs):
-        profile = Profile.objects.get(pk=profile_id)
+        profile = profile_cache.get(profile_id, info.context)
 
         uploaded_file = info.context.FILES.get(file)
 
-        box = (crop.x0, crop.y0, crop.x1, crop.y1)
-        image = Image.open(uploaded_file)
-        cropped_image = image.crop(box)
-
         extension = uploaded_file.name.split('.')[1]
         filename = "profile_picture_{}__{}.{}".format(
             profile_id,
@@ -153,26 +155,20 @@ class ProfilePicture(graphene.Mutation):
             extension
         )
 
-        in_mem_file = io.BytesIO()
-        cropped_image.save(in_mem_file, format=extension)
-        in_mem_file.seek(0)
-
-        s3.Bucket(S3_PROFILE_PICTURE_BUCKET).put_object(
-            Key=filename,
-            Body=in_mem_file,
-            ACL='public-read')
-
-        old_url = profile.profile_picture
-        if old_url:
-            old_filename = old_url[::-1].split('/')[0][::-1]
-            s3.Object(S3_PROFILE_PICTURE_BUCKET, old_filename).delete()
+        # Cropping, encoding and the upload to S3 run in the job queue, the
+        # picture changes once process_profile_picture ran. The upload waits
+        # in the database, which the web and worker hosts share.
+        with transaction.atomic():
+            staged = StagedFile.objects.create(data=uploaded_file.read())
+            enqueue(
+                'process_profile_picture',
+                key=filename,
+                profile_id=profile_id,
+                staged_file_id=staged.pk,
+                filename=filename,
+                extension=extension,
+                crop=[crop.x0, crop.y0, crop.x1, crop.y1])
 
-        profile.profile_picture = "https://s3-eu-west-1.amazonaws.com/{}/{}".format(
-            S3_PROFILE_PICTURE_BUCKET,
-            filename,
-        )
-
-        profile.save()
         return ProfilePicture(profile=profile)
 
 
@@ -244,6 +240,20 @@ class RemoveFriend(graphene.Mutation):
         return RemoveFriend(profile=profile)
 
 
+class DeleteAccount(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    def mutate(self, info):
+        user = info.context.user or None
+        if user.is_anonymous:
+            raise GraphQLError('User not logged in!')
+
+        # The user is disabled and hidden right away, the purge_account job
+        # deletes their events, participations and friendships in the background
+        soft_delete_account(user)
+        return DeleteAccount(ok=True)
+
+
 class Mutation(graphene.ObjectType):
     register = Register.Field()
     updateProfile = UpdateProfile.Field()
@@ -251,6 +261,7 @@ class Mutation(graphene.ObjectType):
     handleFriendRequest = HandleFriendRequest.Field()
     removeFriend = RemoveFriend.Field()
     profile_picture = ProfilePicture.Field()
+    delete_account = DeleteAccount.Field()
 
 
 class Query(graphene.ObjectType):
@@ -270,13 +281,13 @@ class Query(graphene.ObjectType):
     friendships = graphene.List(FriendshipType)
 
     def resolve_user(self, info, id):
-        return get_user_model().objects.get(pk=id)
+        return get_user_model().objects.get(pk=id, is_active=True)
 
     def resolve_users(self, info):
-        return get_user_model().objects.all()
+        return get_user_model().objects.filter(is_active=True)
 
     def resolve_profile(self, info, id):
-        return Profile.objects.filter(pk=id)
+        return profile_cache.get(id, info.context)
 
     # def resolve_profiles(self, info, search=None):
     #     return Profile.objects.all()
@@ -313,7 +324,8 @@ class Query(graphene.ObjectType):
         if user.is_anonymous:
             raise GraphQLError('User not logged in!')
 
-        friends = Friendship.objects.filter(profile__id__exact=user.profile.id)
+        friends = Friendship.objects.filter(profile__id__exact=user.profile.id)\
+            .exclude(profiles__deleted_time__isnull=False)
 
         return friends
 
@@ -323,4 +335,4 @@ class Query(graphene.ObjectType):
         if user.is_anonymous:
             raise GraphQLError('User not logged in!')
 
-        return Friendship.objects.all()
+        return Friendship.objects.exclude(profiles__deleted_time__isnull=False)
@@ -0,0 +1,58 @@
+import io
+
+from PIL import Image
+
+from events.jobs import job, enqueue
+from events.models import Profile, StagedFile
+from project.settings import S3_PROFILE_PICTURE_BUCKET
+
+
+def profile_picture_url(filename):
+    return "https://s3-eu-west-1.amazonaws.com/{}/{}".format(
+        S3_PROFILE_PICTURE_BUCKET,
+        filename,
+    )
+
+
+def delete_staged_picture(staged_file_id, **payload):
+    StagedFile.objects.filter(pk=staged_file_id).delete()
+
+
+@job(on_failure=delete_staged_picture)
+def process_profile_picture(profile_id, staged_file_id, filename, extension, crop):
+    from .schema import s3
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    url = profile_picture_url(filename)
+
+    if profile is not None and profile.profile_picture != url:
+        staged = StagedFile.objects.get(pk=staged_file_id).data
+        image = Image.open(io.BytesIO(bytes(staged)))
+        image = Image.open(io.BytesIO(staged))
+        cropped_image = image.crop(tuple(crop))
+
+        in_mem_file = io.BytesIO()
+        cropped_image.save(in_mem_file, format=extension)
+        in_mem_file.seek(0)
+
+        s3.Bucket(S3_PROFILE_PICTURE_BUCKET).put_object(
+            Key=filename,
+            Body=in_mem_file,
+            ACL='public-read')
+
+        old_url = profile.profile_picture
+        profile.profile_picture = url
+        profile.save(update_fields=['profile_picture', 'timestamp'])
+
+        if old_url:
+            old_filename = old_url[::-1].split('/')[0][::-1]
+            enqueue('delete_profile_picture', key='delete-profile-picture-{}'.format(old_filename), filename=old_filename)
+
+    delete_staged_picture(staged_file_id)
+
+
+@job()
+def delete_profile_picture(filename):
+    from .schema import s3
+
+    s3.Object(S3_PROFILE_PICTURE_BUCKET, filename).delete()